@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# имена снимков: journal-ГГГГММДД-ЧЧММСС.db -- по имени они упорядочены по времени
+SNAPSHOT_NAME = re.compile(r"^journal-\d{8}-\d{6}\.db$")
+
+
+# снимки журнала в каталоге directory: создание без остановки бота (Database.backup),
+# хранение последних keep снимков и проверка снимка восстановлением во временную базу
+class Backups:
+    def __init__(self, db, directory, keep=7, pages=256, pause=0.001):
+        # без хотя бы одного снимка нечего проверять и не из чего восстанавливать
+        if keep < 1:
+            raise ValueError(f"keep must be at least 1, got {keep}")
+        self.db = db
+        self.directory = directory
+        self.keep = keep
+        self.pages = pages
+        self.pause = pause
+        # одновременно делается один снимок
+        self._lock = asyncio.Lock()
+
+    def snapshots(self):
+        # имена снимков от старых к новым
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if SNAPSHOT_NAME.match(name))
+
+    async def snapshot(self):
+        # (имя, размер в байтах, секунды) нового снимка
+        async with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"journal-{datetime.now():%Y%m%d-%H%M%S}.db"
+            path = os.path.join(self.directory, name)
+            # недописанный снимок не должен выглядеть готовым
+            partial = path + ".part"
+            start = time.perf_counter()
+            try:
+                await self.db.backup(partial, self.pages, self.pause)
+                os.replace(partial, path)
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
+            elapsed = time.perf_counter() - start
+            self._rotate()
+        size = os.path.getsize(path)
+        logger.info("Snapshot %s: %d bytes in %.1f s", name, size, elapsed)
+        return name, size, elapsed
+
+    def _rotate(self):
+        for name in self.snapshots()[:-self.keep]:
+            os.remove(os.path.join(self.directory, name))
+
+    async def verify(self, name):
+        # восстанавливает снимок в базу в памяти и проверяет её:
+        # (результат integrity_check, версия схемы, групп, студентов, отметок)
+        if not SNAPSHOT_NAME.match(name) or name not in self.snapshots():
+            raise FileNotFoundError(name)
+        path = os.path.join(self.directory, name)
+        def _verify():
+            source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            scratch = sqlite3.connect(":memory:")
+            try:
+                source.backup(scratch)
+                integrity = scratch.execute("PRAGMA integrity_check").fetchone()[0]
+                version = scratch.execute("SELECT MAX(version) FROM schema_migrations").fetchone()[0]
+                counts = [scratch.execute(query).fetchone()[0] for query in (
+                    "SELECT COUNT(DISTINCT chat_id) FROM students",
+                    "SELECT COUNT(*) FROM students",
+                    "SELECT COUNT(*) FROM attendance")]
+                return (integrity, version, *counts)
+            finally:
+                source.close()
+                scratch.close()
+        return await asyncio.to_thread(_verify)
@@ -0,0 +1,104 @@
+# время ответа обработчиков во время снимка большой базы.
+#
+#   python benchmarks/bench_backup.py [--marks 2000000] [--dir .]
+#
+# староста в цикле ставит отметку (запись) и открывает /list_students (чтение, кэш страниц сброшен записью);
+# замеряется время каждого шага: без снимка, во время Backups.snapshot (по 256 страниц за шаг)
+# и во время копирования базы одним шагом в потоке базы, как было бы без пошагового копирования.
+# база -- файл в --dir
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+from stubs import create_test_app, message_update
+from statuses import Status
+
+
+async def fill(db, marks):
+    await db.add_students(1, [f"Студент{i:03d} Тестовый" for i in range(30)])
+    student_ids = [student_id for student_id, _, _ in await db.get_students(1)]
+    # остальные отметки -- другим группам, чтобы база была большой
+    groups = marks // (30 * 4 * 300) + 1
+    for chat_id in range(2, groups + 2):
+        await db.add_students(chat_id, [f"Студент{i:03d} Тестовый" for i in range(30)])
+
+    def _insert(c):
+        c.execute("SELECT id FROM students")
+        ids = [row[0] for row in c.fetchall()]
+        c.executemany("INSERT INTO attendance (student_id, date, lesson, status) VALUES (?, ?, ?, ?)",
+                      ((student_id, f"{2020 + day // 336}-{day // 28 % 12 + 1:02d}-{day % 28 + 1:02d}",
+                        lesson, 1 + (student_id + day) % 4)
+                       for student_id in ids for day in range(300) for lesson in range(1, 5)))
+    await db._write(_insert)
+    return student_ids
+
+
+async def load(app, student_ids, stop):
+    # (задержки записи, задержки чтения), секунды
+    writes, reads = [], []
+    n = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await app.db.mark(1, student_ids[n % len(student_ids)], "2026-09-01", 1, Status.ABSENT + n % 2)
+        writes.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        await app.dp.feed_update(app.bot, message_update("/list_students"))
+        reads.append(time.perf_counter() - start)
+        n += 1
+        await asyncio.sleep(0.002)
+    return writes, reads
+
+
+def percentiles(values):
+    values = sorted(values)
+    return [values[int(len(values) * q)] * 1000 for q in (0.5, 0.99)] + [values[-1] * 1000]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--marks", type=int, default=2_000_000)
+    parser.add_argument("--dir", default=None, help="каталог для временной базы (по умолчанию системный)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        app = create_test_app(tmp, backup_dir=os.path.join(tmp, "backups"))
+        await app.db.init()
+        student_ids = await fill(app.db, args.marks)
+        marks = await app.db._run(lambda c: c.execute("SELECT COUNT(*) FROM attendance").fetchone()[0])
+        size = os.path.getsize(os.path.join(tmp, "journal.db")) / 1024 / 1024
+        backups = app.dp["backups"]
+
+        async def one_step():
+            # вся копия -- одна задача в потоке базы: запросы ждут её окончания
+            target = os.path.join(tmp, "one-step.db")
+            def _copy(c):
+                dest = sqlite3.connect(target)
+                c.connection.backup(dest)
+                dest.close()
+            await app.db._run(_copy)
+
+        async def idle():
+            await asyncio.sleep(2)
+
+        print(f"{marks} marks, {size:.0f} MB")
+        print(f"{'during':<22}{'backup s':>9}{'write p50':>11}{'p99':>8}{'max':>8}{'read p50':>10}{'p99':>8}{'max':>8}")
+        for label, action in [("nothing", idle), ("Backups.snapshot", backups.snapshot), ("one-step copy", one_step)]:
+            stop = asyncio.Event()
+            task = asyncio.create_task(load(app, student_ids, stop))
+            await asyncio.sleep(0.2)
+            start = time.perf_counter()
+            await action()
+            elapsed = time.perf_counter() - start
+            stop.set()
+            writes, reads = await task
+            print(f"{label:<22}{elapsed:>9.2f}" + "".join(f"{value:>{width}.1f}" for value, width in
+                                                          zip(percentiles(writes) + percentiles(reads),
+                                                              (11, 8, 8, 10, 8, 8))))
+        await app.db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+# нагрузочный тест обработки апдейтов: пропускная способность в зависимости от числа активных чатов
+# и проверка порядка внутри чата.
+#
+#   python benchmarks/bench_concurrency.py [--chats 1,2,4,8,16,32,64,128] [--students 10] [--latency 0.02]
+#
+# каждый чат проводит перекличку по кнопкам (/mark, дата, пара, по ответу на студента), апдейты чатов
+# перемешаны и приходят через polling. ответ Bot API задерживается на --latency секунд.
+# режимы:
+#   sequential -- апдейты по одному (handle_as_tasks=False);
+#   unordered  -- по задаче на апдейт, как делает aiogram по умолчанию, без очереди чата;
+#   ordered    -- ChatOrderedDispatcher: параллельно между чатами, по очереди внутри чата.
+# errors -- исключения в обработчиках и ответы "выбери с кнопок" и т. п.: шаг переклички попал не в то состояние;
+# lost -- отметки, которых нет в базе после переклички (шаги одного чата прочитали одно и то же состояние)
+import argparse
+import asyncio
+import logging
+import time
+from functools import partial
+
+from aiogram import Dispatcher
+from aiogram.methods import SendMessage
+
+from stubs import create_test_app, message_update
+
+
+def is_error_reply(text):
+    return "кнопок" in text or text.startswith(("Неправильный", "Ошибка"))
+
+
+async def run(mode, chats, students, latency):
+    app = create_test_app()
+    session = app.bot.session
+    await app.db.init()
+    for chat_id in range(1, chats + 1):
+        for text in ["/add_student", "\n".join(f"Студент{i:03d} Тестовый" for i in range(students))]:
+            await app.dp.feed_update(app.bot, message_update(text, chat_id=chat_id, user_id=chat_id))
+    feed = partial(Dispatcher.feed_update, app.dp) if mode == "unordered" else app.dp.feed_update
+    handled = 0
+    failed = 0
+
+    async def counted_feed(*args, **kwargs):
+        nonlocal handled, failed
+        try:
+            return await feed(*args, **kwargs)
+        except Exception:
+            failed += 1
+            raise
+        finally:
+            handled += 1
+    app.dp.feed_update = counted_feed
+
+    # шаги переклички по чатам вперемешку, как они приходят от разных групп
+    steps = ["/mark", "Другая дата", "01.09", "1⃣"] + ["✅"] * students
+    updates = [message_update(text, chat_id=chat_id, user_id=chat_id)
+               for text in steps for chat_id in range(1, chats + 1)]
+
+    session.latency = latency
+    session.requests.clear()
+    polling = asyncio.create_task(app.dp.start_polling(app.bot, handle_signals=False, close_bot_session=False,
+                                                       handle_as_tasks=mode != "sequential"))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    for update in updates:
+        session.updates.put_nowait(update)
+    while handled < len(updates):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    replies = [request.text for request in session.requests if isinstance(request, SendMessage)]
+    errors = failed + sum(map(is_error_reply, replies))
+    marked = await app.db._run(lambda c: c.execute(
+        "SELECT COUNT(*) FROM attendance WHERE date = ? AND lesson = 1", (f"{time.localtime().tm_year}-09-01",)
+    ).fetchone()[0])
+    await app.dp.stop_polling()
+    await polling
+    return len(updates) / elapsed, errors, chats * students - marked
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", default="1,2,4,8,16,32,64,128")
+    parser.add_argument("--students", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+    # исключения обработчиков считаются в errors, их трассировки не нужны
+    logging.getLogger("aiogram.event").setLevel(logging.CRITICAL)
+
+    modes = ["sequential", "unordered", "ordered"]
+    print(f"Bot API latency {args.latency * 1000:.0f} ms, {args.students + 4} updates per chat")
+    print(f"{'chats':>6}" + "".join(f"{mode + ' upd/s':>18}{'errors':>8}{'lost':>6}" for mode in modes))
+    for chats in map(int, args.chats.split(",")):
+        row = f"{chats:>6}"
+        for mode in modes:
+            throughput, errors, lost = await run(mode, chats, args.students, args.latency)
+            row += f"{throughput:>18.0f}{errors:>8}{lost:>6}"
+        print(row)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
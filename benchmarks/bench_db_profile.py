@@ -0,0 +1,107 @@
+# смешанная нагрузка на базу: старосты ставят отметки, пока другие чаты смотрят отчёты.
+#
+#   python benchmarks/bench_db_profile.py [--marks 1000000] [--headmen 20] [--reporters 4] [--seconds 10] [--dir .]
+#
+# --headmen задач в цикле ставят по отметке (Database.mark) и замеряют время до commit,
+# --reporters задач по очереди запрашивают историю группы за месяц, итоги за год и выгрузку csv за месяц.
+# профили: "old" -- как до настройки соединений (synchronous=FULL, кэш 2 МБ, без mmap, checkpoint при commit,
+# отчёты через соединение писателя), "new" -- настройки по умолчанию (Settings), checkpoint --
+# фоновой задачей раз в --checkpoint секунд, "new FULL" -- то же с synchronous=FULL. база -- файл в --dir
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from bench_backup import fill, percentiles
+from stubs import create_test_app
+from statuses import Status
+
+PROFILES = {
+    "old": dict(db_synchronous="FULL", db_cache_mb=2, db_mmap_mb=0, db_readers=0, checkpoint_interval=0),
+    "new": dict(),
+    "new FULL": dict(db_synchronous="FULL"),
+}
+
+
+async def headman(db, chat_id, student_ids, stop):
+    latencies = []
+    n = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await db.mark(chat_id, student_ids[n % len(student_ids)], f"2026-09-{n // 120 % 28 + 1:02d}",
+                      n // 30 % 4 + 1, Status.PRESENT + n % 2)
+        latencies.append(time.perf_counter() - start)
+        n += 1
+        await asyncio.sleep(0.005)
+    return latencies
+
+
+async def reporter(db, stop):
+    reports = 0
+    while not stop.is_set():
+        await db.get_group_history_page(1, "2020-03-01", "2020-03-31", "", 31)
+        await db.get_history_totals(1, 0, "2020-01-01", "2020-12-31")
+        (await db.export_attendance(1, "2020-03-01", "2020-03-31", "csv")).close()
+        reports += 3
+    return reports
+
+
+async def checkpoints(db, interval, stop):
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        await db.checkpoint()
+
+
+async def run(tmp, profile, args):
+    app = create_test_app(tmp, **PROFILES[profile])
+    db = app.db
+    await db.init()
+    students = {chat_id: [student_id for student_id, _, _ in await db.get_students(chat_id)]
+                for chat_id in range(2, args.headmen + 2)}
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(headman(db, chat_id, ids, stop)) for chat_id, ids in students.items()]
+    readers = [asyncio.create_task(reporter(db, stop)) for _ in range(args.reporters)]
+    if app.settings.checkpoint_interval:
+        tasks.append(asyncio.create_task(checkpoints(db, args.checkpoint, stop)))
+    await asyncio.sleep(args.seconds)
+    stop.set()
+    results = await asyncio.gather(*tasks)
+    reports = sum(await asyncio.gather(*readers))
+    await db.close()
+    writes = [latency for latencies in results[:args.headmen] for latency in latencies]
+    return len(writes) / args.seconds, percentiles(writes), reports / args.seconds
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--marks", type=int, default=1_000_000)
+    parser.add_argument("--headmen", type=int, default=20)
+    parser.add_argument("--reporters", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--checkpoint", type=float, default=2, help="интервал фонового checkpoint, секунды")
+    parser.add_argument("--dir", default=None, help="каталог для временной базы (по умолчанию системный)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        app = create_test_app(tmp)
+        await app.db.init()
+        await fill(app.db, args.marks)
+        marks = await app.db._run(lambda c: c.execute("SELECT COUNT(*) FROM attendance").fetchone()[0])
+        # у каждого старосты -- своя группа из заполненных fill (чаты 2, 3, ...)
+        groups = await app.db._run(lambda c: c.execute(
+            "SELECT COUNT(DISTINCT chat_id) FROM students WHERE chat_id > 1").fetchone()[0])
+        if args.headmen > groups:
+            print(f"--headmen {args.headmen} is more than {groups} filled groups, using {groups}")
+            args.headmen = groups
+        await app.db.close()
+        size = os.path.getsize(os.path.join(tmp, "journal.db")) / 1024 / 1024
+        print(f"{marks} marks, {size:.0f} MB, {args.headmen} headmen, {args.reporters} report loops")
+        print(f"{'profile':<10}{'writes/s':>9}{'write p50':>11}{'p99':>8}{'max':>8}{'reports/s':>11}")
+        for profile in PROFILES:
+            writes, (p50, p99, worst), reports = await run(tmp, profile, args)
+            print(f"{profile:<10}{writes:>9.0f}{p50:>11.1f}{p99:>8.1f}{worst:>8.1f}{reports:>11.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
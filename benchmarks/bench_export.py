@@ -0,0 +1,68 @@
+# бенчмарк выгрузки /export: время и пиковая память при росте таблицы attendance.
+#
+#   python benchmarks/bench_export.py [--sizes 10000,100000,1000000] [--students 200] [--format csv]
+#
+# каждый размер запускается в отдельном процессе, чтобы ru_maxrss не накапливался между замерами;
+# "python" -- пик выделений Python (tracemalloc), "rss" -- пиковый размер процесса
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench_handlers import grow_attendance
+from stubs import create_test_app, message_update
+
+
+async def measure(size, students, fmt):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_test_app(tmp)
+        await app.db.init()
+        names = "\n".join(f"Студент{i:03d} Тестовый" for i in range(students))
+        for text in ["/add_student", names]:
+            await app.dp.feed_update(app.bot, message_update(text))
+        grow_attendance(app.db.path, 1, 0, size)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        file = await app.db.export_attendance(1, "0000-01-01", "9999-12-31", fmt)
+        elapsed = time.perf_counter() - start
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        file.seek(0, os.SEEK_END)
+        file_size = file.tell()
+        file.close()
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        await app.dp.storage.close()
+        await app.db.close()
+    print(f"{size:>10}{file_size / 2**20:>10.1f}{elapsed:>10.2f}{python_peak / 2**20:>12.2f}"
+          f"{rss_after / 1024:>10.1f}{(rss_after - rss_before) / 1024:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--format", default="csv", choices=["csv", "xlsx"])
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.size is not None:
+        asyncio.run(measure(args.size, args.students, args.format))
+        return
+
+    print(f"format: {args.format}, students: {args.students}")
+    print(f"{'rows':>10}{'file MB':>10}{'time s':>10}{'python MB':>12}{'rss MB':>10}{'+rss MB':>10}")
+    for size in map(int, args.sizes.split(",")):
+        subprocess.run([sys.executable, __file__, "--size", str(size),
+                        "--students", str(args.students), "--format", args.format], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# пропускная способность записи отметок, когда перекличку одновременно ведут много старост.
+#
+#   python benchmarks/bench_group_commit.py [--headmen 1,10,100,500] [--students 30] [--dir .]
+#
+# каждый староста отмечает свою группу по одному студенту (db.mark), следующая отметка -- после ответа
+# на предыдущую, все старосты одновременно. режимы:
+#   per-write, rollback journal -- как было раньше: commit (и fsync) на каждую запись, журнал DELETE;
+#   per-write, WAL              -- commit на каждую запись, журнал WAL;
+#   group commit                -- задача-писатель Database: накопившиеся записи одной транзакцией;
+#   group commit, 2 ms          -- то же, с ожиданием попутных записей commit_delay = 2 мс.
+# база -- файл в --dir: на tmpfs fsync ничего не стоит, и разница между режимами пропадает
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from db import Database  # noqa: E402
+from statuses import Status  # noqa: E402
+
+
+class PerWriteDatabase(Database):
+    # каждая запись -- отдельная транзакция, без очереди писателя
+    def __init__(self, path, journal_mode):
+        super().__init__(path)
+        self.journal_mode = journal_mode
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            self._conn.execute("PRAGMA synchronous=FULL")
+        return self._conn
+
+    async def _write(self, fn, *args):
+        self.writes += 1
+        self.commits += 1
+        return await self._run(fn, *args)
+
+
+MODES = {
+    "per-write, rollback journal": lambda path: PerWriteDatabase(path, "DELETE"),
+    "per-write, WAL": lambda path: PerWriteDatabase(path, "WAL"),
+    "group commit": lambda path: Database(path),
+    "group commit, 2 ms": lambda path: Database(path, commit_delay=0.002),
+}
+
+
+async def run(make_db, tmp_dir, headmen, students):
+    path = os.path.join(tmp_dir, "journal.db")
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db = make_db(path)
+    await db.init()
+    groups = []
+    for chat_id in range(1, headmen + 1):
+        await db.add_students(chat_id, [f"Студент{i:03d} Тестовый" for i in range(students)])
+        groups.append((chat_id, [student_id for student_id, _, _ in await db.get_students(chat_id)]))
+    writes_before, commits_before = db.writes, db.commits
+    latencies = []
+
+    async def headman(chat_id, student_ids):
+        for student_id in student_ids:
+            start = time.perf_counter()
+            await db.mark(chat_id, student_id, "2025-09-01", 1, Status.PRESENT)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(headman(chat_id, student_ids) for chat_id, student_ids in groups))
+    elapsed = time.perf_counter() - start
+    await db.close()
+
+    latencies.sort()
+    writes, commits = db.writes - writes_before, db.commits - commits_before
+    return writes / elapsed, writes / commits, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--headmen", default="1,10,100,500")
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--dir", default=None, help="каталог для временной базы (по умолчанию системный)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        print(f"{'mode':<30}{'headmen':>8}{'writes/s':>10}{'per commit':>12}{'p50 ms':>9}{'p99 ms':>9}")
+        for headmen in map(int, args.headmen.split(",")):
+            for label, make_db in MODES.items():
+                rate, per_commit, p50, p99 = await run(make_db, tmp, headmen, args.students)
+                print(f"{label:<30}{headmen:>8}{rate:>10.0f}{per_commit:>12.1f}{p50 * 1000:>9.2f}{p99 * 1000:>9.2f}")
+            print()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
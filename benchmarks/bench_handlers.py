@@ -0,0 +1,146 @@
+# бенчмарк обработчиков через Dispatcher.feed_update: настоящие сценарии бота на временной базе,
+# ответы Bot API перехватывает FakeSession, так что в сеть ничего не уходит.
+#
+#   python benchmarks/bench_handlers.py [--sizes 0,10000,100000,1000000] [--students 30] [--rounds 5]
+#
+# для каждого размера таблицы attendance выводит по каждому шагу сценария
+# p50/p95/p99 задержки, число SQL-запросов на апдейт и апдейтов в секунду
+import argparse
+import asyncio
+import sqlite3
+import tempfile
+import time
+from collections import defaultdict
+
+from stubs import create_test_app, message_update
+from statuses import Status
+
+LESSONS = ["1⃣", "2⃣", "3⃣", "4⃣"]
+
+
+class Recorder:
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.statements = defaultdict(int)
+        self.sql = 0
+
+    def trace(self, statement):
+        # считаются все выполненные запросы, включая BEGIN/COMMIT;
+        # заголовки триггеров приходят отдельными строками "-- TRIGGER ..."
+        if not statement.startswith("--"):
+            self.sql += 1
+
+    def report(self, rows):
+        print(f"\nattendance rows: {rows}")
+        print(f"{'step':<24}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'sql/upd':>10}{'upd/s':>10}")
+        for label, samples in self.timings.items():
+            samples.sort()
+            pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+            print(f"{label:<24}{len(samples):>6}{pick(0.5):>10.2f}{pick(0.95):>10.2f}{pick(0.99):>10.2f}"
+                  f"{self.statements[label] / len(samples):>10.1f}{len(samples) / sum(samples):>10.0f}")
+
+
+async def feed(app, recorder, label, text, chat_id):
+    sql_before = recorder.sql
+    start = time.perf_counter()
+    await app.dp.feed_update(app.bot, message_update(text, chat_id=chat_id, user_id=chat_id))
+    recorder.timings[label].append(time.perf_counter() - start)
+    recorder.statements[label] += recorder.sql - sql_before
+
+
+def grow_attendance(path, chat_id, current, target):
+    # дописывает отметки до target строк: все студенты группы, 4 пары в день, даты с 1970 года
+    conn = sqlite3.connect(path)
+    student_ids = [row[0] for row in conn.execute("SELECT id FROM students WHERE chat_id = ? ORDER BY id", (chat_id,))]
+    per_day = len(student_ids) * 4
+
+    def rows():
+        for n in range(current, target):
+            day, rest = divmod(n, per_day)
+            lesson, idx = divmod(rest, len(student_ids))
+            year, day_of_year = divmod(day, 336)
+            month, day_of_month = divmod(day_of_year, 28)
+            date = f"{1970 + year:04d}-{month + 1:02d}-{day_of_month + 1:02d}"
+            yield student_ids[idx], date, lesson + 1, Status.PRESENT if n % 7 else Status.ABSENT
+
+    with conn:
+        conn.executemany("INSERT INTO attendance (student_id, date, lesson, status) VALUES (?, ?, ?, ?)", rows())
+    conn.close()
+
+
+async def run_round(app, recorder, chat_id, students, round_no):
+    # /add_student со 100 именами -- в отдельной, каждый раз новой группе
+    names = "\n".join(f"Новиков{round_no:02d} Студент {i:03d}" for i in range(100))
+    await feed(app, recorder, "/add_student", "/add_student", 10_000 + round_no)
+    await feed(app, recorder, "add_student:names", names, 10_000 + round_no)
+
+    # полная перекличка: дата, пара, по кнопке на каждого студента
+    day = f"{round_no % 28 + 1:02d}.{round_no // 28 % 12 + 1:02d}"
+    lesson = LESSONS[round_no % 4]
+    await feed(app, recorder, "/mark", "/mark", chat_id)
+    await feed(app, recorder, "mark:date", "Другая дата", chat_id)
+    await feed(app, recorder, "mark:custom_date", day, chat_id)
+    await feed(app, recorder, "mark:lesson", lesson, chat_id)
+    for i in range(students - 1):  # староста отмечается автоматически
+        await feed(app, recorder, "mark:student", "❌" if i % 5 == 0 else "✅", chat_id)
+
+    # исправление отметки
+    for label, text in [("/edit_mark", "/edit_mark"), ("edit_mark:date", "Другая дата"),
+                        ("edit_mark:custom_date", day), ("edit_mark:lesson", lesson),
+                        ("edit_mark:student", "Студент002"), ("edit_mark:status", "✅")]:
+        await feed(app, recorder, label, text, chat_id)
+
+    # посещаемость за пару
+    for label, text in [("/list_mark", "/list_mark"), ("list_mark:date", "Другая дата"),
+                        ("list_mark:custom_date", day), ("list_mark:lesson", lesson)]:
+        await feed(app, recorder, label, text, chat_id)
+
+    # справочные команды: список группы и название группы без изменений
+    for label, text in [("/list_students", "/list_students"), ("/set_group", "/set_group"),
+                        ("set_group:keep", "Оставить")]:
+        await feed(app, recorder, label, text, chat_id)
+
+    # статистика группы и одного студента
+    for label, text in [("/stats", "/stats"), ("stats:group", "Общая статистика"),
+                        ("/stats", "/stats"), ("stats:choice", "Конкретный студент"),
+                        ("stats:student", "Студент003")]:
+        await feed(app, recorder, label, text, chat_id)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="0,10000,100000,1000000")
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # без соединений читателей: все запросы идут через одно соединение, и трассировка видит каждый
+        app = create_test_app(tmp, db_readers=0)
+        await app.db.init()
+        chat_id = 1
+
+        names = "\n".join(f"Студент{i:03d} Тестовый" for i in range(args.students))
+        for text in ["/add_student", names, "/set_headman", "Студент000", "/set_group", "ИВТ-11"]:
+            await app.dp.feed_update(app.bot, message_update(text, chat_id=chat_id, user_id=chat_id))
+
+        rows = 0
+        round_no = 0
+        for target in map(int, args.sizes.split(",")):
+            if target > rows:
+                grow_attendance(app.db.path, chat_id, rows, target)
+                rows = target
+            recorder = Recorder()
+            await app.db._run(lambda c: c.connection.set_trace_callback(recorder.trace))
+            for _ in range(args.rounds):
+                await run_round(app, recorder, chat_id, args.students, round_no)
+                round_no += 1
+            await app.db._run(lambda c: c.connection.set_trace_callback(None))
+            recorder.report(rows)
+
+        await app.dp.storage.close()
+        await app.db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+# время ответа /history в зависимости от размера всего журнала при одном и том же периоде.
+#
+#   python benchmarks/bench_history.py [--years 1,4,16] [--students 30] [--lessons 4]
+#
+# журнал группы заполняется на --years учебных лет назад (6 дней в неделю, --lessons пар в день),
+# запрашиваются последние три месяца: первая страница (с итогом за период) и все страницы периода подряд,
+# по группе и по одному студенту, а также первая страница за всё время ("all time p1") -- для неё итоги
+# закрытых месяцев заранее посчитаны, как это делает ночная задача. кэш страниц перед каждым замером сбрасывается.
+# для сравнения -- "scan": итог за период с чтением всей истории группы, без диапазона по дате
+import argparse
+import asyncio
+import time
+from datetime import date, timedelta
+
+from stubs import create_test_app
+from pagination import PageCache, PageCallback
+
+
+async def fill(db, chat_id, years, students, lessons):
+    await db.add_students(chat_id, [f"Студент{i:03d} Тестовый" for i in range(students)])
+    ids = [student_id for student_id, _, _ in await db.get_students(chat_id)]
+    last = date(2026, 5, 31)
+    days = [last - timedelta(days=i) for i in range(365 * years)]
+    rows = [(student_id, f"{day:%Y-%m-%d}", lesson, 2 if (student_id + day.toordinal() + lesson) % 7 == 0 else 1)
+            for day in days if day.weekday() != 6
+            for lesson in range(1, lessons + 1) for student_id in ids]
+
+    def _insert(c):
+        c.executemany("INSERT INTO attendance (student_id, date, lesson, status) VALUES (?, ?, ?, ?)", rows)
+        c.connection.commit()
+    await db._run(_insert)
+    return ids, len(rows)
+
+
+async def measure(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", default="1,4,16")
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--lessons", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"period 2026-03-01..2026-05-31, {args.students} students, {args.lessons} lessons a day")
+    print(f"{'years':>6}{'marks':>10}{'group p1 ms':>13}{'group all ms':>14}{'student p1 ms':>15}"
+          f"{'student all ms':>16}{'scan ms':>9}{'group all time p1':>19}{'student all time p1':>21}")
+    for years in map(int, args.years.split(",")):
+        app = create_test_app()
+        await app.db.init()
+        pager = app.dp["pager"]
+        ids, marks = await fill(app.db, 1, years, args.students, args.lessons)
+        group = PageCallback(kind="history", page=0, date="2026-03-01", date_to="2026-05-31")
+        student = group.model_copy(update={"student": ids[len(ids) // 2]})
+        # границы периода "Всё время" в /history
+        all_time = {"date": "0000-01-01", "date_to": "9999-12-31"}
+
+        async def first(query):
+            pager.cache = PageCache()
+            await pager.render(1, query)
+
+        async def all_pages(query):
+            pager.cache = PageCache()
+            number = 0
+            while True:
+                _, markup = await pager.render(1, query.model_copy(update={"page": number}))
+                if not markup or not markup.inline_keyboard[0][-1].text.startswith("Вперёд"):
+                    break
+                number += 1
+
+        def _scan(c):
+            # a.date || '' не даёт использовать диапазон по дате: читается вся история студентов группы
+            c.execute("""SELECT COUNT(*), SUM(a.status IN (1, 3)) FROM students s CROSS JOIN attendance a
+                         ON a.student_id = s.id WHERE s.chat_id = ? AND a.date || '' BETWEEN ? AND ?""",
+                      (1, "2026-03-01", "2026-05-31"))
+            return c.fetchone()
+
+        results = [await measure(lambda: first(group), args.repeat),
+                   await measure(lambda: all_pages(group), args.repeat),
+                   await measure(lambda: first(student), args.repeat),
+                   await measure(lambda: all_pages(student), args.repeat),
+                   await measure(lambda: app.db._run(_scan), max(1, args.repeat // 4))]
+        await app.db.snapshot_months(1, "2026-06-01")
+        results += [await measure(lambda: first(group.model_copy(update=all_time)), args.repeat),
+                    await measure(lambda: first(student.model_copy(update=all_time)), args.repeat)]
+        print(f"{years:>6}{marks:>10}" + "".join(f"{value:>{width}.2f}"
+                                                  for value, width in zip(results, (13, 14, 15, 16, 9, 19, 21))))
+        await app.db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
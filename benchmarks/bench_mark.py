@@ -0,0 +1,99 @@
+# замер времени одной отметки посещаемости в зависимости от размера таблицы attendance
+#
+#   python benchmarks/bench_mark.py [--sizes 0,10000,100000,500000] [--marks 200]
+#
+# "legacy" -- прежняя схема: SELECT + UPDATE/INSERT без индекса,
+# "upsert" -- уникальный индекс (student_id, date, lesson) и INSERT ... ON CONFLICT
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from db import Database  # noqa: E402
+from statuses import Status  # noqa: E402
+
+STUDENTS = 30
+
+
+def fill(path, rows, status):
+    # rows отметок: STUDENTS студентов, по 4 пары в день
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO students (id, name) VALUES (?, ?)",
+                     [(i, f"Студент {i:03d}") for i in range(1, STUDENTS + 1)])
+    def gen():
+        for n in range(rows):
+            day, rest = divmod(n, STUDENTS * 4)
+            lesson, student = divmod(rest, STUDENTS)
+            yield student + 1, f"d{day:07d}", lesson + 1, status
+    conn.executemany("INSERT INTO attendance (student_id, date, lesson, status) VALUES (?, ?, ?, ?)", gen())
+    conn.commit()
+    conn.close()
+
+
+def legacy_mark(path, student_id, date, lesson, status):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("SELECT id FROM attendance WHERE student_id = ? AND date = ? AND lesson = ?",
+              (student_id, date, lesson))
+    record = c.fetchone()
+    if record:
+        c.execute("UPDATE attendance SET status = ? WHERE id = ?", (status, record[0]))
+    else:
+        c.execute("INSERT INTO attendance (student_id, date, lesson, status) VALUES (?, ?, ?, ?)",
+                  (student_id, date, lesson, status))
+    conn.commit()
+    conn.close()
+
+
+def report(name, rows, samples):
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:>7} rows={rows:>8}  p50={statistics.median(samples) * 1000:7.3f} ms  p95={p95 * 1000:7.3f} ms")
+
+
+async def bench(rows, marks):
+    with tempfile.TemporaryDirectory() as tmp:
+        # legacy: исходная схема без индекса
+        path = os.path.join(tmp, "legacy.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE students (id INTEGER PRIMARY KEY, name TEXT UNIQUE COLLATE NOCASE, is_headman INTEGER DEFAULT 0)")
+        conn.execute("CREATE TABLE attendance (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id INTEGER, date TEXT, lesson INTEGER, status TEXT)")
+        conn.close()
+        fill(path, rows, "присутствовал")
+        samples = []
+        for i in range(marks):
+            start = time.perf_counter()
+            legacy_mark(path, i % STUDENTS + 1, "new", i % 4 + 1, "отсутствовал")
+            samples.append(time.perf_counter() - start)
+        report("legacy", rows, samples)
+
+        # upsert через Database
+        path = os.path.join(tmp, "upsert.db")
+        db = Database(path)
+        await db.init()
+        fill(path, rows, Status.PRESENT)
+        samples = []
+        for i in range(marks):
+            start = time.perf_counter()
+            await db.mark(0, i % STUDENTS + 1, "new", i % 4 + 1, Status.ABSENT)
+            samples.append(time.perf_counter() - start)
+        report("upsert", rows, samples)
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="0,10000,100000,500000")
+    parser.add_argument("--marks", type=int, default=200)
+    args = parser.parse_args()
+    for rows in map(int, args.sizes.split(",")):
+        asyncio.run(bench(rows, args.marks))
+
+
+if __name__ == "__main__":
+    main()
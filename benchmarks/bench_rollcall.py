@@ -0,0 +1,88 @@
+# перекличка в группе: /mark (сообщение на каждого студента) против /mark_inline (одно сообщение с кнопками).
+#
+#   python benchmarks/bench_rollcall.py [--students 30] [--absent 5] [--tap 0.5] [--speed 20]
+#
+# запросы идут через SendScheduler с лимитами Telegram для группы (серия из 5, дальше 20 сообщений в минуту),
+# время ускорено в --speed раз, а в таблице пересчитано в реальные секунды. староста отвечает сразу,
+# как получил вопрос (/mark), или нажимает кнопки с интервалом --tap секунд (/mark_inline);
+# "rapid" -- нажатия на всех студентов подряд с интервалом 0.1 с., "timetable" -- у группы есть расписание,
+# и команда сразу начинает перекличку текущей пары, без вопросов о дате и паре.
+# messages -- сообщения бота в чате, edits -- правки клавиатуры, merged -- нажатия без своей правки
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+from aiogram.methods import EditMessageReplyMarkup, SendMessage
+
+from stubs import callback_update, create_test_app, message_update
+from sender import SendScheduler
+
+CHAT_ID = -100
+
+
+async def run(mode, students, taps, tap_interval, speed, timetable=False):
+    app = create_test_app()
+    session = app.bot.session
+    session.middleware(SendScheduler(global_rate=30 * speed, private_rate=speed, group_rate=20 / 60 * speed))
+    session.latency = 0.05 / speed
+    editor = app.dp["keyboard_editor"]
+    editor.delay /= speed
+    await app.db.init()
+    feed = lambda update: app.dp.feed_update(app.bot, update)
+    await app.db.add_students(CHAT_ID, [f"Студент{i:03d} Тестовый" for i in range(students)])
+    if timetable:
+        # пара 1 идёт весь день
+        await app.db.set_timetable(CHAT_ID, [(weekday, 1, 0, 24 * 60 - 1) for weekday in range(7)])
+    session.requests.clear()
+
+    start = time.perf_counter()
+    for text in [mode] if timetable else [mode, "Другая дата", "01.09", "1⃣"]:
+        await feed(message_update(text, chat_id=CHAT_ID))
+    if mode == "/mark":
+        absent = set(taps)
+        for i in range(students):
+            await feed(message_update("❌" if i in absent else "✅", chat_id=CHAT_ID))
+    else:
+        keyboard = [request for request in session.requests if isinstance(request, SendMessage)][-1].reply_markup
+        buttons = [button.callback_data for row in keyboard.inline_keyboard for button in row]
+        message_id = (await app.dp.storage.get_data(key=app.dp.fsm.get_context(
+            app.bot, chat_id=CHAT_ID, user_id=1).key))["message_id"]
+        for i in taps:
+            await feed(callback_update(buttons[i], chat_id=CHAT_ID, message_id=message_id))
+            await asyncio.sleep(tap_interval / speed)
+        await feed(callback_update(buttons[-2], chat_id=CHAT_ID, message_id=message_id))
+    elapsed = (time.perf_counter() - start) * speed
+
+    marked = await app.db._run(lambda c: c.execute("SELECT COUNT(*) FROM attendance").fetchone()[0])
+    assert marked == students, marked
+    methods = Counter(type(request) for request in session.requests)
+    await app.db.close()
+    return elapsed, methods[SendMessage], methods[EditMessageReplyMarkup], editor.skipped, len(session.requests)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--absent", type=int, default=5)
+    parser.add_argument("--tap", type=float, default=0.5)
+    parser.add_argument("--speed", type=float, default=20)
+    args = parser.parse_args()
+
+    absent = list(range(0, args.students, max(1, args.students // args.absent)))[:args.absent]
+    scenarios = [
+        ("/mark", "/mark", absent, args.tap, False),
+        ("/mark_inline", "/mark_inline", absent, args.tap, False),
+        ("/mark_inline rapid", "/mark_inline", list(range(args.students)), 0.1, False),
+        ("/mark timetable", "/mark", absent, args.tap, True),
+        ("/mark_inline timetable", "/mark_inline", absent, args.tap, True),
+    ]
+    print(f"{args.students} students, {args.absent} absent, Bot API latency 50 ms")
+    print(f"{'mode':<24}{'seconds':>9}{'messages':>10}{'edits':>7}{'merged':>8}{'API calls':>11}")
+    for label, mode, taps, interval, timetable in scenarios:
+        elapsed, messages, edits, merged, calls = await run(mode, args.students, taps, interval, args.speed, timetable)
+        print(f"{label:<24}{elapsed:>9.1f}{messages:>10}{edits:>7}{merged:>8}{calls:>11}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+# проверка очереди исходящих сообщений на фейковом Bot API, который отвечает 429 сверх лимитов Telegram.
+#
+#   python benchmarks/bench_sender.py [--private 40] [--groups 5] [--replies 15] [--bulk 200] [--inject 0.02] [--speed 10]
+#
+# одновременно идут переклички (каждый чат отправляет replies ответов подряд, как обработчики)
+# и рассылка bulk сообщений в отдельные чаты с низким приоритетом; кроме превышения лимитов
+# фейковый API отвечает 429 на долю inject запросов.
+# сравнивается отправка без очереди и через SendScheduler; время ускорено в speed раз,
+# задержки в отчёте пересчитаны в реальные секунды
+import argparse
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from stubs import FloodSession
+from sender import SendScheduler, bulk_priority
+
+
+async def run(args, scheduler):
+    session = FloodSession(speed=args.speed, inject=args.inject)
+    if scheduler is not None:
+        session.middleware(scheduler)
+    bot = Bot(token="123456:TEST", session=session)
+    latencies = {"interactive": [], "bulk": []}
+    failed = 0
+    depth = {"interactive": 0, "bulk": 0}
+
+    async def send(kind, chat_id, text):
+        nonlocal failed
+        start = time.monotonic()
+        try:
+            await bot.send_message(chat_id, text)
+        except TelegramRetryAfter:
+            failed += 1
+            return
+        latencies[kind].append((time.monotonic() - start) * args.speed)
+
+    async def roll_call(chat_id):
+        for i in range(args.replies):
+            await send("interactive", chat_id, f"Отметь посещаемость для студента {i}")
+
+    async def broadcast():
+        with bulk_priority():
+            await asyncio.gather(*(send("bulk", 1_000_000 + i, "Напоминание") for i in range(args.bulk)))
+
+    async def watch_depth():
+        while scheduler is not None:
+            for kind, n in scheduler.queue_depth().items():
+                depth[kind] = max(depth[kind], n)
+            await asyncio.sleep(0.01)
+
+    watcher = asyncio.create_task(watch_depth())
+    start = time.monotonic()
+    chats = list(range(1, args.private + 1)) + [-i for i in range(1, args.groups + 1)]
+    await asyncio.gather(broadcast(), *(roll_call(chat_id) for chat_id in chats))
+    elapsed = (time.monotonic() - start) * args.speed
+    watcher.cancel()
+
+    name = "scheduler" if scheduler is not None else "direct"
+    print(f"\n{name}: {elapsed:.1f} s, 429 from API: {session.flood}, failed sends: {failed}"
+          + (f", retried: {scheduler.retried}, max depth: {depth}" if scheduler is not None else ""))
+    for kind, samples in latencies.items():
+        if samples:
+            samples.sort()
+            pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))]
+            print(f"  {kind:<12} n={len(samples):<5} p50={pick(0.5):6.2f} s  p95={pick(0.95):6.2f} s  "
+                  f"max={samples[-1]:6.2f} s")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--private", type=int, default=40)
+    parser.add_argument("--groups", type=int, default=5)
+    parser.add_argument("--replies", type=int, default=15)
+    parser.add_argument("--bulk", type=int, default=200)
+    parser.add_argument("--inject", type=float, default=0.02)
+    parser.add_argument("--speed", type=float, default=10)
+    args = parser.parse_args()
+    # предупреждения о каждом 429 в отчёте не нужны
+    logging.getLogger("sender").setLevel(logging.ERROR)
+
+    await run(args, None)
+    s = args.speed
+    await run(args, SendScheduler(global_rate=30 * s, private_rate=1 * s, group_rate=20 / 60 * s))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
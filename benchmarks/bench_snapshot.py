@@ -0,0 +1,55 @@
+# итоги посещаемости за период (первая страница /history) до и после ночного пересчёта итогов за месяцы.
+#
+#   python benchmarks/bench_snapshot.py [--years 1,4,16] [--students 30] [--lessons 4]
+#
+# журнал группы заполняется как в bench_history.py; замеряется Database.get_history_totals по группе
+# и по студенту за семестр и за всё время: сначала только по отметкам, затем после snapshot_stats,
+# когда закрытые месяцы берутся из attendance_monthly. snapshot -- время самой ночной задачи
+import argparse
+import asyncio
+import time
+
+from stubs import create_test_app
+from bench_history import fill, measure
+from jobs import snapshot_stats
+
+PERIODS = {"semester": ("2026-02-01", "2026-08-31"), "all time": ("0000-01-01", "9999-12-31")}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", default="1,4,16")
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--lessons", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'years':>6}{'marks':>10}{'period':>10}{'scope':>9}{'marks ms':>10}{'snapshot ms':>13}")
+    for years in map(int, args.years.split(",")):
+        app = create_test_app()
+        await app.db.init()
+        ids, marks = await fill(app.db, 1, years, args.students, args.lessons)
+        cases = [(period, scope, student) for period in PERIODS
+                 for scope, student in (("group", 0), ("student", ids[0]))]
+
+        async def totals():
+            results = []
+            for period, _, student in cases:
+                date_from, date_to = PERIODS[period]
+                results.append(await measure(lambda: app.db.get_history_totals(1, student, date_from, date_to),
+                                             args.repeat))
+            return results
+
+        before = await totals()
+        start = time.perf_counter()
+        await snapshot_stats(app.db)
+        snapshot = time.perf_counter() - start
+        after = await totals()
+        for (period, scope, _), without, with_snapshot in zip(cases, before, after):
+            print(f"{years:>6}{marks:>10}{period:>10}{scope:>9}{without:>10.2f}{with_snapshot:>13.2f}")
+        print(f"{years:>6}{marks:>10}  nightly snapshot job {snapshot * 1000:.0f} ms")
+        await app.db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
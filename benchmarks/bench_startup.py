@@ -0,0 +1,85 @@
+# время импорта bot.py и сборки экземпляров бота через create_app().
+#
+#   python benchmarks/bench_startup.py [--runs 5] [--instances 50]
+#
+# импорт замеряется в отдельных процессах: целиком (вместе с aiogram) и отдельно собственные модули
+# бота, когда aiogram уже загружен; затем в одном процессе собираются и запускаются --instances
+# независимых экземпляров с базами ":memory:"
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from stubs import create_test_app, message_update
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+IMPORT_SCRIPT = """
+import time
+{preload}
+start = time.perf_counter()
+import bot
+print(time.perf_counter() - start)
+"""
+
+
+def import_time(preload, runs):
+    samples = []
+    for _ in range(runs):
+        # без переменных окружения: импорт не должен их требовать
+        env = {key: value for key, value in os.environ.items() if key not in ("BOT_TOKEN", "DB_PATH")}
+        output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT.format(preload=preload)], cwd=ROOT,
+                                env=env, capture_output=True, text=True, check=True).stdout
+        samples.append(float(output))
+    return statistics.median(samples)
+
+
+async def instances(count):
+    start = time.perf_counter()
+    apps = [create_test_app() for _ in range(count)]
+    created = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for app in apps:
+        await app.dp.emit_startup(dispatcher=app.dp, bot=app.bot, **app.dp.workflow_data)
+    started = time.perf_counter() - start
+
+    # у каждого экземпляра своя база: студент, добавленный в одном, не виден в других
+    for i, app in enumerate(apps):
+        for text in ["/add_student", f"Студент{i:03d} Тестовый"]:
+            await app.dp.feed_update(app.bot, message_update(text))
+    isolated = True
+    for i, app in enumerate(apps):
+        names = [name for _, name, _ in await app.db.get_students(1)]
+        isolated = isolated and names == [f"Студент{i:03d} Тестовый"]
+
+    start = time.perf_counter()
+    for app in apps:
+        await app.dp.emit_shutdown(dispatcher=app.dp, bot=app.bot, **app.dp.workflow_data)
+    stopped = time.perf_counter() - start
+    return created / count, started / count, stopped / count, isolated
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--instances", type=int, default=50)
+    args = parser.parse_args()
+
+    full = import_time("", args.runs)
+    own = import_time("import aiogram, aiogram.fsm.storage.base", args.runs)
+    print(f"import bot (with aiogram):       {full * 1000:8.1f} ms")
+    print(f"import bot (aiogram preloaded):  {own * 1000:8.1f} ms")
+
+    created, started, stopped, isolated = await instances(args.instances)
+    print(f"create_app per instance:         {created * 1000:8.2f} ms")
+    print(f"startup (migrations, :memory:):  {started * 1000:8.2f} ms")
+    print(f"shutdown:                        {stopped * 1000:8.2f} ms")
+    print(f"{args.instances} instances isolated:         {isolated}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
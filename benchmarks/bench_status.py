@@ -0,0 +1,100 @@
+# размер базы и время запросов до и после перехода на целые коды статусов (миграция 6).
+#
+#   python benchmarks/bench_status.py [--rows 1000000] [--students 200] [--repeat 5]
+#
+# база заполняется по схеме версии 5 (статус -- слово), замеряется, затем мигрируется
+# до последней версии и замеряется снова; размеры -- после VACUUM
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from migrations import migrate  # noqa: E402
+
+
+def fill(conn, rows, students, present, absent):
+    conn.executemany("INSERT INTO students (chat_id, name) VALUES (1, ?)",
+                     [(f"Студент{i:03d} Тестовый",) for i in range(students)])
+    ids = [row[0] for row in conn.execute("SELECT id FROM students ORDER BY id")]
+
+    def gen():
+        for n in range(rows):
+            day, rest = divmod(n, students * 4)
+            lesson, idx = divmod(rest, students)
+            yield ids[idx], f"{1970 + day // 336:04d}-{day % 336 // 28 + 1:02d}-{day % 28 + 1:02d}", \
+                lesson + 1, present if n % 7 else absent
+    with conn:
+        conn.executemany("INSERT INTO attendance (student_id, date, lesson, status) VALUES (?, ?, ?, ?)", gen())
+
+
+def sizes(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    result = {"file": conn.execute("PRAGMA page_count").fetchone()[0] * page_size}
+    for name, pages in conn.execute("""SELECT name, SUM(pgsize) FROM dbstat
+                                       WHERE name LIKE '%attendance%' GROUP BY name"""):
+        result[name] = pages
+    return result
+
+
+def timings(conn, present, repeat):
+    # запросы, которые читают статус: пересчёт счётчиков, статистика одного студента, посещаемость пары
+    student_id = conn.execute("SELECT MIN(id) FROM students").fetchone()[0]
+    date = conn.execute("SELECT MAX(date) FROM attendance").fetchone()[0]
+    queries = {
+        "recount (GROUP BY)": ("""SELECT student_id, COUNT(*), SUM(status = ?), SUM(status != ?)
+                                  FROM attendance GROUP BY student_id""", (present, present)),
+        "student scan": ("SELECT COUNT(*), SUM(status = ?) FROM attendance WHERE student_id = ?",
+                         (present, student_id)),
+        "lesson list": ("""SELECT s.name, a.status FROM students s
+                           LEFT JOIN attendance a ON s.id = a.student_id AND a.date = ? AND a.lesson = 1
+                           WHERE s.chat_id = 1 ORDER BY s.name""", (date,)),
+    }
+    result = {}
+    for label, (sql, params) in queries.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        result[label] = best
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "journal.db"))
+        migrate(conn, target=5)
+        fill(conn, args.rows, args.students, "присутствовал", "отсутствовал")
+        conn.execute("VACUUM")
+        before = sizes(conn), timings(conn, "присутствовал", args.repeat)
+
+        start = time.perf_counter()
+        migrate(conn)
+        migration_time = time.perf_counter() - start
+        after = sizes(conn), timings(conn, 1, args.repeat)
+        conn.close()
+
+    print(f"attendance rows: {args.rows}, migration 6 (with VACUUM): {migration_time:.1f} s\n")
+    print(f"{'':<36}{'text':>12}{'integer':>12}{'change':>10}")
+    # уникальный индекс после миграции стал первичным ключом таблицы
+    for label in dict.fromkeys([*before[0], *after[0]]):
+        old, new = before[0].get(label, 0), after[0].get(label, 0)
+        change = f"{(new - old) / old:>+10.0%}" if old else ""
+        print(f"{label + ', MB':<36}{old / 2**20:>12.1f}{new / 2**20:>12.1f}{change}")
+    for label, old in before[1].items():
+        new = after[1][label]
+        print(f"{label + ', ms':<36}{old * 1000:>12.2f}{new * 1000:>12.2f}{(new - old) / old:>+10.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# пропускная способность режимов webhook и polling на синтетических апдейтах, без сети:
+# ответы бота перехватывает FakeSession, вебхук слушает на 127.0.0.1
+#
+#   python benchmarks/bench_webhook.py [--updates 2000] [--chats 50] [--connections 40]
+#
+# --connections -- сколько запросов вебхука идёт параллельно (max_connections у Telegram, по умолчанию 40)
+import argparse
+import asyncio
+import tempfile
+import time
+
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram.methods import SendMessage
+
+from stubs import create_test_app, message_update
+
+
+async def wait_replies(session, expected):
+    while session.count(SendMessage) < expected:
+        await asyncio.sleep(0.001)
+
+
+async def bench_webhook(app, updates, connections, secret="bench-secret"):
+    from webhook import create_webhook_app
+    session = app.bot.session
+    session.requests.clear()
+    web_app = create_webhook_app(app.dp, app.bot, "/webhook", secret_token=secret)
+    async with TestClient(TestServer(web_app)) as client:
+        # неверный секрет отклоняется
+        response = await client.post("/webhook", json={"update_id": 0},
+                                     headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+        assert response.status == 401
+
+        queue = asyncio.Queue()
+        for update in updates:
+            queue.put_nowait(update.model_dump_json(exclude_none=True))
+
+        async def sender():
+            while not queue.empty():
+                response = await client.post("/webhook", data=queue.get_nowait(),
+                                             headers={"X-Telegram-Bot-Api-Secret-Token": secret,
+                                                      "Content-Type": "application/json"})
+                assert response.status == 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(connections)))
+        await wait_replies(session, len(updates))
+        return len(updates) / (time.perf_counter() - start)
+
+
+async def bench_polling(app, updates):
+    session = app.bot.session
+    session.requests.clear()
+    polling = asyncio.create_task(app.dp.start_polling(app.bot, handle_signals=False,
+                                                       close_bot_session=False))
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    for update in updates:
+        session.updates.put_nowait(update)
+    await wait_replies(session, len(updates))
+    elapsed = time.perf_counter() - start
+    await app.dp.stop_polling()
+    await polling
+    return len(updates) / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--connections", type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_test_app(tmp)
+        await app.db.init()
+        make = lambda: [message_update("/list_students", chat_id=i % args.chats + 1, user_id=i % args.chats + 1)
+                        for i in range(args.updates)]
+        polling = await bench_polling(app, make())
+        webhook = await bench_webhook(app, make(), args.connections)
+        print(f"polling: {polling:8.0f} updates/s")
+        print(f"webhook: {webhook:8.0f} updates/s (including local HTTP round trip per update)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+# заглушки для бенчмарков: сессия бота без сети и синтетические апдейты
+import asyncio
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetMe, GetUpdates, SendDocument, SendMessage
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+_ids = itertools.count(1)
+
+
+class FakeSession(BaseSession):
+    # отвечает на запросы к Bot API локально; getUpdates отдаёт апдейты из очереди.
+    # latency -- имитация сетевой задержки каждого запроса, кроме getUpdates, секунды
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.requests = []
+        self.updates = asyncio.Queue()
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests.append(method)
+        if self.latency and not isinstance(method, GetUpdates):
+            await asyncio.sleep(self.latency)
+        if isinstance(method, GetMe):
+            return User(id=123456, is_bot=True, first_name="Журнал", username="journal_bot")
+        if isinstance(method, GetUpdates):
+            batch = [await self.updates.get()]
+            while not self.updates.empty() and len(batch) < (method.limit or 100):
+                batch.append(self.updates.get_nowait())
+            return batch
+        if isinstance(method, (SendMessage, SendDocument)):
+            return Message(message_id=next(_ids), date=datetime.now(),
+                           chat=Chat(id=method.chat_id, type="group"),
+                           text=getattr(method, "text", None))
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+    def count(self, method_type):
+        return sum(isinstance(request, method_type) for request in self.requests)
+
+
+class FloodSession(FakeSession):
+    # FakeSession с лимитами Telegram: сверх лимита отвечает 429 с Retry-After.
+    # лимиты -- token buckets (скорость в сообщениях в секунду, допустимая серия);
+    # inject -- доля запросов, на которые 429 приходит без видимой причины, как иногда бывает у Telegram;
+    # speed ускоряет время: скорости умножаются, Retry-After делится на speed
+    def __init__(self, speed=1.0, inject=0.0, seed=1):
+        super().__init__()
+        self.speed = speed
+        self.inject = inject
+        self.limits = {"global": (30 * speed, 30), "private": (1 * speed, 3), "group": (20 / 60 * speed, 20)}
+        self.flood = 0
+        self._buckets = {}
+        self._random = random.Random(seed)
+
+    def _retry_after(self, key, kind, now):
+        # сколько ждать до появления токена в bucket; 0 -- токен есть и списан
+        rate, burst = self.limits[kind]
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        self._buckets[key] = (tokens, now)
+        return 0 if tokens >= 1 else (1 - tokens) / rate
+
+    async def make_request(self, bot, method, timeout=None):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None:
+            now = time.monotonic()
+            kind = "private" if isinstance(chat_id, int) and chat_id > 0 else "group"
+            wait = max(self._retry_after("global", "global", now), self._retry_after(chat_id, kind, now))
+            if not wait and self._random.random() < self.inject:
+                wait = self._random.randint(1, 3) / self.speed
+            if wait:
+                self.flood += 1
+                # Telegram отдаёт целое число секунд
+                retry_after = math.ceil(wait * self.speed) / self.speed
+                raise TelegramRetryAfter(method, f"Too Many Requests: retry after {retry_after}", retry_after)
+            for key in ("global", chat_id):
+                tokens, updated = self._buckets[key]
+                self._buckets[key] = (tokens - 1, updated)
+        return await super().make_request(bot, method, timeout)
+
+
+def message_update(text, chat_id=1, user_id=1):
+    update_id = next(_ids)
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id, date=datetime.now(), text=text,
+        chat=Chat(id=chat_id, type="group"),
+        from_user=User(id=user_id, is_bot=False, first_name="Староста"),
+    ))
+
+
+def callback_update(data, chat_id=1, user_id=1, message_id=1):
+    update_id = next(_ids)
+    return Update(update_id=update_id, callback_query=CallbackQuery(
+        id=str(update_id), chat_instance=str(chat_id), data=data,
+        from_user=User(id=user_id, is_bot=False, first_name="Староста"),
+        message=Message(message_id=message_id, date=datetime.now(), text="",
+                        chat=Chat(id=chat_id, type="group")),
+    ))
+
+
+def create_test_app(tmp_dir=None, **settings):
+    # экземпляр бота на временных базах (без tmp_dir -- в памяти)
+    from bot import create_app
+    from config import Settings
+    settings.setdefault("db_path", os.path.join(tmp_dir, "journal.db") if tmp_dir else ":memory:")
+    settings.setdefault("fsm_db_path", os.path.join(tmp_dir, "fsm.db") if tmp_dir else ":memory:")
+    app = create_app(Settings(token="123456:TEST", **settings), session=FakeSession())
+    # без очереди отправки с лимитами Telegram: здесь замеряются сами обработчики
+    app.bot.session.middleware.unregister(app.sender)
+    return app
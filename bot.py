@@ -1,20 +1,29 @@
 import asyncio
+import re
 import sqlite3
-from datetime import datetime
-from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
+from datetime import datetime, timedelta
+from typing import NamedTuple
+from aiogram import Bot, Dispatcher, Router, types
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-API_TOKEN = os.getenv("BOT_TOKEN")
-
-# инициализация бота и диспетчера
-bot = Bot(token=API_TOKEN)
-dp = Dispatcher()
+from backup import Backups
+from concurrency import ChatOrderedDispatcher
+from config import Settings
+from db import ConnectionProfile, Database
+from exporter import SpooledInputFile
+from pagination import TEXT_LIMIT, PageCallback, Pager
+from rollcall import MAX_STUDENTS, NEXT_STATUS, KeyboardEditor, RollCallback, new_token, roll_call_keyboard
+from sender import SendScheduler, bulk_priority
+from statuses import ATTENDED, BY_EMOJI, EMOJI, EXPORT_MARKS, TITLES, Status
+from timetable import lesson_button, parse_lesson, parse_timetable
+from fsm_storage import SQLiteStorage
+from jobs import create_scheduler
+from scheduler import Scheduler
+
+# импорт модуля ничего не создаёт и не открывает: бот, диспетчер и база собираются в create_app()
 
 # состояния
 class AttendanceStates(StatesGroup):
@@ -22,6 +31,9 @@ class AttendanceStates(StatesGroup):
     waiting_for_custom_date = State()
     waiting_for_lesson = State()
     marking_attendance = State()
+    waiting_for_absentees = State()
+    confirming_bulk = State()
+    roll_call = State()
 
 class AddStudentStates(StatesGroup):
     waiting_for_name = State()
@@ -53,32 +65,42 @@ class StatsStates(StatesGroup):
     waiting_for_choice = State()
     waiting_for_surname = State()
 
-# инициализация базы данных
-def init_db():
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS students (
-                 id INTEGER PRIMARY KEY, 
-                 name TEXT UNIQUE COLLATE NOCASE,
-                 is_headman INTEGER DEFAULT 0)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS attendance (
-                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 student_id INTEGER,
-                 date TEXT,
-                 lesson INTEGER,
-                 status TEXT,
-                 FOREIGN KEY(student_id) REFERENCES students(id))''')
-    c.execute('''CREATE TABLE IF NOT EXISTS group_info (
-                 id INTEGER PRIMARY KEY CHECK (id = 1),
-                 group_name TEXT)''')
-    c.execute("INSERT OR IGNORE INTO group_info (id, group_name) VALUES (1, 'Не указана')")
-    conn.commit()
-    conn.close()
-
-# вызов init_db() при запуске
-init_db()
-
-@dp.message(Command("start"))
+class ExportStates(StatesGroup):
+    waiting_for_period = State()
+    waiting_for_format = State()
+
+class HistoryStates(StatesGroup):
+    waiting_for_choice = State()
+    waiting_for_surname = State()
+    waiting_for_period = State()
+
+class TimetableStates(StatesGroup):
+    waiting_for_timetable = State()
+
+STATE_GROUPS = [AttendanceStates, AddStudentStates, RemoveStudentStates, EditMarkStates, ListMarkStates,
+                SetHeadmanStates, SetGroupStates, StatsStates, ExportStates, HistoryStates, TimetableStates]
+
+# миграции базы и фоновые задачи при запуске, закрытие хранилищ при остановке
+async def on_startup(db: Database, settings: Settings, scheduler: Scheduler, metrics_server):
+    await db.init()
+    if settings.legacy_chat_id:
+        await db.adopt_legacy_group(settings.legacy_chat_id)
+    scheduler.start()
+    if metrics_server:
+        await metrics_server.start()
+
+async def on_shutdown(dispatcher: Dispatcher, db: Database, scheduler: Scheduler, sender: SendScheduler,
+                      metrics_server):
+    if metrics_server:
+        await metrics_server.stop()
+    # выполняющиеся задачи отменяются до закрытия базы
+    await scheduler.stop()
+    # задачи больше ничего не отправят
+    await sender.close()
+    await dispatcher.storage.close()
+    await db.close()
+
+
 async def start_command(message: types.Message):
     await message.reply(
         "Привет! Я бот для ведения журнала посещаемости группы. "
@@ -86,34 +108,17 @@ async def start_command(message: types.Message):
     )
 
 # добавление студентов
-@dp.message(Command("add_student"))
 async def add_student_start(message: types.Message, state: FSMContext):
     await message.reply("Введи имя студента или список студентов в формате ФИО (каждый с новой строки):")
     await state.set_state(AddStudentStates.waiting_for_name)
 
-@dp.message(AddStudentStates.waiting_for_name)
-async def process_student_name(message: types.Message, state: FSMContext):
+async def process_student_name(message: types.Message, state: FSMContext, db: Database):
     names = message.text.strip().split('\n')
     if not names or all(not name.strip() for name in names):
         await message.reply("Список пуст. Введи хотя бы одно имя:")
         return
     
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    added = []
-    skipped = []
-    
-    for name in names:
-        name = name.strip()
-        if name:
-            try:
-                c.execute("INSERT INTO students (name) VALUES (?)", (name,))
-                added.append(name)
-            except sqlite3.IntegrityError:
-                skipped.append(name)
-    
-    conn.commit()
-    conn.close()
+    added, skipped = await db.add_students(message.chat.id, [name.strip() for name in names if name.strip()])
     
     response = ""
     if added:
@@ -125,26 +130,18 @@ async def process_student_name(message: types.Message, state: FSMContext):
     await state.clear()
 
 # удаление студентов
-@dp.message(Command("remove_student"))
 async def remove_student_start(message: types.Message, state: FSMContext):
     await message.reply("Введи фамилию студента для удаления:")
     await state.set_state(RemoveStudentStates.waiting_for_name)
 
-@dp.message(RemoveStudentStates.waiting_for_name)
-async def process_remove_student(message: types.Message, state: FSMContext):
+async def process_remove_student(message: types.Message, state: FSMContext, db: Database):
     surname = message.text.strip()
     if not surname:
         await message.reply("Фамилия не может быть пустой. Введи ещё раз:")
         return
 
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute("SELECT name FROM students ORDER BY name")
-    students = [row[0] for row in c.fetchall()]
-    conn.close()
-
-    # фамилия в верхний регистр для поиска
-    matching_students = [name for name in students if name.upper().startswith(surname.upper())]
+    directory = await db.get_directory(message.chat.id)
+    matching_students = [name for _, name, _ in directory.find(surname)]
 
     if not matching_students:
         await message.reply("Студент с такой фамилией не найден. Введи правильную фамилию:")
@@ -155,17 +152,11 @@ async def process_remove_student(message: types.Message, state: FSMContext):
         await state.set_state(RemoveStudentStates.waiting_for_full_name)
     else:
         full_name = matching_students[0]
-        conn = sqlite3.connect('group_journal.db')
-        c = conn.cursor()
-        c.execute("DELETE FROM students WHERE name = ?", (full_name,))
-        c.execute("DELETE FROM attendance WHERE student_id = (SELECT id FROM students WHERE name = ?)", (full_name,))
-        conn.commit()
-        conn.close()
+        await db.remove_student(message.chat.id, full_name)
         await message.reply(f"Студент {full_name} удалён.")
         await state.clear()
 
-@dp.message(RemoveStudentStates.waiting_for_full_name)
-async def process_remove_full_name(message: types.Message, state: FSMContext):
+async def process_remove_full_name(message: types.Message, state: FSMContext, db: Database):
     full_name_input = message.text.strip()
     data = await state.get_data()
     matching_students = data.get("matching_students", [])
@@ -174,60 +165,41 @@ async def process_remove_full_name(message: types.Message, state: FSMContext):
         await message.reply("ФИО не найдено. Попробуй ещё раз:")
         return
 
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM students WHERE name = ?", (full_name_input,))
-    c.execute("DELETE FROM attendance WHERE student_id = (SELECT id FROM students WHERE name = ?)", (full_name_input,))
-    conn.commit()
-    conn.close()
-
-    await message.reply(f"Студент {full_name_input} удалён.")
-    await state.clear()
-
-@dp.message(RemoveStudentStates.waiting_for_full_name)
-async def process_remove_full_name(message: types.Message, state: FSMContext):
-    full_name_input = message.text.strip()
-
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute("SELECT id FROM students WHERE name COLLATE NOCASE = ?", (full_name_input,))
-    student = c.fetchone()
-    
-    if not student:
+    if not await db.remove_student(message.chat.id, full_name_input):
         await message.reply("Ошибка: студент не найден. Попробуй ещё раз:")
-        conn.close()
         return
-    
-    student_id = student[0]
-    c.execute("DELETE FROM students WHERE id = ?", (student_id,))
-    c.execute("DELETE FROM attendance WHERE student_id = ?", (student_id,))
-    conn.commit()
-    conn.close()
-    
+
     await message.reply(f"Студент {full_name_input} удалён.")
     await state.clear()
 
 # вывод списка студентов группы
-@dp.message(Command("list_students"))
-async def list_students(message: types.Message):
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute("SELECT group_name FROM group_info WHERE id = 1")
-    group_name = c.fetchone()[0]
-    c.execute("SELECT name, is_headman FROM students ORDER BY name")
-    students = c.fetchall()
-    conn.close()
-    if students:
-        student_list = [f"{i+1}. {name}{' (📋)' if is_headman else ''}" 
-                        for i, (name, is_headman) in enumerate(students)]
-        student_list_text = "\n".join(student_list)
-        await message.reply(f"Группа: {group_name}\nСписок студентов:\n{student_list_text}")
-    else:
-        await message.reply(f"Группа: {group_name}\nСписок студентов пуст.")
+async def list_students(message: types.Message, pager: Pager):
+    text, markup = await pager.render(message.chat.id, PageCallback(kind="students", page=0))
+    await message.reply(text, reply_markup=markup)
+
+# листание длинных ответов: сообщение со страницей заменяется следующей/предыдущей
+async def show_page(callback: types.CallbackQuery, callback_data: PageCallback, pager: Pager):
+    text, markup = await pager.render(callback.message.chat.id, callback_data)
+    try:
+        await callback.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest:
+        # страница не изменилась (повторное нажатие) или сообщение слишком старое
+        pass
+    await callback.answer()
 
 # отметка посещаемости
-@dp.message(Command("mark"))
-async def mark_attendance(message: types.Message, state: FSMContext):
+# mode: "single" -- по одному студенту, "bulk" -- одним сообщением со списком отсутствующих,
+# "inline" -- одним сообщением с кнопками студентов (см. rollcall.py)
+async def mark_attendance(message: types.Message, state: FSMContext, db: Database, command: CommandObject,
+                          keyboard_editor: KeyboardEditor, mode: str = "single"):
+    await state.set_data({"mode": mode})
+    known = await known_lesson(message, db, command)
+    if known is False:
+        await state.clear()
+        return
+    if known:
+        await begin_marking(message, state, db, keyboard_editor, *known)
+        return
     current_date = datetime.now().strftime("%d.%m.%Y")
     markup = ReplyKeyboardMarkup(
         keyboard=[
@@ -240,22 +212,65 @@ async def mark_attendance(message: types.Message, state: FSMContext):
     await message.reply("Выбери дату для отметки посещаемости:", reply_markup=markup)
     await state.set_state(AttendanceStates.waiting_for_date_choice)
 
-def get_lesson_keyboard():
+async def mark_bulk_start(message: types.Message, state: FSMContext, db: Database, command: CommandObject,
+                          keyboard_editor: KeyboardEditor):
+    await mark_attendance(message, state, db, command, keyboard_editor, mode="bulk")
+
+async def mark_inline_start(message: types.Message, state: FSMContext, db: Database, command: CommandObject,
+                            keyboard_editor: KeyboardEditor):
+    await mark_attendance(message, state, db, command, keyboard_editor, mode="inline")
+
+def get_lesson_keyboard(count=4):
+    buttons = [KeyboardButton(text=lesson_button(lesson)) for lesson in range(1, count + 1)]
     return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="1⃣"), KeyboardButton(text="2⃣")],
-            [KeyboardButton(text="3⃣"), KeyboardButton(text="4⃣")]
-        ],
+        keyboard=[buttons[i:i + 2] for i in range(0, len(buttons), 2)],
         resize_keyboard=True,
         one_time_keyboard=True
     )
 
-@dp.message(AttendanceStates.waiting_for_date_choice)
-async def process_date_choice(message: types.Message, state: FSMContext):
+async def ask_lesson(message, db):
+    # пар на клавиатуре столько, сколько в расписании группы, но не меньше четырёх
+    timetable = await db.get_timetable(message.chat.id)
+    await message.reply("Выбери номер пары:", reply_markup=get_lesson_keyboard(max(4, timetable.lessons())))
+
+async def known_lesson(message, db, command):
+    # (дата, пара, пояснение) без вопросов о дате и паре: из аргументов команды ("/mark 2" -- пара 2
+    # сегодня, "/mark 23.03 2") или по расписанию группы, если пара идёт сейчас или скоро начнётся.
+    # None -- дату и пару нужно спросить, False -- аргументы не разобраны (ответ уже отправлен)
+    today = datetime.now()
+    if command.args:
+        parts = command.args.split()
+        try:
+            if len(parts) > 2:
+                raise ValueError
+            date = parse_day_month(parts[0]) if len(parts) == 2 else today.strftime("%Y-%m-%d")
+            lesson = parse_lesson(parts[-1])
+        except (ValueError, IndexError):
+            await message.reply(f"Неправильный формат. Укажи пару (/{command.command} 2) "
+                                f"или дату и пару (/{command.command} 23.03 2).")
+            return False
+        return date, lesson, ""
+    lesson = (await db.get_timetable(message.chat.id)).lesson_at(today)
+    if lesson is None:
+        return None
+    return (today.strftime("%Y-%m-%d"), lesson,
+            f"Пара {lesson} по расписанию (другая дата или пара -- /{command.command} 23.03 2).\n\n")
+
+# даты хранятся в формате ISO (гггг-мм-дд), пользователю показываются как дд.мм.гггг
+def parse_day_month(text):
+    day, month = map(int, text.split('.'))
+    if not (1 <= day <= 31 and 1 <= month <= 12):
+        raise ValueError
+    return f"{datetime.now().year}-{month:02d}-{day:02d}"
+
+def format_date(iso_date):
+    year, month, day = iso_date.split('-')
+    return f"{day}.{month}.{year}"
+
+async def process_date_choice(message: types.Message, state: FSMContext, db: Database):
     if message.text.startswith("Сегодня"):
-        current_date = datetime.now().strftime("%d.%m.%Y")
-        await state.update_data(date=current_date)
-        await message.reply("Выбери номер пары:", reply_markup=get_lesson_keyboard())
+        await state.update_data(date=datetime.now().strftime("%Y-%m-%d"))
+        await ask_lesson(message, db)
         await state.set_state(AttendanceStates.waiting_for_lesson)
     elif message.text == "Другая дата":
         await message.reply("Введи дату в формате 'день.месяц' (например, 23.03):", reply_markup=ReplyKeyboardRemove())
@@ -263,41 +278,48 @@ async def process_date_choice(message: types.Message, state: FSMContext):
     else:
         await message.reply("Выбери одну из кнопок!")
 
-@dp.message(AttendanceStates.waiting_for_custom_date)
-async def process_custom_date(message: types.Message, state: FSMContext):
+async def process_custom_date(message: types.Message, state: FSMContext, db: Database):
     try:
-        day, month = map(int, message.text.split('.'))
-        if not (1 <= day <= 31 and 1 <= month <= 12):
-            raise ValueError
-        current_year = datetime.now().year
-        date = f"{day:02d}.{month:02d}.{current_year}"
-        await state.update_data(date=date)
-        await message.reply("Выбери номер пары:", reply_markup=get_lesson_keyboard())
+        await state.update_data(date=parse_day_month(message.text))
+        await ask_lesson(message, db)
         await state.set_state(AttendanceStates.waiting_for_lesson)
     except (ValueError, IndexError):
         await message.reply("Неправильный формат. Введи дату как 'день.месяц' (например, 23.03):")
 
-@dp.message(AttendanceStates.waiting_for_lesson)
-async def process_lesson(message: types.Message, state: FSMContext):
-    lesson_map = {"1⃣": 1, "2⃣": 2, "3⃣": 3, "4⃣": 4}
-    if message.text not in lesson_map:
+async def process_lesson(message: types.Message, state: FSMContext, db: Database, keyboard_editor: KeyboardEditor):
+    try:
+        lesson = parse_lesson(message.text)
+    except ValueError:
         await message.reply("Выбери номер пары с помощью кнопок!")
         return
-        
-    lesson = lesson_map[message.text]
-    await state.update_data(lesson=lesson)
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    
-    c.execute("SELECT id, name, is_headman FROM students ORDER BY name")
-    all_students = c.fetchall()
-    conn.close()
+    data = await state.get_data()
+    await begin_marking(message, state, db, keyboard_editor, data['date'], lesson)
+
+async def begin_marking(message, state, db, keyboard_editor, date, lesson, note=""):
+    # дата и пара известны: перекличка в выбранном режиме; note -- в начало первого сообщения
+    await state.update_data(date=date, lesson=lesson)
+    all_students = await db.get_students(message.chat.id)
     
     if not all_students:
         await message.reply("Список студентов пуст. Добавь студентов через /add_student.", reply_markup=ReplyKeyboardRemove())
         await state.clear()
         return
     
+    data = await state.get_data()
+    if data.get("mode") == "bulk":
+        student_list = "\n".join(f"{i+1}. {name}{' (📋)' if is_headman else ''}"
+                                 for i, (_, name, is_headman) in enumerate(all_students))
+        await message.reply(
+            f"{note}{student_list}\n\nОтправь одним сообщением фамилии или номера отсутствующих "
+            "(через запятую или с новой строки). Если присутствуют все, отправь «-».",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        await state.set_state(AttendanceStates.waiting_for_absentees)
+        return
+    if data.get("mode") == "inline":
+        await start_roll_call(message, state, db, keyboard_editor, all_students, date, lesson, note)
+        return
+    
     # отделение старосты на перекличке
     headman = None
     students = []
@@ -307,25 +329,9 @@ async def process_lesson(message: types.Message, state: FSMContext):
         else:
             students.append(student)
     
-    data = await state.get_data()
-    date = data['date']
-    
     # указан староста --> автоматически присутствует на перекличке (подразумевается, что он = пользователь)
     if headman:
-        conn = sqlite3.connect('group_journal.db')
-        c = conn.cursor()
-        c.execute("SELECT id FROM attendance WHERE student_id = ? AND date = ? AND lesson = ?",
-                  (headman[0], date, lesson))
-        attendance_record = c.fetchone()
-        
-        if attendance_record:
-            c.execute("UPDATE attendance SET status = ? WHERE id = ?",
-                      ("присутствовал", attendance_record[0]))
-        else:
-            c.execute("INSERT INTO attendance (student_id, date, lesson, status) VALUES (?, ?, ?, ?)",
-                      (headman[0], date, lesson, "присутствовал"))
-        conn.commit()
-        conn.close()
+        await db.mark(message.chat.id, headman[0], date, lesson, Status.PRESENT)
     
     # если остались студенты для ручной отметки
     if students:
@@ -336,20 +342,18 @@ async def process_lesson(message: types.Message, state: FSMContext):
             resize_keyboard=True,
             one_time_keyboard=True
         )
-        await message.reply(f"Отметь посещаемость для {student[1]}:", reply_markup=markup)
+        await message.reply(f"{note}Отметь посещаемость для {student[1]}:", reply_markup=markup)
         await state.set_state(AttendanceStates.marking_attendance)
     else:
-        await message.reply("Все студенты отмечены (только староста в группе)!", reply_markup=ReplyKeyboardRemove())
+        await message.reply(f"{note}Все студенты отмечены (только староста в группе)!", reply_markup=ReplyKeyboardRemove())
         await state.clear()
     
-@dp.message(AttendanceStates.marking_attendance)
-async def process_mark_attendance(message: types.Message, state: FSMContext):
+async def process_mark_attendance(message: types.Message, state: FSMContext, db: Database):
     status = message.text
     if status not in ["✅", "❌"]:
         await message.reply("Выбери '✅' или '❌' с кнопок.")
         return
     
-    status_text = "присутствовал" if status == "✅" else "отсутствовал"
     data = await state.get_data()
     students = data['students']
     current_idx = data['current_student_idx']
@@ -359,21 +363,7 @@ async def process_mark_attendance(message: types.Message, state: FSMContext):
     # каждый элемент students содержит (id, name, is_headman)
     student_id, student_name, _ = students[current_idx]  # игнор is_headman через _
     
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    # проверка на уже существующую запись
-    c.execute("SELECT id FROM attendance WHERE student_id = ? AND date = ? AND lesson = ?",
-              (student_id, date, lesson))
-    attendance_record = c.fetchone()
-    
-    if attendance_record:
-        c.execute("UPDATE attendance SET status = ? WHERE id = ?",
-                  (status_text, attendance_record[0]))
-    else:
-        c.execute("INSERT INTO attendance (student_id, date, lesson, status) VALUES (?, ?, ?, ?)",
-                  (student_id, date, lesson, status_text))
-    conn.commit()
-    conn.close()
+    await db.mark(message.chat.id, student_id, date, lesson, BY_EMOJI[status])
     
     # переход к следующему студенту
     next_idx = current_idx + 1
@@ -390,9 +380,168 @@ async def process_mark_attendance(message: types.Message, state: FSMContext):
         await message.reply("Все студенты отмечены!", reply_markup=ReplyKeyboardRemove())
         await state.clear()
 
+async def start_roll_call(message, state, db, keyboard_editor, all_students, date, lesson, note=""):
+    if len(all_students) > MAX_STUDENTS:
+        await message.reply(f"В группе больше {MAX_STUDENTS} студентов, они не поместятся на кнопках. "
+                            "Отметь посещаемость через /mark_bulk.", reply_markup=ReplyKeyboardRemove())
+        await state.clear()
+        return
+    # если пару уже отмечали, перекличка начинается с сохранённых отметок, иначе все присутствуют
+    marked = await db.get_lesson_attendance_page(message.chat.id, date, lesson, "", len(all_students))
+    saved = {name: status for name, status, _ in marked}
+    students = [(student_id, name) for student_id, name, _ in all_students]
+    statuses = [saved.get(name) or Status.PRESENT for _, name in students]
+    token = new_token()
+    markup = roll_call_keyboard(token, students, statuses)
+    sent = await message.reply(
+        f"{note}Перекличка {format_date(date)}, пара {lesson}.\n"
+        "Нажимай на студентов, чтобы сменить отметку (✅ → ❌ → ⏰ → 📄), затем «Сохранить».",
+        reply_markup=markup
+    )
+    keyboard_editor.shown(sent.chat.id, sent.message_id, markup)
+    await state.update_data(token=token, students=students, statuses=statuses, message_id=sent.message_id)
+    await state.set_state(AttendanceStates.roll_call)
+
+async def process_roll_call_text(message: types.Message):
+    await message.reply("Отметь студентов кнопками под сообщением переклички и нажми «Сохранить».")
+
+async def process_roll_call(callback: types.CallbackQuery, callback_data: RollCallback, state: FSMContext,
+                            db: Database, keyboard_editor: KeyboardEditor):
+    data = await state.get_data()
+    # кнопки завершённой переклички или переклички, которую ведёт другой участник чата
+    if data.get("token") != callback_data.token:
+        await callback.answer("Эта перекличка уже закрыта.")
+        return
+    chat_id = callback.message.chat.id
+    students = data['students']
+    statuses = data['statuses']
+
+    if callback_data.action not in ("t", "s", "c") or (
+            callback_data.action == "t" and not 0 <= callback_data.index < len(students)):
+        # устаревшая или чужая кнопка не должна закрывать перекличку
+        await callback.answer("Кнопка устарела, перекличка продолжается.")
+        return
+
+    if callback_data.action == "t":
+        # новый список, а не правка данных FSM на месте
+        statuses = [NEXT_STATUS[Status(status)] if i == callback_data.index else status
+                    for i, status in enumerate(statuses)]
+        await state.update_data(statuses=statuses)
+        # сообщение правится в фоне; частые нажатия сливаются в одну правку
+        keyboard_editor.update(callback.bot, chat_id, data['message_id'],
+                               roll_call_keyboard(callback_data.token, students, statuses))
+        await callback.answer(f"{students[callback_data.index][1]}: {TITLES[Status(statuses[callback_data.index])]}")
+        return
+
+    if callback_data.action == "s":
+        # вся пара записывается одной транзакцией; перекличка закрывается только после commit,
+        # чтобы при ошибке записи её можно было сохранить ещё раз
+        await db.mark_lesson(chat_id, data['date'], data['lesson'], [
+            (student_id, status) for (student_id, _), status in zip(students, statuses)
+        ])
+    await keyboard_editor.finish(chat_id, data['message_id'])
+    await state.clear()
+    if callback_data.action == "s":
+        absent = [name for (_, name), status in zip(students, statuses) if status not in ATTENDED]
+        text = (f"Перекличка {format_date(data['date'])}, пара {data['lesson']} сохранена.\n"
+                f"Присутствуют: {len(students) - len(absent)} из {len(students)}.")
+        if absent:
+            text += "\nОтсутствуют:\n" + "\n".join(f"- {name}" for name in absent)
+        answer = "Сохранено"
+    else:
+        text = "Перекличка отменена."
+        answer = None
+    try:
+        await callback.message.edit_text(text[:TEXT_LIMIT])
+    except TelegramBadRequest:
+        # сообщение удалено или слишком старое
+        await callback.message.answer(text[:TEXT_LIMIT])
+    await callback.answer(answer)
+
+def resolve_students(tokens, directory):
+    # сопоставляет фамилии или номера из списка со студентами (id, name, is_headman);
+    # возвращает (найденные, не найденные, неоднозначные)
+    students = directory.students
+    found = {}
+    unknown = []
+    ambiguous = []
+    for token in tokens:
+        if token.isdigit():
+            idx = int(token) - 1
+            if 0 <= idx < len(students):
+                found[students[idx][0]] = students[idx]
+            else:
+                unknown.append(token)
+            continue
+        matching_students = directory.find(token)
+        if not matching_students:
+            unknown.append(token)
+        elif len(matching_students) > 1:
+            ambiguous.append(token)
+        else:
+            found[matching_students[0][0]] = matching_students[0]
+    return list(found.values()), unknown, ambiguous
+
+async def process_absentees(message: types.Message, state: FSMContext, db: Database):
+    text = message.text.strip()
+    directory = await db.get_directory(message.chat.id)
+    students = directory.students
+    if text in ("-", "—"):
+        absentees = []
+    else:
+        tokens = [token.strip() for token in re.split(r"[,;\n]+", text) if token.strip()]
+        absentees, unknown, ambiguous = resolve_students(tokens, directory)
+        if unknown or ambiguous:
+            response = ""
+            if unknown:
+                response += f"Не найдены: {', '.join(unknown)}\n"
+            if ambiguous:
+                response += f"Подходят несколько студентов: {', '.join(ambiguous)} (укажи ФИО или номер)\n"
+            await message.reply(response + "Отправь список ещё раз:")
+            return
+
+    await state.update_data(absent_ids=[student[0] for student in absentees])
+    absent_text = "\n".join(f"- {name}" for _, name, _ in absentees) or "- никто"
+    markup = ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text="Сохранить"), KeyboardButton(text="Отмена")]],
+        resize_keyboard=True,
+        one_time_keyboard=True
+    )
+    await message.reply(
+        f"Отсутствуют:\n{absent_text}\n"
+        f"Присутствуют: {len(students) - len(absentees)} из {len(students)}.\nСохранить?",
+        reply_markup=markup
+    )
+    await state.set_state(AttendanceStates.confirming_bulk)
+
+async def process_bulk_confirm(message: types.Message, state: FSMContext, db: Database):
+    if message.text == "Отмена":
+        await message.reply("Отметка отменена.", reply_markup=ReplyKeyboardRemove())
+        await state.clear()
+        return
+    if message.text != "Сохранить":
+        await message.reply("Выбери одну из кнопок!")
+        return
+
+    data = await state.get_data()
+    absent_ids = set(data.get('absent_ids', []))
+    students = await db.get_students(message.chat.id)
+    # вся пара записывается одной транзакцией
+    await db.mark_lesson(message.chat.id, data['date'], data['lesson'], [
+        (student_id, Status.ABSENT if student_id in absent_ids else Status.PRESENT)
+        for student_id, _, _ in students
+    ])
+    await message.reply(f"Все студенты отмечены! Отсутствуют: {len(absent_ids)}.", reply_markup=ReplyKeyboardRemove())
+    await state.clear()
+
 # исправление отметки
-@dp.message(Command("edit_mark"))
-async def edit_mark_start(message: types.Message, state: FSMContext):
+async def edit_mark_start(message: types.Message, state: FSMContext, db: Database, command: CommandObject):
+    known = await known_lesson(message, db, command)
+    if known is False:
+        return
+    if known:
+        await begin_edit(message, state, db, *known)
+        return
     current_date = datetime.now().strftime("%d.%m.%Y")
     markup = ReplyKeyboardMarkup(
         keyboard=[
@@ -405,12 +554,10 @@ async def edit_mark_start(message: types.Message, state: FSMContext):
     await message.reply("Выбери дату для исправления отметки:", reply_markup=markup)
     await state.set_state(EditMarkStates.waiting_for_date_choice)
 
-@dp.message(EditMarkStates.waiting_for_date_choice)
-async def edit_process_date_choice(message: types.Message, state: FSMContext):
+async def edit_process_date_choice(message: types.Message, state: FSMContext, db: Database):
     if message.text.startswith("Сегодня"):
-        current_date = datetime.now().strftime("%d.%m.%Y")
-        await state.update_data(date=current_date)
-        await message.reply("Выбери номер пары:", reply_markup=get_lesson_keyboard())
+        await state.update_data(date=datetime.now().strftime("%Y-%m-%d"))
+        await ask_lesson(message, db)
         await state.set_state(EditMarkStates.waiting_for_lesson)
     elif message.text == "Другая дата":
         await message.reply("Введи дату в формате 'день.месяц' (например, 23.03):", reply_markup=ReplyKeyboardRemove())
@@ -418,58 +565,45 @@ async def edit_process_date_choice(message: types.Message, state: FSMContext):
     else:
         await message.reply("Выбери одну из кнопок!")
 
-@dp.message(EditMarkStates.waiting_for_custom_date)
-async def edit_process_custom_date(message: types.Message, state: FSMContext):
+async def edit_process_custom_date(message: types.Message, state: FSMContext, db: Database):
     try:
-        day, month = map(int, message.text.split('.'))
-        if not (1 <= day <= 31 and 1 <= month <= 12):
-            raise ValueError
-        current_year = datetime.now().year
-        date = f"{day:02d}.{month:02d}.{current_year}"
-        await state.update_data(date=date)
-        await message.reply("Выбери номер пары:", reply_markup=get_lesson_keyboard())
+        await state.update_data(date=parse_day_month(message.text))
+        await ask_lesson(message, db)
         await state.set_state(EditMarkStates.waiting_for_lesson)
     except (ValueError, IndexError):
         await message.reply("Неправильный формат. Введи дату как 'день.месяц' (например, 23.03):")
 
-@dp.message(EditMarkStates.waiting_for_lesson)
-async def edit_process_lesson(message: types.Message, state: FSMContext):
-    lesson_map = {"1⃣": 1, "2⃣": 2, "3⃣": 3, "4⃣": 4}
-    if message.text not in lesson_map:
+async def edit_process_lesson(message: types.Message, state: FSMContext, db: Database):
+    try:
+        lesson = parse_lesson(message.text)
+    except ValueError:
         await message.reply("Выбери номер пары с помощью кнопок!")
         return
-        
-    lesson = lesson_map[message.text]
-    await state.update_data(lesson=lesson)
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute("SELECT name FROM students ORDER BY name")
-    students = c.fetchall()
-    conn.close()
+    data = await state.get_data()
+    await begin_edit(message, state, db, data['date'], lesson)
+
+async def begin_edit(message, state, db, date, lesson, note=""):
+    await state.update_data(date=date, lesson=lesson)
+    directory = await db.get_directory(message.chat.id)
     
-    if not students:
+    if not directory:
         await message.reply("Список студентов пуст. Добавь студентов через /add_student.", reply_markup=ReplyKeyboardRemove())
         await state.clear()
         return
         
-    student_list = [student[0] for student in students]
-    await state.update_data(student_list=student_list)
-    await message.reply("Введи фамилию студента, чью отметку нужно исправить:", reply_markup=ReplyKeyboardRemove())
+    await message.reply(f"{note}Введи фамилию студента, чью отметку нужно исправить:", reply_markup=ReplyKeyboardRemove())
     await state.set_state(EditMarkStates.waiting_for_student)
 
-@dp.message(EditMarkStates.waiting_for_student)
-async def edit_process_student(message: types.Message, state: FSMContext):
+async def edit_process_student(message: types.Message, state: FSMContext, db: Database):
     surname = message.text.strip()
-    data = await state.get_data()
-    student_list = data.get('student_list')
+    directory = await db.get_directory(message.chat.id)
     
-    if not student_list:
+    if not directory:
         await message.reply("Ошибка: список студентов не найден. Попробуй начать заново.")
         await state.clear()
         return
     
-    # фамилия в верхний регистр для поиска
-    matching_students = [name for name in student_list if name.upper().startswith(surname.upper())]
+    matching_students = [name for _, name, _ in directory.find(surname)]
     if not matching_students:
         await message.reply("Студент с такой фамилией не найден. Введи правильную фамилию:")
         return
@@ -481,22 +615,22 @@ async def edit_process_student(message: types.Message, state: FSMContext):
     await state.update_data(student_name=student_name)
     markup = ReplyKeyboardMarkup(
         keyboard=[
-            [KeyboardButton(text="✅"), KeyboardButton(text="❌")]
+            [KeyboardButton(text=EMOJI[Status.PRESENT]), KeyboardButton(text=EMOJI[Status.ABSENT])],
+            [KeyboardButton(text=EMOJI[Status.LATE]), KeyboardButton(text=EMOJI[Status.EXCUSED])]
         ],
         resize_keyboard=True,
         one_time_keyboard=True
     )
-    await message.reply(f"Выбери новый статус для {student_name}:", reply_markup=markup)
+    legend = ", ".join(f"{EMOJI[s]} {TITLES[s]}" for s in Status)
+    await message.reply(f"Выбери новый статус для {student_name} ({legend}):", reply_markup=markup)
     await state.set_state(EditMarkStates.waiting_for_status)
 
-@dp.message(EditMarkStates.waiting_for_status)
-async def edit_process_status(message: types.Message, state: FSMContext):
+async def edit_process_status(message: types.Message, state: FSMContext, db: Database):
     status = message.text
-    if status not in ["✅", "❌"]:
-        await message.reply("Выбери '✅' или '❌' с кнопок.")
+    if status not in BY_EMOJI:
+        await message.reply("Выбери статус с кнопок.")
         return
     
-    status_text = "присутствовал" if status == "✅" else "отсутствовал"
     data = await state.get_data()
     student_name = data.get('student_name')
     date = data.get('date')
@@ -507,41 +641,31 @@ async def edit_process_status(message: types.Message, state: FSMContext):
         await state.clear()
         return
     
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute("SELECT id FROM students WHERE UPPER(name) = UPPER(?)", (student_name,))
-    student = c.fetchone()
+    student = (await db.get_directory(message.chat.id)).get(student_name)
     
     if not student:
         await message.reply("Ошибка: студент не найден в базе.")
-        conn.close()
         await state.clear()
         return
     
-    student_id = student[0]
-    c.execute("SELECT id FROM attendance WHERE student_id = ? AND date = ? AND lesson = ?",
-              (student_id, date, lesson))
-    attendance_record = c.fetchone()
-    
-    if attendance_record:
-        c.execute("UPDATE attendance SET status = ? WHERE id = ?",
-                  (status_text, attendance_record[0]))
-        conn.commit()
-        await message.reply(f"Отметка для {student_name} на {date}, пара {lesson} изменена на '{status}'.",
+    if await db.edit_mark(message.chat.id, student[0], date, lesson, BY_EMOJI[status]) is not None:
+        await message.reply(f"Отметка для {student_name} на {format_date(date)}, пара {lesson} изменена на '{status}'.",
                             reply_markup=ReplyKeyboardRemove())
     else:
-        c.execute("INSERT INTO attendance (student_id, date, lesson, status) VALUES (?, ?, ?, ?)",
-                  (student_id, date, lesson, status_text))
-        conn.commit()
-        await message.reply(f"Отметка для {student_name} на {date}, пара {lesson} добавлена как '{status}'.",
+        await message.reply(f"Отметка для {student_name} на {format_date(date)}, пара {lesson} добавлена как '{status}'.",
                             reply_markup=ReplyKeyboardRemove())
     
-    conn.close()
     await state.clear()
 
 # вывод посещаемости
-@dp.message(Command("list_mark"))
-async def list_mark_start(message: types.Message, state: FSMContext):
+async def list_mark_start(message: types.Message, state: FSMContext, db: Database, pager: Pager,
+                          command: CommandObject):
+    known = await known_lesson(message, db, command)
+    if known is False:
+        return
+    if known:
+        await show_lesson(message, state, pager, *known)
+        return
     current_date = datetime.now().strftime("%d.%m.%Y")
     markup = ReplyKeyboardMarkup(
         keyboard=[
@@ -554,12 +678,10 @@ async def list_mark_start(message: types.Message, state: FSMContext):
     await message.reply("Выбери дату для просмотра посещаемости:", reply_markup=markup)
     await state.set_state(ListMarkStates.waiting_for_date_choice)
 
-@dp.message(ListMarkStates.waiting_for_date_choice)
-async def list_process_date_choice(message: types.Message, state: FSMContext):
+async def list_process_date_choice(message: types.Message, state: FSMContext, db: Database):
     if message.text.startswith("Сегодня"):
-        current_date = datetime.now().strftime("%d.%m.%Y")
-        await state.update_data(date=current_date)
-        await message.reply("Выбери номер пары:", reply_markup=get_lesson_keyboard())
+        await state.update_data(date=datetime.now().strftime("%Y-%m-%d"))
+        await ask_lesson(message, db)
         await state.set_state(ListMarkStates.waiting_for_lesson)
     elif message.text == "Другая дата":
         await message.reply("Введи дату в формате день.месяц (например, 23.03):", reply_markup=ReplyKeyboardRemove())
@@ -567,85 +689,48 @@ async def list_process_date_choice(message: types.Message, state: FSMContext):
     else:
         await message.reply("Выбери одну из кнопок!")
 
-@dp.message(ListMarkStates.waiting_for_custom_date)
-async def list_process_custom_date(message: types.Message, state: FSMContext):
+async def list_process_custom_date(message: types.Message, state: FSMContext, db: Database):
     try:
-        day, month = map(int, message.text.split('.'))
-        if not (1 <= day <= 31 and 1 <= month <= 12):
-            raise ValueError
-        current_year = datetime.now().year
-        date = f"{day:02d}.{month:02d}.{current_year}"
-        await state.update_data(date=date)
-        await message.reply("Выбери номер пары:", reply_markup=get_lesson_keyboard())
+        await state.update_data(date=parse_day_month(message.text))
+        await ask_lesson(message, db)
         await state.set_state(ListMarkStates.waiting_for_lesson)
     except (ValueError, IndexError):
         await message.reply("Неправильный формат. Введи дату как 23.03 (день.месяц).")
 
-@dp.message(ListMarkStates.waiting_for_lesson)
-async def list_process_lesson(message: types.Message, state: FSMContext):
-    lesson_map = {"1⃣": 1, "2⃣": 2, "3⃣": 3, "4⃣": 4}
-    if message.text not in lesson_map:
+async def list_process_lesson(message: types.Message, state: FSMContext, pager: Pager):
+    try:
+        lesson = parse_lesson(message.text)
+    except ValueError:
         await message.reply("Выбери номер пары с помощью кнопок!")
         return
-        
-    lesson = lesson_map[message.text]
     data = await state.get_data()
-    date = data.get('date')
-    
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute("""
-        SELECT s.name, a.status, s.is_headman 
-        FROM students s 
-        LEFT JOIN attendance a ON s.id = a.student_id 
-        AND a.date = ? AND a.lesson = ? 
-        ORDER BY s.name
-    """, (date, lesson))
-    attendance_data = c.fetchall()
-    conn.close()
-    
-    if not attendance_data:
-        await message.reply(f"Нет данных о посещаемости за {date}, пара {lesson}.", reply_markup=ReplyKeyboardRemove())
-        await state.clear()
-        return
-    
-    attendance_list = [
-        f"{i+1}. {name}{' (📋)' if is_headman else ''}: {status if status else '❓'}"
-        .replace('присутствовал', '✅')
-        .replace('отсутствовал', '❌')
-        for i, (name, status, is_headman) in enumerate(attendance_data)
-    ]
-    response = f"Посещаемость за {date}, пара {lesson}:\n" + "\n".join(attendance_list)
-    await message.reply(response, reply_markup=ReplyKeyboardRemove())
+    await show_lesson(message, state, pager, data.get('date'), lesson)
+
+async def show_lesson(message, state, pager, date, lesson, note=""):
+    # страница не длиннее TEXT_LIMIT, до лимита Telegram остаётся место для note
+    text, markup = await pager.render(message.chat.id, PageCallback(kind="lesson", page=0, date=date, lesson=lesson))
+    await message.reply(note + text, reply_markup=markup or ReplyKeyboardRemove())
     await state.clear()
 
 # назначение старосты
-@dp.message(Command("set_headman"))
 async def set_headman_start(message: types.Message, state: FSMContext):
     await message.reply("Введи фамилию студента, которого хочешь назначить старостой:")
     await state.set_state(SetHeadmanStates.waiting_for_name)
 
-@dp.message(SetHeadmanStates.waiting_for_name)
-async def process_set_headman(message: types.Message, state: FSMContext):
+async def process_set_headman(message: types.Message, state: FSMContext, db: Database):
     surname = message.text.strip()
     if not surname:
         await message.reply("Фамилия не может быть пустой. Введи ещё раз:")
         return
 
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute("SELECT name, is_headman FROM students ORDER BY name")
-    students = c.fetchall()
-    conn.close()
-
-    # фамилия в верхний регистр для поиска
-    matching_students = [student for student in students if student[0].upper().startswith(surname.upper())]
+    directory = await db.get_directory(message.chat.id)
+    matching_students = [(name, is_headman) for _, name, is_headman in directory.find(surname)]
 
     if not matching_students:
         await message.reply("Студент с такой фамилией не найден. Введи правильную фамилию:")
         return
     elif len(matching_students) > 1:
-        await state.update_data(matching_students=matching_students)
+        await state.update_data(matching_students=[s[0] for s in matching_students])
         await message.reply("Найдено несколько студентов с такой фамилией. Укажи полное ФИО:\n" + "\n".join([s[0] for s in matching_students]))
         await state.set_state(SetHeadmanStates.waiting_for_full_name)
     else:
@@ -654,17 +739,11 @@ async def process_set_headman(message: types.Message, state: FSMContext):
             await message.reply(f"{full_name} уже является старостой!")
             await state.clear()
         else:
-            conn = sqlite3.connect('group_journal.db')
-            c = conn.cursor()
-            c.execute("UPDATE students SET is_headman = 0 WHERE is_headman = 1")
-            c.execute("UPDATE students SET is_headman = 1 WHERE name = ?", (full_name,))
-            conn.commit()
-            conn.close()
+            await db.set_headman(message.chat.id, full_name)
             await message.reply(f"{full_name} теперь староста! Он(а) будет отмечен(а) в списке.")
             await state.clear()
 
-@dp.message(SetHeadmanStates.waiting_for_full_name)
-async def process_set_headman_full_name(message: types.Message, state: FSMContext):
+async def process_set_headman_full_name(message: types.Message, state: FSMContext, db: Database):
     full_name_input = message.text.strip()
     data = await state.get_data()
     matching_students = data.get("matching_students", [])
@@ -673,24 +752,14 @@ async def process_set_headman_full_name(message: types.Message, state: FSMContex
         await message.reply("ФИО не найдено. Попробуй ещё раз:")
         return
 
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute("UPDATE students SET is_headman = 0 WHERE is_headman = 1")
-    c.execute("UPDATE students SET is_headman = 1 WHERE name = ?", (full_name_input,))
-    conn.commit()
-    conn.close()
+    await db.set_headman(message.chat.id, full_name_input)
 
     await message.reply(f"{full_name_input} теперь староста! Он(а) будет отмечен(а) в списке.")
     await state.clear()
 
 # установка названия группы
-@dp.message(Command("set_group"))
-async def set_group_start(message: types.Message, state: FSMContext):
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute("SELECT group_name FROM group_info WHERE id = 1")
-    current_group_name = c.fetchone()[0]
-    conn.close()
+async def set_group_start(message: types.Message, state: FSMContext, db: Database):
+    current_group_name = await db.get_group_name(message.chat.id)
 
     if current_group_name != 'Не указана':
         # если название группы уже установлено
@@ -713,13 +782,8 @@ async def set_group_start(message: types.Message, state: FSMContext):
         await message.reply("Введи название учебной группы:")
         await state.set_state(SetGroupStates.waiting_for_group_name)
 
-@dp.message(SetGroupStates.waiting_for_group_name)
-async def process_group_name(message: types.Message, state: FSMContext):
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute("SELECT group_name FROM group_info WHERE id = 1")
-    current_group_name = c.fetchone()[0]
-    conn.close()
+async def process_group_name(message: types.Message, state: FSMContext, db: Database):
+    current_group_name = await db.get_group_name(message.chat.id)
 
     user_input = message.text.strip()
 
@@ -735,17 +799,47 @@ async def process_group_name(message: types.Message, state: FSMContext):
         await message.reply("Название группы не может быть пустым. Введи ещё раз:")
         return
     
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute("UPDATE group_info SET group_name = ? WHERE id = 1", (user_input,))
-    conn.commit()
-    conn.close()
+    await db.set_group_name(message.chat.id, user_input)
     
     await message.reply(f"Название группы установлено: {user_input}", reply_markup=ReplyKeyboardRemove())
     await state.clear()
 
+# расписание пар: по нему /mark, /edit_mark и /list_mark сами выбирают дату и пару
+async def timetable_start(message: types.Message, state: FSMContext, db: Database):
+    timetable = await db.get_timetable(message.chat.id)
+    buttons = [KeyboardButton(text="Оставить")]
+    if timetable:
+        buttons.append(KeyboardButton(text="Удалить"))
+    current = f"Текущее расписание:\n{timetable.format()}" if timetable else "Расписание не задано."
+    await message.reply(
+        f"{current}\n\nОтправь новое расписание, по строке на пару: дни, номер пары, начало и конец. Например:\n"
+        "пн-пт 1 08:30-10:00\nпн-пт 2 10:10-11:40\nпн,ср 3 12:20-13:50",
+        reply_markup=ReplyKeyboardMarkup(keyboard=[buttons], resize_keyboard=True, one_time_keyboard=True)
+    )
+    await state.set_state(TimetableStates.waiting_for_timetable)
+
+async def process_timetable(message: types.Message, state: FSMContext, db: Database):
+    text = message.text.strip()
+    if text == "Оставить":
+        await message.reply("Расписание не изменилось.", reply_markup=ReplyKeyboardRemove())
+        await state.clear()
+        return
+    if text == "Удалить":
+        await db.set_timetable(message.chat.id, [])
+        await message.reply("Расписание удалено: дата и пара снова спрашиваются.", reply_markup=ReplyKeyboardRemove())
+        await state.clear()
+        return
+    try:
+        rows = parse_timetable(text)
+    except ValueError as e:
+        await message.reply(f"Не получилось разобрать расписание ({e}). Исправь и отправь его ещё раз:")
+        return
+    await db.set_timetable(message.chat.id, rows)
+    timetable = await db.get_timetable(message.chat.id)
+    await message.reply(f"Расписание сохранено:\n{timetable.format()}", reply_markup=ReplyKeyboardRemove())
+    await state.clear()
+
 # вывод статистики студентов
-@dp.message(Command("stats"))
 async def show_attendance_stats(message: types.Message, state: FSMContext):
     markup = ReplyKeyboardMarkup(
         keyboard=[
@@ -758,79 +852,11 @@ async def show_attendance_stats(message: types.Message, state: FSMContext):
     await message.reply("Выбери тип статистики:", reply_markup=markup)
     await state.set_state(StatsStates.waiting_for_choice)
 
-@dp.message(StatsStates.waiting_for_choice)
-async def process_stats_choice(message: types.Message, state: FSMContext):
+async def process_stats_choice(message: types.Message, state: FSMContext, pager: Pager):
     if message.text == "Общая статистика":
-        conn = sqlite3.connect('group_journal.db')
-        c = conn.cursor()
-        
-        # название группы
-        c.execute("SELECT group_name FROM group_info WHERE id = 1")
-        group_name = c.fetchone()[0]
-        
-        # все студенты
-        c.execute("SELECT id, name, is_headman FROM students ORDER BY name")
-        students = c.fetchall()
-        
-        if not students:
-            await message.reply(f"Группа: {group_name}\nСписок студентов пуст. Добавь студентов через /add_student.", reply_markup=ReplyKeyboardRemove())
-            conn.close()
-            await state.clear()
-            return
-        
-        # статистика посещаемости
-        stats = {}
-        for student_id, name, is_headman in students:
-            c.execute("SELECT status FROM attendance WHERE student_id = ?", (student_id,))
-            records = c.fetchall()
-            total_lessons = len(records)
-            present = sum(1 for record in records if record[0] == "присутствовал")
-            absent = total_lessons - present
-            attendance_percent = (present / total_lessons * 100) if total_lessons > 0 else 100
-            stats[name] = {
-                "absent": absent,
-                "total": total_lessons,
-                "percent": attendance_percent,
-                "is_headman": is_headman
-            }
-        
-        conn.close()
-        
-        if not any(stats.values()):
-            await message.reply(f"Группа: {group_name}\nНет данных о посещаемости.", reply_markup=ReplyKeyboardRemove())
-            await state.clear()
-            return
-        
-        # формирование статистики
-        response = f"Статистика посещаемости группы: {group_name}\n\n"
-        
-        # 1. кто чаще всего пропускал
-        max_absent = max((data["absent"] for data in stats.values()), default=0)
-        if max_absent > 0:
-            most_absent = [name for name, data in stats.items() if data["absent"] == max_absent]
-            response += "Чаще всего пропускали занятия:\n"
-            for name in most_absent:
-                response += f"- {name}{' (📋)' if stats[name]['is_headman'] else ''}: {max_absent} пропусков\n"
-        else:
-            response += "Никто ещё не пропускал занятия.\n"
-        
-        # 2. кто не пропустил ни одного
-        no_absences = [name for name, data in stats.items() if data["absent"] == 0 and data["total"] > 0]
-        if no_absences:
-            response += "\nНи одного пропуска:\n"
-            for name in no_absences:
-                response += f"- {name}{' (📋)' if stats[name]['is_headman'] else ''}\n"
-        else:
-            response += "\nНет студентов без пропусков (или нет данных).\n"
-        
-        # 3. процент посещаемости для всех
-        response += "\nПроцент посещаемости:\n"
-        for name, data in stats.items():
-            percent = data["percent"]
-            total = data["total"]
-            response += f"- {name}{' (📋)' if data['is_headman'] else ''}: {percent:.1f}% ({total} занятий)\n"
-        
-        await message.reply(response, reply_markup=ReplyKeyboardRemove())
+        # сводка и процент посещаемости по страницам (счётчики из attendance_counters)
+        text, markup = await pager.render(message.chat.id, PageCallback(kind="stats", page=0))
+        await message.reply(text, reply_markup=markup or ReplyKeyboardRemove())
         await state.clear()
 
     elif message.text == "Конкретный студент":
@@ -839,23 +865,14 @@ async def process_stats_choice(message: types.Message, state: FSMContext):
     else:
         await message.reply("Выбери одну из кнопок!")
 
-@dp.message(StatsStates.waiting_for_surname)
-async def process_stats_surname(message: types.Message, state: FSMContext):
+async def process_stats_surname(message: types.Message, state: FSMContext, db: Database):
     surname = message.text.strip()
     if not surname:
         await message.reply("Фамилия не может быть пустой. Введи ещё раз:")
         return
 
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute("SELECT group_name FROM group_info WHERE id = 1")
-    group_name = c.fetchone()[0]
-    c.execute("SELECT id, name, is_headman FROM students ORDER BY name")
-    students = c.fetchall()
-    conn.close()
-
-    # фамилия в верхний регистр для поиска
-    matching_students = [student for student in students if student[1].upper().startswith(surname.upper())]
+    directory = await db.get_directory(message.chat.id)
+    matching_students = directory.find(surname)
 
     if not matching_students:
         await message.reply("Студент с такой фамилией не найден. Введи правильную фамилию:")
@@ -866,15 +883,9 @@ async def process_stats_surname(message: types.Message, state: FSMContext):
         return
     
     student_id, full_name, is_headman = matching_students[0]
-    conn = sqlite3.connect('group_journal.db')
-    c = conn.cursor()
-    c.execute("SELECT status FROM attendance WHERE student_id = ?", (student_id,))
-    records = c.fetchall()
-    conn.close()
-
-    total_lessons = len(records)
-    present = sum(1 for record in records if record[0] == "присутствовал")
-    absent = total_lessons - present
+    group_name = await db.get_group_name(message.chat.id)
+    total_lessons, present, absent = await db.get_student_stats(student_id)
+
     attendance_percent = (present / total_lessons * 100) if total_lessons > 0 else 100
 
     response = f"Статистика для {full_name}{' (📋)' if is_headman else ''} (группа: {group_name}):\n"
@@ -886,8 +897,303 @@ async def process_stats_surname(message: types.Message, state: FSMContext):
     await message.reply(response)
     await state.clear()
 
+# выгрузка журнала в файл
+async def export_start(message: types.Message, state: FSMContext):
+    markup = ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text="Этот месяц"), KeyboardButton(text="Этот семестр")],
+            [KeyboardButton(text="Всё время")]
+        ],
+        resize_keyboard=True,
+        one_time_keyboard=True
+    )
+    await message.reply("Выбери период или введи его как 'день.месяц-день.месяц' (например, 01.09-31.12):",
+                        reply_markup=markup)
+    await state.set_state(ExportStates.waiting_for_period)
+
+def parse_period(text):
+    # (начало, конец) периода в формате ISO
+    today = datetime.now()
+    if text == "Эта неделя":
+        monday = today - timedelta(days=today.weekday())
+        return f"{monday:%Y-%m-%d}", f"{monday + timedelta(days=6):%Y-%m-%d}"
+    if text == "Этот месяц":
+        return f"{today:%Y-%m}-01", f"{today:%Y-%m}-31"
+    if text == "Этот семестр":
+        # осенний семестр -- с сентября по январь, весенний -- с февраля по август
+        if today.month >= 9:
+            return f"{today.year}-09-01", f"{today.year + 1}-01-31"
+        if today.month == 1:
+            return f"{today.year - 1}-09-01", f"{today.year}-01-31"
+        return f"{today.year}-02-01", f"{today.year}-08-31"
+    if text == "Всё время":
+        return "0000-01-01", "9999-12-31"
+    date_from, date_to = (parse_day_month(part.strip()) for part in text.split('-'))
+    if date_from > date_to:
+        # период через новый год (например, 01.09-31.01): осенью он заканчивается в следующем году,
+        # а весной -- начался в прошлом
+        if f"{today:%Y-%m-%d}" >= date_from:
+            date_to = f"{today.year + 1}{date_to[4:]}"
+        else:
+            date_from = f"{today.year - 1}{date_from[4:]}"
+    return date_from, date_to
+
+async def export_process_period(message: types.Message, state: FSMContext):
+    try:
+        date_from, date_to = parse_period(message.text.strip())
+    except ValueError:
+        await message.reply("Неправильный формат. Выбери период кнопкой или введи его как 01.09-31.12:")
+        return
+    await state.update_data(date_from=date_from, date_to=date_to)
+    markup = ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text="CSV"), KeyboardButton(text="XLSX")]],
+        resize_keyboard=True,
+        one_time_keyboard=True
+    )
+    await message.reply("Выбери формат файла:", reply_markup=markup)
+    await state.set_state(ExportStates.waiting_for_format)
+
+async def export_process_format(message: types.Message, state: FSMContext, db: Database):
+    fmt = message.text.strip().lower()
+    if fmt not in ("csv", "xlsx"):
+        await message.reply("Выбери одну из кнопок!")
+        return
+
+    data = await state.get_data()
+    await state.clear()
+    file = await db.export_attendance(message.chat.id, data['date_from'], data['date_to'], fmt)
+    period = ("all" if data['date_from'] == "0000-01-01"
+              else f"{data['date_from']}_{data['date_to']}")
+    # отчёт не должен задерживать ответы в других чатах; повторы после 429 -- внутри reply_document
+    with file, bulk_priority():
+        await message.reply_document(
+            SpooledInputFile(file, filename=f"attendance_{period}.{fmt}"),
+            caption="Посещаемость: " + ", ".join(f"{EXPORT_MARKS[s]} {TITLES[s]}" for s in Status) + ".",
+            reply_markup=ReplyKeyboardRemove()
+        )
+
+# история посещаемости группы или студента за период: по дню на строку, с процентом за период
+async def history_start(message: types.Message, state: FSMContext):
+    markup = ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text="Вся группа")],
+            [KeyboardButton(text="Конкретный студент")]
+        ],
+        resize_keyboard=True,
+        one_time_keyboard=True
+    )
+    await message.reply("Чью историю показать?", reply_markup=markup)
+    await state.set_state(HistoryStates.waiting_for_choice)
+
+async def history_period_prompt(message: types.Message, state: FSMContext):
+    markup = ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text="Эта неделя"), KeyboardButton(text="Этот месяц")],
+            [KeyboardButton(text="Этот семестр"), KeyboardButton(text="Всё время")]
+        ],
+        resize_keyboard=True,
+        one_time_keyboard=True
+    )
+    await message.reply("Выбери период или введи его как 'день.месяц-день.месяц' (например, 01.09-31.12):",
+                        reply_markup=markup)
+    await state.set_state(HistoryStates.waiting_for_period)
+
+async def history_process_choice(message: types.Message, state: FSMContext):
+    if message.text == "Вся группа":
+        await state.update_data(student_id=0)
+        await history_period_prompt(message, state)
+    elif message.text == "Конкретный студент":
+        await message.reply("Введи фамилию студента:", reply_markup=ReplyKeyboardRemove())
+        await state.set_state(HistoryStates.waiting_for_surname)
+    else:
+        await message.reply("Выбери одну из кнопок!")
+
+async def history_process_surname(message: types.Message, state: FSMContext, db: Database):
+    surname = message.text.strip()
+    if not surname:
+        await message.reply("Фамилия не может быть пустой. Введи ещё раз:")
+        return
+
+    directory = await db.get_directory(message.chat.id)
+    matching_students = directory.find(surname)
+    if not matching_students:
+        await message.reply("Студент с такой фамилией не найден. Введи правильную фамилию:")
+        return
+    elif len(matching_students) > 1:
+        await message.reply("Найдено несколько студентов с такой фамилией. Укажи полное ФИО:\n" + "\n".join([s[1] for s in matching_students]))
+        return
+
+    await state.update_data(student_id=matching_students[0][0])
+    await history_period_prompt(message, state)
+
+async def history_process_period(message: types.Message, state: FSMContext, pager: Pager):
+    try:
+        date_from, date_to = parse_period(message.text.strip())
+    except ValueError:
+        await message.reply("Неправильный формат. Выбери период кнопкой или введи его как 01.09-31.12:")
+        return
+    data = await state.get_data()
+    await state.clear()
+    text, markup = await pager.render(message.chat.id, PageCallback(
+        kind="history", page=0, date=date_from, date_to=date_to, student=data['student_id']))
+    await message.reply(text, reply_markup=markup or ReplyKeyboardRemove())
+
+# снимки базы (только для ADMIN_IDS): снимок сейчас и проверка снимка восстановлением во временную базу
+async def backup_command(message: types.Message, settings: Settings, backups: Backups):
+    if message.from_user.id not in settings.admin_ids:
+        return
+    await message.reply("Делаю снимок базы...")
+    name, size, elapsed = await backups.snapshot()
+    await message.reply(f"Снимок {name}: {size / 1024 / 1024:.1f} МБ за {elapsed:.1f} с.\n"
+                        f"Хранится снимков: {len(backups.snapshots())} (не больше {backups.keep}).")
+
+async def restore_check_command(message: types.Message, command: CommandObject, settings: Settings,
+                                backups: Backups):
+    if message.from_user.id not in settings.admin_ids:
+        return
+    snapshots = backups.snapshots()
+    if not snapshots:
+        await message.reply("Снимков пока нет. Сделай снимок через /backup.")
+        return
+    name = (command.args or "").strip() or snapshots[-1]
+    try:
+        integrity, version, groups, students, marks = await backups.verify(name)
+    except FileNotFoundError:
+        await message.reply("Нет такого снимка. Есть:\n" + "\n".join(snapshots))
+        return
+    except sqlite3.DatabaseError as e:
+        await message.reply(f"Снимок {name} не восстанавливается: {e}")
+        return
+    await message.reply(f"Снимок {name} восстановлен во временную базу.\n"
+                        f"Проверка целостности: {integrity}\n"
+                        f"Версия схемы: {version}\n"
+                        f"Групп: {groups}, студентов: {students}, отметок: {marks}")
+
+def create_routers():
+    # роутеры проверяются по порядку, обработчики внутри роутера -- в порядке регистрации:
+    # команда, отправленная посреди диалога, достаётся обработчику его состояния
+    common = Router(name="common")
+    common.message.register(start_command, Command("start"))
+
+    # студенты: добавление, удаление, список и листание длинных ответов
+    students = Router(name="students")
+    students.message.register(add_student_start, Command("add_student"))
+    students.message.register(process_student_name, AddStudentStates.waiting_for_name)
+    students.message.register(remove_student_start, Command("remove_student"))
+    students.message.register(process_remove_student, RemoveStudentStates.waiting_for_name)
+    students.message.register(process_remove_full_name, RemoveStudentStates.waiting_for_full_name)
+    students.message.register(list_students, Command("list_students"))
+    students.callback_query.register(show_page, PageCallback.filter())
+
+    # отметки: перекличка, исправление, просмотр
+    marks = Router(name="marks")
+    marks.message.register(mark_attendance, Command("mark"))
+    marks.message.register(mark_bulk_start, Command("mark_bulk"))
+    marks.message.register(mark_inline_start, Command("mark_inline"))
+    marks.message.register(process_date_choice, AttendanceStates.waiting_for_date_choice)
+    marks.message.register(process_custom_date, AttendanceStates.waiting_for_custom_date)
+    marks.message.register(process_lesson, AttendanceStates.waiting_for_lesson)
+    marks.message.register(process_mark_attendance, AttendanceStates.marking_attendance)
+    marks.message.register(process_absentees, AttendanceStates.waiting_for_absentees)
+    marks.message.register(process_bulk_confirm, AttendanceStates.confirming_bulk)
+    marks.message.register(process_roll_call_text, AttendanceStates.roll_call)
+    marks.callback_query.register(process_roll_call, RollCallback.filter())
+    marks.message.register(edit_mark_start, Command("edit_mark"))
+    marks.message.register(edit_process_date_choice, EditMarkStates.waiting_for_date_choice)
+    marks.message.register(edit_process_custom_date, EditMarkStates.waiting_for_custom_date)
+    marks.message.register(edit_process_lesson, EditMarkStates.waiting_for_lesson)
+    marks.message.register(edit_process_student, EditMarkStates.waiting_for_student)
+    marks.message.register(edit_process_status, EditMarkStates.waiting_for_status)
+    marks.message.register(list_mark_start, Command("list_mark"))
+    marks.message.register(list_process_date_choice, ListMarkStates.waiting_for_date_choice)
+    marks.message.register(list_process_custom_date, ListMarkStates.waiting_for_custom_date)
+    marks.message.register(list_process_lesson, ListMarkStates.waiting_for_lesson)
+
+    # староста и название группы
+    group = Router(name="group")
+    group.message.register(set_headman_start, Command("set_headman"))
+    group.message.register(process_set_headman, SetHeadmanStates.waiting_for_name)
+    group.message.register(process_set_headman_full_name, SetHeadmanStates.waiting_for_full_name)
+    group.message.register(set_group_start, Command("set_group"))
+    group.message.register(process_group_name, SetGroupStates.waiting_for_group_name)
+    group.message.register(timetable_start, Command("timetable"))
+    group.message.register(process_timetable, TimetableStates.waiting_for_timetable)
+
+    # статистика, история и выгрузка
+    reports = Router(name="reports")
+    reports.message.register(show_attendance_stats, Command("stats"))
+    reports.message.register(process_stats_choice, StatsStates.waiting_for_choice)
+    reports.message.register(process_stats_surname, StatsStates.waiting_for_surname)
+    reports.message.register(history_start, Command("history"))
+    reports.message.register(history_process_choice, HistoryStates.waiting_for_choice)
+    reports.message.register(history_process_surname, HistoryStates.waiting_for_surname)
+    reports.message.register(history_process_period, HistoryStates.waiting_for_period)
+    reports.message.register(export_start, Command("export"))
+    reports.message.register(export_process_period, ExportStates.waiting_for_period)
+    reports.message.register(export_process_format, ExportStates.waiting_for_format)
+
+    # администрирование
+    admin = Router(name="admin")
+    admin.message.register(backup_command, Command("backup"))
+    admin.message.register(restore_check_command, Command("restore_check"))
+    return [common, students, marks, group, reports, admin]
+
+class App(NamedTuple):
+    settings: Settings
+    bot: Bot
+    dp: Dispatcher
+    db: Database
+    sender: SendScheduler
+    scheduler: Scheduler
+    metrics: object = None
+
+def create_app(settings, session=None):
+    # собирает независимый экземпляр бота; соединения с базами открываются при первом запросе,
+    # миграции применяются при запуске диспетчера (on_startup), поэтому в одном процессе
+    # можно держать несколько экземпляров, например с базами ":memory:".
+    # session -- сессия Bot API вместо AiohttpSession (в тестах и бенчмарках)
+    bot = Bot(token=settings.token, session=session)
+    # все запросы к Bot API идут через очередь с лимитами Telegram и повтором после 429
+    sender = SendScheduler()
+    bot.session.middleware(sender)
+    # при фоновом checkpoint commit записей его не делает
+    profile = ConnectionProfile(synchronous=settings.db_synchronous, cache_size_mb=settings.db_cache_mb,
+                                mmap_size_mb=settings.db_mmap_mb, busy_timeout_ms=settings.db_busy_timeout_ms,
+                                wal_autocheckpoint=0 if settings.checkpoint_interval else 1000)
+    db = Database(settings.db_path, profile=profile, readers=settings.db_readers)
+    backups = Backups(db, settings.backup_dir, settings.backup_keep)
+    # фоновые задачи запускаются вместе с диспетчером (on_startup) -- и в polling, и в webhook
+    scheduler = create_scheduler(settings, bot, db, backups)
+    # апдейты разных чатов обрабатываются параллельно, одного чата -- по очереди;
+    # db, pager и остальное из workflow data передаются обработчикам по именам аргументов
+    dp = ChatOrderedDispatcher(storage=SQLiteStorage(settings.fsm_db_path),
+                               max_concurrency=settings.max_concurrent_updates,
+                               settings=settings, db=db, pager=Pager(db), scheduler=scheduler, sender=sender,
+                               backups=backups, keyboard_editor=KeyboardEditor(), metrics_server=None)
+    dp.include_routers(*create_routers())
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+
+    metrics = None
+    if settings.metrics_port:
+        # сбор метрик подключается только при включённом сервере метрик
+        from metrics import Metrics, MetricsServer, instrument
+        metrics = Metrics()
+        instrument(metrics, dp, bot, db, sender, scheduler, STATE_GROUPS)
+        dp["metrics_server"] = MetricsServer(metrics, settings.metrics_host, settings.metrics_port)
+    return App(settings, bot, dp, db, sender, scheduler, metrics)
+
 async def main():
-    await dp.start_polling(bot)
+    settings = Settings.from_env()
+    app = create_app(settings)
+    if settings.mode == "webhook":
+        from webhook import run_webhook
+        await run_webhook(app.dp, app.bot, base_url=settings.webhook_url, path=settings.webhook_path,
+                          host=settings.webapp_host, port=settings.webapp_port, secret_token=settings.webhook_secret)
+    else:
+        # вебхук, оставшийся от запуска в другом режиме, мешает getUpdates
+        await app.bot.delete_webhook()
+        await app.dp.start_polling(app.bot)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,33 @@
+from collections import OrderedDict
+
+
+# кэш с загрузкой при промахе: значение по ключу (обычно chat_id) читается из БД один раз
+# и отдаётся из памяти, пока его явно не сбросят через invalidate()
+class ReadThroughCache:
+    def __init__(self, load, max_size=4096):
+        # load(key) -- корутина, которая читает значение из БД
+        self._load = load
+        self.max_size = max_size
+        self._values = OrderedDict()
+        self._versions = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key):
+        if key in self._values:
+            self.hits += 1
+            self._values.move_to_end(key)
+            return self._values[key]
+        self.misses += 1
+        version = self._versions.get(key, 0)
+        value = await self._load(key)
+        # пока шёл запрос, значение могло измениться --> такой результат не кэшируем
+        if self._versions.get(key, 0) == version:
+            self._values[key] = value
+            if len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+        return value
+
+    def invalidate(self, key):
+        self._values.pop(key, None)
+        self._versions[key] = self._versions.get(key, 0) + 1
@@ -0,0 +1,73 @@
+import asyncio
+from contextlib import asynccontextmanager, nullcontext
+
+from aiogram import Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+
+
+class KeyedLock:
+    # по замку asyncio.Lock на ключ; замок живёт, пока его кто-то держит или ждёт.
+    # asyncio.Lock отдаёт замок ожидающим по очереди --> задачи с одним ключом выполняются в порядке прихода
+    def __init__(self):
+        # ключ -> [замок, сколько задач его держат или ждут]
+        self._locks = {}
+
+    @asynccontextmanager
+    async def hold(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+# диспетчер, который обрабатывает апдейты разных чатов параллельно (не больше max_concurrency сразу),
+# а апдейты одного чата -- строго по очереди: иначе шаги диалога (например, перекличка по кнопкам)
+# одного чата могут перемешаться. очередь занимается до FSMContextMiddleware,
+# поэтому обработчик видит состояние, записанное предыдущим апдейтом чата
+class ChatOrderedDispatcher(Dispatcher):
+    def __init__(self, *args, max_concurrency=64, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_concurrency = max_concurrency
+        self._chat_locks = KeyedLock()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        # для метрик: апдейты в обработке и ожидающие своей очереди или свободного места
+        self.updates_in_progress = 0
+        self.updates_waiting = 0
+
+    @staticmethod
+    def _order_key(update):
+        # апдейты без чата (например, inline-запросы) упорядочиваются по пользователю
+        context = UserContextMiddleware.resolve_event_context(update)
+        if context.chat:
+            return "chat", context.chat.id
+        if context.user:
+            return "user", context.user.id
+        return None
+
+    async def feed_update(self, bot, update, **kwargs):
+        key = self._order_key(update)
+        self.updates_waiting += 1
+        started = False
+        try:
+            # место в общем лимите занимается только после очереди чата,
+            # чтобы апдейты, ждущие своей очереди, не занимали его
+            async with self._chat_locks.hold(key) if key else nullcontext(), self._slots:
+                self.updates_waiting -= 1
+                self.updates_in_progress += 1
+                started = True
+                return await super().feed_update(bot, update, **kwargs)
+        finally:
+            if started:
+                self.updates_in_progress -= 1
+            else:
+                self.updates_waiting -= 1
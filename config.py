@@ -0,0 +1,85 @@
+import os
+from dataclasses import dataclass
+
+
+# настройки бота; по умолчанию читаются из переменных окружения (и файла .env) в Settings.from_env()
+@dataclass
+class Settings:
+    token: str
+    # режим получения апдейтов: "polling" или "webhook"
+    mode: str = "polling"
+    webhook_url: str = None
+    webhook_path: str = "/webhook"
+    webhook_secret: str = None
+    webapp_host: str = "0.0.0.0"
+    webapp_port: int = 8080
+    # ":memory:" -- база в памяти, например для тестов
+    db_path: str = "group_journal.db"
+    fsm_db_path: str = "fsm_state.db"
+    # соединения с базой журнала (db.ConnectionProfile): synchronous ("NORMAL" или "FULL"), кэш страниц
+    # и mmap на соединение в МБ, ожидание блокировки в мс; db_readers -- потоков с соединениями только
+    # для чтения под отчёты (0 -- отчёты читаются через соединение писателя)
+    db_synchronous: str = "NORMAL"
+    db_cache_mb: int = 64
+    db_mmap_mb: int = 256
+    db_busy_timeout_ms: int = 5000
+    db_readers: int = 2
+    # раз в сколько секунд переносить WAL в файл базы фоновой задачей; 0 -- checkpoint делает сама SQLite
+    # при commit, когда WAL дорастает до 1000 страниц
+    checkpoint_interval: int = 60
+    # чат, которому достанутся данные журнала, созданного до поддержки нескольких групп
+    legacy_chat_id: int = None
+    # сколько апдейтов (из разных чатов) обрабатывается одновременно
+    max_concurrent_updates: int = 64
+    # метрики в формате Prometheus на http://metrics_host:metrics_port/metrics; без metrics_port выключены
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = None
+    # фоновые задачи, "ЧЧ:ММ" местного времени; пустая строка -- задача выключена:
+    # ночной пересчёт итогов за месяцы и напоминание старосте, если посещаемость за день не отмечена
+    snapshot_time: str = "03:00"
+    reminder_time: str = "18:00"
+    # снимки базы: каталог, сколько хранить, время ежедневного снимка ("" -- только по команде /backup)
+    backup_dir: str = "backups"
+    backup_keep: int = 7
+    backup_time: str = "04:00"
+    # id пользователей Telegram, которым доступны /backup и /restore_check
+    admin_ids: tuple = ()
+
+    @classmethod
+    def from_env(cls):
+        from dotenv import load_dotenv
+        load_dotenv()
+        optional_int = lambda name: int(os.environ[name]) if os.getenv(name) else None
+        mode = os.getenv("BOT_MODE", "polling")
+        if mode not in ("polling", "webhook"):
+            raise ValueError(f"BOT_MODE must be polling or webhook, got {mode!r}")
+        # без внешнего адреса Telegram некуда присылать апдейты
+        if mode == "webhook" and not os.getenv("WEBHOOK_URL"):
+            raise ValueError("WEBHOOK_URL must be set when BOT_MODE=webhook")
+        return cls(
+            token=os.getenv("BOT_TOKEN"),
+            mode=mode,
+            webhook_url=os.getenv("WEBHOOK_URL"),
+            webhook_path=os.getenv("WEBHOOK_PATH", "/webhook"),
+            webhook_secret=os.getenv("WEBHOOK_SECRET"),
+            webapp_host=os.getenv("WEBAPP_HOST", "0.0.0.0"),
+            webapp_port=int(os.getenv("WEBAPP_PORT", "8080")),
+            db_path=os.getenv("DB_PATH", "group_journal.db"),
+            fsm_db_path=os.getenv("FSM_DB_PATH", "fsm_state.db"),
+            db_synchronous=os.getenv("DB_SYNCHRONOUS", "NORMAL").upper(),
+            db_cache_mb=int(os.getenv("DB_CACHE_MB", "64")),
+            db_mmap_mb=int(os.getenv("DB_MMAP_MB", "256")),
+            db_busy_timeout_ms=int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000")),
+            db_readers=int(os.getenv("DB_READERS", "2")),
+            checkpoint_interval=int(os.getenv("CHECKPOINT_INTERVAL", "60")),
+            legacy_chat_id=optional_int("LEGACY_CHAT_ID"),
+            max_concurrent_updates=int(os.getenv("MAX_CONCURRENT_UPDATES", "64")),
+            metrics_host=os.getenv("METRICS_HOST", "127.0.0.1"),
+            metrics_port=optional_int("METRICS_PORT"),
+            snapshot_time=os.getenv("SNAPSHOT_TIME", "03:00"),
+            reminder_time=os.getenv("REMINDER_TIME", "18:00"),
+            backup_dir=os.getenv("BACKUP_DIR", "backups"),
+            backup_keep=int(os.getenv("BACKUP_KEEP", "7")),
+            backup_time=os.getenv("BACKUP_TIME", "04:00"),
+            admin_ids=tuple(int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()),
+        )
@@ -0,0 +1,710 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from calendar import monthrange
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import exporter
+from cache import ReadThroughCache
+from directory import StudentDirectory
+from migrations import migrate
+from timetable import Timetable
+
+
+def _shift_month(month, delta):
+    # "ГГГГ-ММ" +- delta месяцев
+    year, index = divmod(int(month[:4]) * 12 + int(month[5:7]) - 1 + delta, 12)
+    return f"{year:04d}-{index + 1:02d}"
+
+
+def _months_between(first, last):
+    return (int(last[:4]) - int(first[:4])) * 12 + int(last[5:7]) - int(first[5:7])
+
+
+def _full_months(date_from, date_to):
+    # первый и последний месяц ("ГГГГ-ММ"), целиком попавшие в период
+    first = date_from[:7] if date_from[8:] == "01" else _shift_month(date_from[:7], 1)
+    month_end = monthrange(int(date_to[:4]), int(date_to[5:7]))[1]
+    last = date_to[:7] if int(date_to[8:]) >= month_end else _shift_month(date_to[:7], -1)
+    return first, last
+
+
+def _month_runs(months):
+    # отсортированные месяцы --> [(первый, последний)] отрезков подряд идущих месяцев
+    runs = []
+    for month in months:
+        if runs and _shift_month(runs[-1][1], 1) == month:
+            runs[-1] = (runs[-1][0], month)
+        else:
+            runs.append((month, month))
+    return runs
+
+
+# настройки соединений с базой (PRAGMA), см. Settings.db_*
+@dataclass
+class ConnectionProfile:
+    # WAL: читатели не ждут писателя, а писатель -- читателей
+    journal_mode: str = "WAL"
+    # NORMAL: в режиме WAL fsync делается при checkpoint, а не при каждом commit; при отключении питания
+    # могут пропасть последние транзакции, но база остаётся целой. FULL -- fsync журнала при каждом commit
+    synchronous: str = "NORMAL"
+    # кэш страниц каждого соединения и отображение файла в память для чтения (0 -- без mmap), МБ
+    cache_size_mb: int = 64
+    mmap_size_mb: int = 256
+    # сколько ждать блокировку базы, прежде чем вернуть "database is locked"
+    busy_timeout_ms: int = 5000
+    # checkpoint при commit, когда в WAL набралось столько страниц; 0 -- только Database.checkpoint()
+    wal_autocheckpoint: int = 1000
+    # до какого размера усекается WAL после checkpoint, МБ
+    journal_size_limit_mb: int = 64
+
+    def apply(self, conn, read_only=False):
+        if not read_only:
+            conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            conn.execute(f"PRAGMA wal_autocheckpoint={self.wal_autocheckpoint}")
+            conn.execute(f"PRAGMA journal_size_limit={self.journal_size_limit_mb * 1024 * 1024}")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA cache_size={-self.cache_size_mb * 1024}")
+        conn.execute(f"PRAGMA mmap_size={self.mmap_size_mb * 1024 * 1024}")
+        conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+
+
+# слой доступа к данным журнала: одно долгоживущее соединение для записи,
+# все запросы выполняются в отдельных потоках, а не в цикле событий.
+# изменения идут через одну задачу-писателя: накопившиеся записи выполняются
+# одной транзакцией с одним fsync (group commit), а вызывающий получает результат после commit.
+# отчёты читаются через соединения только для чтения в readers потоках (_read) и не стоят в очереди
+# за записями; в WAL каждое чтение видит последнее закоммиченное состояние
+class Database:
+    def __init__(self, path, commit_delay=0.0, profile=None, readers=2):
+        self.path = path
+        self.profile = profile or ConnectionProfile()
+        # база в памяти видна только своему соединению --> без читателей
+        self.readers = 0 if path == ":memory:" else readers
+        # сколько ждать попутных записей перед транзакцией, секунды; при 0 в транзакцию попадает всё,
+        # что накопилось, пока шла предыдущая, и одиночная запись не ждёт
+        self.commit_delay = commit_delay
+        self._conn = None
+        # один поток --> запросы к соединению идут строго по очереди;
+        # создаётся при первом запросе, поэтому после close() базу можно открыть снова
+        self._executor = None
+        # потоки читателей и их соединения (по одному на поток)
+        self._read_executor = None
+        self._reader_local = threading.local()
+        self._reader_conns = []
+        # ожидающие записи (fn, args, future) и задача, которая их выполняет
+        self._pending_writes = []
+        self._writer = None
+        # выполняющиеся резервные копии (backup()): соединение не закрывается, пока они идут
+        self._backups = set()
+        # счётчики для метрик: записи и транзакции, в которых они выполнены
+        self.writes = 0
+        self.commits = 0
+        # размер WAL в страницах при последнем checkpoint()
+        self.wal_pages = 0
+        # названия групп и справочники студентов по чатам: читаются из БД один раз,
+        # сбрасываются при изменении названия или состава группы
+        self._group_names = ReadThroughCache(self._load_group_name)
+        self._directories = ReadThroughCache(self._load_directory)
+        # расписания групп с готовым поиском пары по времени
+        self._timetables = ReadThroughCache(self._load_timetable)
+        # версии данных чатов: растут при любом изменении журнала чата (для кэша страниц)
+        self._data_versions = {}
+        # metrics.Metrics: если задан, время и число строк каждого запроса попадают в метрики
+        self.metrics = None
+
+    async def _execute(self, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal-db")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.profile.apply(self._conn)
+        return self._conn
+
+    def _cursor(self):
+        cursor = self._connect().cursor()
+        return cursor if self.metrics is None else self.metrics.cursor(cursor)
+
+    async def _run(self, fn, *args):
+        # чтение (или запись вне очереди писателя) одной транзакцией
+        return await self._execute(self._call, fn, args)
+
+    def _call(self, fn, args):
+        cursor = self._cursor()
+        # контекстный менеджер соединения: commit при успехе, rollback при ошибке
+        try:
+            with self._conn:
+                return fn(cursor, *args)
+        finally:
+            if self.metrics is not None:
+                cursor.finish()
+
+    async def _read(self, fn, *args):
+        # чтение одной транзакцией на соединении читателя; без читателей -- как _run
+        if not self.readers:
+            return await self._run(fn, *args)
+        if self._read_executor is None:
+            self._read_executor = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="journal-read")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._read_call, fn, args)
+
+    def _read_call(self, fn, args):
+        conn = getattr(self._reader_local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self.profile.apply(conn, read_only=True)
+            self._reader_local.conn = conn
+            self._reader_conns.append(conn)
+        cursor = conn.cursor()
+        if self.metrics is not None:
+            cursor = self.metrics.cursor(cursor)
+        # явная транзакция: все запросы fn видят одно и то же состояние базы
+        conn.execute("BEGIN")
+        try:
+            return fn(cursor, *args)
+        finally:
+            conn.rollback()
+            if self.metrics is not None:
+                cursor.finish()
+
+    async def _write(self, fn, *args):
+        # ставит fn(cursor, *args) в очередь писателя; результат -- после commit транзакции с этой записью
+        future = asyncio.get_running_loop().create_future()
+        self._pending_writes.append((fn, args, future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop())
+        return await future
+
+    async def _write_loop(self):
+        while self._pending_writes:
+            if self.commit_delay:
+                await asyncio.sleep(self.commit_delay)
+            batch, self._pending_writes = self._pending_writes, []
+            try:
+                results = await self._execute(self._write_batch, [(fn, args) for fn, args, _ in batch])
+            except Exception as e:
+                # не удался сам commit --> не записано ничего из пачки
+                results = [(False, e)] * len(batch)
+            for (_, _, future), (ok, value) in zip(batch, results):
+                if future.done():  # вызывающий отменён, запись всё равно выполнена
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _write_batch(self, batch):
+        # все записи пачки -- одна транзакция; каждая в своей точке сохранения,
+        # чтобы ошибка одной записи не отменяла остальные
+        conn = self._connect()
+        cursor = self._cursor()
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for fn, args in batch:
+                conn.execute("SAVEPOINT write")
+                try:
+                    results.append((True, fn(cursor, *args)))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    results.append((False, e))
+                conn.execute("RELEASE write")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            if self.metrics is not None:
+                cursor.finish()
+        self.writes += len(batch)
+        self.commits += 1
+        return results
+
+    async def backup(self, path, pages=256, pause=0.001):
+        # копия базы в файл path через online backup API SQLite. копирует отдельный поток по pages страниц
+        # за шаг с паузой pause секунд между шагами: соединение занято только на время шага, поэтому
+        # запросы и записи журнала идут в промежутках; изменения, сделанные через это же соединение,
+        # попадают в копию сразу, и копирование не начинается заново. во время открытой транзакции
+        # записи шаг не выполняется (SQLITE_LOCKED) и повторяется, поэтому в копию не попадает
+        # незакоммиченное
+        conn = await self._execute(self._connect)
+        def _backup():
+            target = sqlite3.connect(path)
+            # копия сбрасывается на диск понемногу (примерно каждые 4 МБ) между шагами: один fsync
+            # всего файла в конце задержал бы fsync записей журнала, стоящих за ним в очереди диска
+            file = open(path, "rb+")
+            unsynced = 0
+            def _step(status, remaining, total):
+                nonlocal unsynced
+                unsynced += pages
+                if unsynced >= 1024:
+                    unsynced = 0
+                    os.fsync(file.fileno())
+                # пауза между шагами -- здесь; sleep у backup() -- только ожидание перед повтором
+                # шага, упёршегося в открытую транзакцию записи (по умолчанию 0.25 с)
+                time.sleep(pause)
+            try:
+                # сама SQLite копию не синхронизирует
+                target.execute("PRAGMA synchronous=OFF")
+                conn.backup(target, pages=pages, progress=_step)
+                # копия -- один самостоятельный файл, без -wal
+                target.execute("PRAGMA journal_mode=DELETE")
+                os.fsync(file.fileno())
+            finally:
+                target.close()
+                file.close()
+        # поток не прервать: при отмене вызывающего копирование доводится до конца, его ждёт close()
+        task = asyncio.ensure_future(asyncio.to_thread(_backup))
+        self._backups.add(task)
+        task.add_done_callback(self._backups.discard)
+        await asyncio.shield(task)
+
+    async def close(self):
+        # сначала дописываются ожидающие записи и завершаются резервные копии
+        while self._writer is not None and not self._writer.done():
+            await self._writer
+        await asyncio.gather(*self._backups, return_exceptions=True)
+        if self._read_executor is not None:
+            await asyncio.to_thread(self._read_executor.shutdown, wait=True)
+            self._read_executor = None
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns = []
+            self._reader_local = threading.local()
+        if self._executor is None:
+            return
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await self._execute(_close)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    async def checkpoint(self):
+        # переносит страницы из WAL в файл базы в отдельном соединении и потоке: PASSIVE не ждёт
+        # ни читателей, ни писателя, а commit записей не делает эту работу сам и не ждёт её fsync.
+        # страницы, которые ещё читают открытые транзакции, переносятся в следующий раз;
+        # возвращает (страниц в WAL, перенесено)
+        if self.path == ":memory:":
+            return 0, 0
+        def _checkpoint():
+            conn = sqlite3.connect(self.path)
+            try:
+                conn.execute(f"PRAGMA busy_timeout={self.profile.busy_timeout_ms}")
+                _, wal_pages, moved = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+                return wal_pages, moved
+            finally:
+                conn.close()
+        wal_pages, moved = await asyncio.to_thread(_checkpoint)
+        self.wal_pages = wal_pages
+        return wal_pages, moved
+
+    # инициализация базы данных: применение недостающих миграций схемы
+    async def init(self):
+        def _init(c):
+            return migrate(c.connection)
+        return await self._run(_init)
+
+    async def adopt_legacy_group(self, chat_id):
+        # передаёт данные, созданные до разделения по чатам (chat_id = 0), указанному чату.
+        # вызывается при каждом запуске, но срабатывает один раз: после передачи строк с chat_id = 0 не остаётся
+        def _adopt(c):
+            c.execute("""SELECT EXISTS (SELECT 1 FROM students WHERE chat_id = 0),
+                                EXISTS (SELECT 1 FROM group_info WHERE chat_id = 0)""")
+            legacy_students, legacy_name = c.fetchone()
+            if not (legacy_students or legacy_name):
+                return False
+            c.execute("SELECT 1 FROM students WHERE chat_id = ? LIMIT 1", (chat_id,))
+            if c.fetchone():
+                return False
+            c.execute("UPDATE students SET chat_id = ? WHERE chat_id = 0", (chat_id,))
+            if legacy_name:
+                c.execute("DELETE FROM group_info WHERE chat_id = ?", (chat_id,))
+                c.execute("UPDATE group_info SET chat_id = ? WHERE chat_id = 0", (chat_id,))
+            return True
+        adopted = await self._write(_adopt)
+        if adopted:
+            self._group_names.invalidate(chat_id)
+            self._invalidate_students(chat_id)
+        return adopted
+
+    def cache_stats(self):
+        # {кэш: (попадания, промахи)}
+        return {"group_name": (self._group_names.hits, self._group_names.misses),
+                "roster": (self._directories.hits, self._directories.misses),
+                "timetable": (self._timetables.hits, self._timetables.misses)}
+
+    # группа
+    async def get_group_name(self, chat_id):
+        return await self._group_names.get(chat_id)
+
+    async def _load_group_name(self, chat_id):
+        def _get(c):
+            c.execute("SELECT group_name FROM group_info WHERE chat_id = ?", (chat_id,))
+            row = c.fetchone()
+            return row[0] if row else 'Не указана'
+        return await self._read(_get)
+
+    async def set_group_name(self, chat_id, group_name):
+        def _set(c):
+            c.execute("""INSERT INTO group_info (chat_id, group_name) VALUES (?, ?)
+                         ON CONFLICT (chat_id) DO UPDATE SET group_name = excluded.group_name""",
+                      (chat_id, group_name))
+        await self._write(_set)
+        self._group_names.invalidate(chat_id)
+        self._changed(chat_id)
+
+    # расписание
+    async def get_timetable(self, chat_id):
+        # timetable.Timetable группы (пустое, если расписание не задано); без обращения к БД, пока его не меняли
+        return await self._timetables.get(chat_id)
+
+    async def _load_timetable(self, chat_id):
+        def _get(c):
+            c.execute("SELECT weekday, lesson, start, end FROM timetable WHERE chat_id = ?", (chat_id,))
+            return c.fetchall()
+        return Timetable(await self._read(_get))
+
+    async def set_timetable(self, chat_id, rows):
+        # заменяет расписание группы; rows: [(день недели, пара, начало, конец)], пустой список -- удаляет его
+        def _set(c):
+            c.execute("DELETE FROM timetable WHERE chat_id = ?", (chat_id,))
+            c.executemany("INSERT INTO timetable (chat_id, weekday, lesson, start, end) VALUES (?, ?, ?, ?, ?)",
+                          [(chat_id, *row) for row in rows])
+        await self._write(_set)
+        self._timetables.invalidate(chat_id)
+
+    # студенты
+    _SELECT_STUDENTS = "SELECT id, name, is_headman FROM students WHERE chat_id = ? ORDER BY name"
+
+    async def get_students(self, chat_id):
+        # список (id, name, is_headman), отсортированный по имени
+        return (await self.get_directory(chat_id)).students
+
+    async def get_students_page(self, chat_id, after, limit):
+        # до limit студентов, чьё имя идёт после after (keyset-пагинация по кэшированному списку)
+        return (await self.get_directory(chat_id)).page(after, limit)
+
+    async def get_directory(self, chat_id):
+        # справочник студентов группы для поиска по фамилии; без обращения к БД, пока состав не менялся
+        return await self._directories.get(chat_id)
+
+    async def _load_directory(self, chat_id):
+        def _get(c):
+            c.execute(self._SELECT_STUDENTS, (chat_id,))
+            return c.fetchall()
+        return StudentDirectory(await self._read(_get))
+
+    def _invalidate_students(self, chat_id):
+        self._directories.invalidate(chat_id)
+        self._changed(chat_id)
+
+    def data_version(self, chat_id):
+        return self._data_versions.get(chat_id, 0)
+
+    def _changed(self, chat_id):
+        self._data_versions[chat_id] = self._data_versions.get(chat_id, 0) + 1
+
+    async def add_students(self, chat_id, names):
+        # возвращает (добавленные, пропущенные)
+        def _add(c):
+            added = []
+            skipped = []
+            for name in names:
+                try:
+                    c.execute("INSERT INTO students (chat_id, name) VALUES (?, ?)", (chat_id, name))
+                    added.append(name)
+                except sqlite3.IntegrityError:
+                    skipped.append(name)
+            return added, skipped
+        result = await self._write(_add)
+        self._invalidate_students(chat_id)
+        return result
+
+    async def remove_student(self, chat_id, name):
+        # удаляет студента вместе с его отметками, возвращает True, если студент был найден
+        def _remove(c):
+            c.execute("SELECT id FROM students WHERE chat_id = ? AND name = ?", (chat_id, name))
+            row = c.fetchone()
+            if not row:
+                return False
+            c.execute("DELETE FROM attendance WHERE student_id = ?", (row[0],))
+            c.execute("DELETE FROM students WHERE id = ?", (row[0],))
+            return True
+        removed = await self._write(_remove)
+        self._invalidate_students(chat_id)
+        return removed
+
+    async def set_headman(self, chat_id, name):
+        def _set(c):
+            c.execute("UPDATE students SET is_headman = 0 WHERE chat_id = ? AND is_headman = 1", (chat_id,))
+            c.execute("UPDATE students SET is_headman = 1 WHERE chat_id = ? AND name = ?", (chat_id, name))
+        await self._write(_set)
+        self._invalidate_students(chat_id)
+
+    # посещаемость; status -- код statuses.Status
+    _UPSERT_MARK = """
+        INSERT INTO attendance (student_id, date, lesson, status) VALUES (?, ?, ?, ?)
+        ON CONFLICT (student_id, date, lesson) DO UPDATE SET status = excluded.status
+    """
+
+    # chat_id в методах отметок -- чат студента, его версия данных сбрасывается после записи
+    async def mark(self, chat_id, student_id, date, lesson, status):
+        # ставит или перезаписывает отметку одним запросом
+        def _mark(c):
+            c.execute(self._UPSERT_MARK, (student_id, date, lesson, status))
+        await self._write(_mark)
+        self._changed(chat_id)
+
+    async def mark_lesson(self, chat_id, date, lesson, marks):
+        # отметки всей пары [(student_id, status), ...] одной транзакцией
+        def _mark(c):
+            c.executemany(self._UPSERT_MARK, [(student_id, date, lesson, status) for student_id, status in marks])
+        await self._write(_mark)
+        self._changed(chat_id)
+
+    async def edit_mark(self, chat_id, student_id, date, lesson, status):
+        # как mark(), но возвращает предыдущий статус (None, если отметки не было)
+        def _edit(c):
+            c.execute("SELECT status FROM attendance WHERE student_id = ? AND date = ? AND lesson = ?",
+                      (student_id, date, lesson))
+            row = c.fetchone()
+            c.execute(self._UPSERT_MARK, (student_id, date, lesson, status))
+            return row[0] if row else None
+        previous = await self._write(_edit)
+        self._changed(chat_id)
+        return previous
+
+    async def get_lesson_attendance_page(self, chat_id, date, lesson, after, limit):
+        # список (name, status, is_headman) на указанную пару для до limit студентов с именем после after
+        def _get(c):
+            c.execute("""
+                SELECT s.name, a.status, s.is_headman
+                FROM students s
+                LEFT JOIN attendance a ON s.id = a.student_id
+                AND a.date = ? AND a.lesson = ?
+                WHERE s.chat_id = ? AND s.name > ?
+                ORDER BY s.name
+                LIMIT ?
+            """, (date, lesson, chat_id, after, limit))
+            return c.fetchall()
+        return await self._read(_get)
+
+    # статистика: готовые счётчики из attendance_counters, без обхода attendance
+    async def get_group_stats_page(self, chat_id, after, limit):
+        # до limit строк (name, is_headman, total, present, absent) с именем после after
+        def _get(c):
+            c.execute("""
+                SELECT s.name, s.is_headman,
+                       COALESCE(ac.total, 0), COALESCE(ac.present, 0), COALESCE(ac.absent, 0)
+                FROM students s
+                LEFT JOIN attendance_counters ac ON ac.student_id = s.id
+                WHERE s.chat_id = ? AND s.name > ?
+                ORDER BY s.name
+                LIMIT ?
+            """, (chat_id, after, limit))
+            return c.fetchall()
+        return await self._read(_get)
+
+    async def get_group_stats_summary(self, chat_id, limit):
+        # сводка по группе: (наибольшее число пропусков, [(name, is_headman)] с таким числом пропусков,
+        # сколько их всего, [(name, is_headman)] без пропусков, сколько их всего); списки -- до limit имён
+        def _get(c):
+            c.execute("""
+                SELECT COALESCE(MAX(ac.absent), 0), COALESCE(SUM(ac.total > 0 AND ac.absent = 0), 0)
+                FROM students s
+                JOIN attendance_counters ac ON ac.student_id = s.id
+                WHERE s.chat_id = ?
+            """, (chat_id,))
+            max_absent, no_absences_count = c.fetchone()
+            select_names = """
+                SELECT s.name, s.is_headman
+                FROM students s
+                JOIN attendance_counters ac ON ac.student_id = s.id
+                WHERE s.chat_id = ? AND ac.total > 0 AND ac.absent = ?
+                ORDER BY s.name
+                LIMIT ?
+            """
+            most_absent = []
+            most_absent_count = 0
+            if max_absent > 0:
+                c.execute(select_names, (chat_id, max_absent, limit))
+                most_absent = c.fetchall()
+                c.execute("""SELECT COUNT(*) FROM students s JOIN attendance_counters ac ON ac.student_id = s.id
+                             WHERE s.chat_id = ? AND ac.absent = ?""", (chat_id, max_absent))
+                most_absent_count = c.fetchone()[0]
+            c.execute(select_names, (chat_id, 0, limit))
+            return max_absent, most_absent, most_absent_count, c.fetchall(), no_absences_count
+        return await self._read(_get)
+
+    async def get_student_stats(self, student_id):
+        # (total, present, absent) для одного студента
+        def _get(c):
+            c.execute("SELECT total, present, absent FROM attendance_counters WHERE student_id = ?",
+                      (student_id,))
+            return c.fetchone() or (0, 0, 0)
+        return await self._read(_get)
+
+    # история за период: выборка по диапазону первичного ключа (student_id, date, lesson),
+    # поэтому время зависит от числа отметок в периоде, а не от размера всего журнала.
+    # страницы -- по дням: до limit дней с датой после after (или с date_from на первой странице)
+    @staticmethod
+    def _history_lower_bound(date_from, after):
+        return ("a.date > ?", after) if after >= date_from else ("a.date >= ?", date_from)
+
+    async def get_group_history_page(self, chat_id, date_from, date_to, after, limit):
+        # [(date, [(lesson, present, total), ...]), ...] по всей группе
+        condition, lower = self._history_lower_bound(date_from, after)
+        def _get(c):
+            # дни страницы -- по индексу (date, lesson) от курсора: чтение останавливается на limit-м дне.
+            # индекс хранит и student_id (ключ таблицы), поэтому отметки чужих групп отсеиваются без чтения строк
+            days = [date for date, in c.execute(f"""
+                SELECT DISTINCT a.date
+                FROM attendance a INDEXED BY idx_attendance_date_lesson
+                WHERE {condition} AND a.date <= ?
+                  AND a.student_id IN (SELECT id FROM students WHERE chat_id = ?)
+                ORDER BY a.date
+                LIMIT ?
+            """, (lower, date_to, chat_id, limit))]
+            if not days:
+                return []
+            # итоги по парам -- только за дни страницы. CROSS JOIN фиксирует порядок:
+            # студенты группы --> их отметки за эти дни по первичному ключу
+            c.execute(f"""
+                SELECT a.date, a.lesson, SUM(a.status IN (1, 3)), COUNT(*)
+                FROM students s CROSS JOIN attendance a ON a.student_id = s.id
+                WHERE s.chat_id = ? AND {condition} AND a.date <= ?
+                GROUP BY a.date, a.lesson
+                ORDER BY a.date, a.lesson
+            """, (chat_id, lower, days[-1]))
+            return self._group_by_day(c, limit)
+        return await self._read(_get)
+
+    async def get_student_history_page(self, student_id, date_from, date_to, after, limit):
+        # [(date, [(lesson, status), ...]), ...] одного студента
+        condition, lower = self._history_lower_bound(date_from, after)
+        def _get(c):
+            c.execute(f"""
+                SELECT a.date, a.lesson, a.status
+                FROM attendance a
+                WHERE a.student_id = ? AND {condition} AND a.date <= ?
+                ORDER BY a.date, a.lesson
+            """, (student_id, lower, date_to))
+            return self._group_by_day(c, limit)
+        return await self._read(_get)
+
+    @staticmethod
+    def _group_by_day(rows, limit):
+        # строки (date, lesson, ...) --> до limit дней; остальные строки не читаются
+        days = []
+        for date, *lesson in rows:
+            if not days or days[-1][0] != date:
+                if len(days) == limit:
+                    break
+                days.append((date, []))
+            days[-1][1].append(tuple(lesson))
+        return days
+
+    async def get_history_totals(self, chat_id, student_id, date_from, date_to):
+        # (отметок, присутствий) за период: по студенту, если student_id задан, иначе по группе.
+        # месяцы, целиком попавшие в период, берутся из итогов attendance_monthly (если они посчитаны),
+        # остальные дни -- из отметок, по диапазону первичного ключа для каждого студента
+        first, last = _full_months(date_from, date_to)
+        def _get(c):
+            if student_id:
+                student_ids = [student_id]
+            else:
+                c.execute("SELECT id FROM students WHERE chat_id = ?", (chat_id,))
+                student_ids = [row[0] for row in c.fetchall()]
+            # по студенту: число посчитанных месяцев, первый и последний из них и их сумма
+            c.execute(f"""
+                SELECT m.student_id, COUNT(*), MIN(m.month), MAX(m.month), SUM(m.total), SUM(m.present)
+                FROM {"attendance_monthly m WHERE m.student_id = ?" if student_id else
+                      "students s CROSS JOIN attendance_monthly m ON m.student_id = s.id WHERE s.chat_id = ?"}
+                  AND m.month BETWEEN ? AND ?
+                GROUP BY m.student_id
+            """, (student_id or chat_id, first, last))
+            monthly = {row[0]: row[1:] for row in c.fetchall()}
+
+            total = present = 0
+            for student in student_ids:
+                runs = []
+                if student in monthly:
+                    count, first_month, last_month, month_total, month_present = monthly[student]
+                    total += month_total
+                    present += month_present
+                    runs = [(first_month, last_month)]
+                    if count != _months_between(first_month, last_month) + 1:
+                        # посчитаны не все месяцы подряд (итог удалён после правки): промежутки между ними
+                        c.execute("""SELECT month FROM attendance_monthly
+                                     WHERE student_id = ? AND month BETWEEN ? AND ?
+                                     ORDER BY month""", (student, first, last))
+                        runs = _month_runs([row[0] for row in c.fetchall()])
+                # отметки дней периода вне посчитанных месяцев
+                lower = date_from
+                for run_first, run_last in runs + [(None, None)]:
+                    upper = date_to if run_first is None else f"{_shift_month(run_first, -1)}-31"
+                    if run_first is None or lower < f"{run_first}-01":
+                        c.execute("""SELECT COUNT(*), COALESCE(SUM(status IN (1, 3)), 0) FROM attendance
+                                     WHERE student_id = ? AND date BETWEEN ? AND ?""", (student, lower, upper))
+                        gap_total, gap_present = c.fetchone()
+                        total += gap_total
+                        present += gap_present
+                    if run_last is not None:
+                        lower = f"{_shift_month(run_last, 1)}-01"
+            return total, present
+        return await self._read(_get)
+
+    # ночные итоги за месяцы и напоминания старостам
+    async def get_chat_ids(self):
+        def _get(c):
+            c.execute("SELECT DISTINCT chat_id FROM students")
+            return [row[0] for row in c.fetchall()]
+        return await self._read(_get)
+
+    async def snapshot_months(self, chat_id, before):
+        # считает недостающие итоги attendance_monthly студентов чата за месяцы до before (ГГГГ-ММ-ДД);
+        # возвращает число посчитанных итогов
+        def _snapshot(c):
+            c.execute("""
+                INSERT INTO attendance_monthly (student_id, month, total, present)
+                SELECT a.student_id, substr(a.date, 1, 7), COUNT(*), SUM(a.status IN (1, 3))
+                FROM students s CROSS JOIN attendance a ON a.student_id = s.id
+                WHERE s.chat_id = ? AND a.date < ? AND NOT EXISTS (
+                    SELECT 1 FROM attendance_monthly m
+                    WHERE m.student_id = a.student_id AND m.month = substr(a.date, 1, 7))
+                GROUP BY a.student_id, substr(a.date, 1, 7)
+            """, (chat_id, before))
+            return c.rowcount
+        return await self._write(_snapshot)
+
+    async def get_unmarked_chats(self, date, active_since):
+        # [(chat_id, ФИО старосты или None)] чатов, где отмечали посещаемость с active_since,
+        # но ещё ни разу -- за date
+        def _get(c):
+            c.execute("""
+                SELECT s.chat_id,
+                       (SELECT h.name FROM students h WHERE h.chat_id = s.chat_id AND h.is_headman = 1)
+                FROM attendance a JOIN students s ON s.id = a.student_id
+                WHERE a.date >= ? AND a.date < ? AND s.chat_id NOT IN (
+                    SELECT st.chat_id FROM attendance today JOIN students st ON st.id = today.student_id
+                    WHERE today.date = ?)
+                GROUP BY s.chat_id
+            """, (active_since, date, date))
+            return c.fetchall()
+        return await self._read(_get)
+
+    # выгрузка
+    async def export_attendance(self, chat_id, date_from, date_to, fmt):
+        # матрица посещаемости за период во временном файле (fmt: "csv" или "xlsx");
+        # файл формируется в потоке читателя построчно, без загрузки всей таблицы в память
+        def _export(c):
+            return exporter.export(c, chat_id, date_from, date_to, fmt)
+        return await self._read(_export)
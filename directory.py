@@ -0,0 +1,66 @@
+import string
+from bisect import bisect_left, bisect_right
+
+
+def normalize_name(name):
+    # поиск без учёта регистра и различия ё/е
+    return name.strip().casefold().replace("ё", "е")
+
+
+# порядок имён как в SQLite (COLLATE NOCASE): без учёта регистра только латиница
+_NOCASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def sqlite_nocase(name):
+    return name.translate(_NOCASE)
+
+
+# справочник студентов группы с отсортированным индексом по нормализованному имени:
+# поиск по началу фамилии/ФИО -- двоичный поиск вместо обхода всего списка
+class StudentDirectory:
+    def __init__(self, students):
+        # students: [(id, name, is_headman)], отсортированные по имени (ORDER BY name)
+        self.students = list(students)
+        index = sorted((normalize_name(name), i) for i, (_, name, _) in enumerate(self.students))
+        self._keys = [key for key, _ in index]
+        self._positions = [i for _, i in index]
+        self._order_keys = [sqlite_nocase(name) for _, name, _ in self.students]
+
+    def __len__(self):
+        return len(self.students)
+
+    def _prefix_range(self, prefix):
+        lo = bisect_left(self._keys, prefix)
+        hi = bisect_left(self._keys, prefix + "\U0010ffff", lo)
+        return lo, hi
+
+    def find(self, text):
+        # студенты, чьё ФИО начинается с text; если таких несколько, а среди них есть
+        # точное совпадение ФИО или фамилии ("Петров" при наличии "Петрова"), остаются только они
+        prefix = normalize_name(text)
+        if not prefix:
+            return []
+        lo, hi = self._prefix_range(prefix)
+        positions = self._positions[lo:hi]
+        if len(positions) > 1:
+            exact_lo = bisect_left(self._keys, prefix, lo, hi)
+            exact_hi = exact_lo
+            while exact_hi < hi and self._keys[exact_hi] == prefix:
+                exact_hi += 1
+            surname_lo, surname_hi = self._prefix_range(prefix + " ")
+            exact = self._positions[exact_lo:exact_hi] + self._positions[surname_lo:surname_hi]
+            positions = exact or positions
+        return [self.students[i] for i in sorted(positions)]
+
+    def page(self, after, limit):
+        # до limit студентов, чьё имя идёт после after -- как WHERE name > ? ORDER BY name LIMIT ?
+        start = bisect_right(self._order_keys, sqlite_nocase(after))
+        return self.students[start:start + limit]
+
+    def get(self, name):
+        # студент с точно таким ФИО или None
+        key = normalize_name(name)
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self.students[self._positions[i]]
+        return None
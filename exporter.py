@@ -0,0 +1,167 @@
+import codecs
+import csv
+import io
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+
+from aiogram.types import InputFile
+
+from statuses import ATTENDED, EXPORT_MARKS
+
+# выгрузка журнала: матрица студенты x (дата, пара).
+# строки формируются генератором по упорядоченному курсору и сразу пишутся во временный файл,
+# поэтому в памяти одновременно находится только одна строка матрицы
+SPOOL_SIZE = 1024 * 1024
+
+
+def iter_matrix(c, chat_id, date_from, date_to):
+    # первая строка -- заголовок, далее по строке на студента
+    c.execute("""
+        SELECT DISTINCT a.date, a.lesson
+        FROM students s
+        JOIN attendance a ON a.student_id = s.id AND a.date BETWEEN ? AND ?
+        WHERE s.chat_id = ?
+        ORDER BY a.date, a.lesson
+    """, (date_from, date_to, chat_id))
+    columns = {column: i for i, column in enumerate(c.fetchall())}
+    yield (["Студент"]
+           + [f"{date[8:10]}.{date[5:7]}.{date[0:4]} ({lesson})" for date, lesson in columns]
+           + ["Пропусков", "Посещаемость, %"])
+
+    c.execute("""
+        SELECT s.id, s.name, a.date, a.lesson, a.status
+        FROM students s
+        LEFT JOIN attendance a ON a.student_id = s.id AND a.date BETWEEN ? AND ?
+        WHERE s.chat_id = ?
+        ORDER BY s.name, s.id, a.date, a.lesson
+    """, (date_from, date_to, chat_id))
+    current_id = None
+    row = None
+    for student_id, name, date, lesson, status in c:
+        if student_id != current_id:
+            if row is not None:
+                yield _finish_row(row)
+            current_id = student_id
+            row = [name] + [None] * len(columns)
+        if date is not None:
+            row[columns[(date, lesson)] + 1] = status
+    if row is not None:
+        yield _finish_row(row)
+
+
+def _finish_row(row):
+    # коды статусов --> отметки, в конце -- число пропусков и процент посещаемости
+    statuses = [status for status in row[1:] if status is not None]
+    absent = sum(1 for status in statuses if status not in ATTENDED)
+    percent = round((len(statuses) - absent) / len(statuses) * 100, 1) if statuses else ""
+    return [row[0]] + [EXPORT_MARKS.get(status, "") for status in row[1:]] + [absent, percent]
+
+
+def write_csv(rows, out):
+    # utf-8 с BOM, чтобы Excel правильно открыл кириллицу
+    out.write(codecs.BOM_UTF8)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    for row in rows:
+        writer.writerow(row)
+        out.write(buffer.getvalue().encode("utf-8"))
+        buffer.seek(0)
+        buffer.truncate()
+
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Посещаемость" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _column_letter(index):
+    letters = ""
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(ord("A") + rest) + letters
+    return letters
+
+
+def _xlsx_cell(ref, value):
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if value == "":
+        return ""
+    return f'<c r="{ref}" t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+def write_xlsx(rows, out):
+    # минимальная книга Excel без сторонних библиотек: лист пишется в zip построчно
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as book:
+        for name, content in _XLSX_PARTS.items():
+            book.writestr(name, content)
+        with book.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                        b'<sheetData>')
+            letters = []
+            for r, row in enumerate(rows, start=1):
+                while len(letters) < len(row):
+                    letters.append(_column_letter(len(letters)))
+                cells = "".join(_xlsx_cell(f"{letters[i]}{r}", value) for i, value in enumerate(row))
+                sheet.write(f'<row r="{r}">{cells}</row>'.encode("utf-8"))
+            sheet.write(b"</sheetData></worksheet>")
+
+
+WRITERS = {"csv": write_csv, "xlsx": write_xlsx}
+
+
+def export(c, chat_id, date_from, date_to, fmt):
+    # возвращает временный файл с выгрузкой, указатель в начале файла
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    WRITERS[fmt](iter_matrix(c, chat_id, date_from, date_to), out)
+    out.seek(0)
+    return out
+
+
+class SpooledInputFile(InputFile):
+    # отправка временного файла в Telegram по частям. каждая попытка читает файл с начала:
+    # после 429 SendScheduler отправляет тот же запрос ещё раз. файл закрывает вызывающий после отправки
+    def __init__(self, file, filename, chunk_size=64 * 1024):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot):
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
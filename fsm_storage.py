@@ -0,0 +1,167 @@
+import asyncio
+import copy
+import dataclasses
+import json
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+logger = logging.getLogger(__name__)
+
+
+# хранилище состояний FSM в SQLite: переживает перезапуск бота.
+# все чтения идут из памяти, а изменения копятся и записываются на диск
+# одной транзакцией раз в flush_interval секунд и при закрытии хранилища
+class SQLiteStorage(BaseStorage):
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._conn = None
+        self._executor = None
+        # StorageKey -> [state, data]
+        self._sessions = {}
+        self._dirty = set()
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+
+    @staticmethod
+    def _encode_key(key):
+        return json.dumps(dataclasses.astuple(key), ensure_ascii=False)
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS fsm_sessions (
+                                  key TEXT PRIMARY KEY,
+                                  state TEXT,
+                                  data TEXT)''')
+        return self._conn
+
+    async def _io(self, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-storage")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def _ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+
+            def _load():
+                return self._connect().execute("SELECT key, state, data FROM fsm_sessions").fetchall()
+
+            for key, state, data in await self._io(_load):
+                self._sessions[StorageKey(*json.loads(key))] = [state, json.loads(data)]
+            self._loaded = True
+
+    def _touch(self, key):
+        self._dirty.add(key)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                # изменения остались в _dirty -- попробуем ещё раз на следующем круге
+                logger.exception("Failed to flush FSM sessions")
+
+    async def flush(self):
+        # записывает все накопленные изменения одной транзакцией
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            pending = set(self._dirty)
+            self._dirty.clear()
+            upserts = []
+            deletes = []
+            for key in pending:
+                state, data = self._sessions.get(key, (None, {}))
+                if state is None and not data:
+                    deletes.append((self._encode_key(key),))
+                else:
+                    upserts.append((self._encode_key(key), state, json.dumps(data, ensure_ascii=False)))
+
+            def _write():
+                conn = self._connect()
+                with conn:
+                    conn.executemany("""INSERT INTO fsm_sessions (key, state, data) VALUES (?, ?, ?)
+                                        ON CONFLICT (key) DO UPDATE SET state = excluded.state, data = excluded.data""",
+                                     upserts)
+                    conn.executemany("DELETE FROM fsm_sessions WHERE key = ?", deletes)
+
+            try:
+                await self._io(_write)
+            except BaseException:
+                # запись не удалась -- ключи снова грязные, их сохранит следующий flush
+                self._dirty |= pending
+                raise
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        await self._ensure_loaded()
+        state = state.state if isinstance(state, State) else state
+        session = self._sessions.setdefault(key, [None, {}])
+        if session[0] == state:
+            return
+        session[0] = state
+        self._cleanup(key)
+        self._touch(key)
+
+    async def get_state(self, key: StorageKey):
+        await self._ensure_loaded()
+        session = self._sessions.get(key)
+        return session[0] if session else None
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        await self._ensure_loaded()
+        session = self._sessions.setdefault(key, [None, {}])
+        if session[1] == data:
+            return
+        # глубокие копии: вложенные списки, изменённые обработчиком на месте, иначе совпали бы
+        # с сохранёнными и изменение не попало бы на диск
+        session[1] = copy.deepcopy(data)
+        self._cleanup(key)
+        self._touch(key)
+
+    async def get_data(self, key: StorageKey):
+        await self._ensure_loaded()
+        session = self._sessions.get(key)
+        return copy.deepcopy(session[1]) if session else {}
+
+    def _cleanup(self, key):
+        # завершённые сессии не держим в памяти
+        if self._sessions[key] == [None, {}]:
+            del self._sessions[key]
+
+    def active_states(self):
+        # текущие состояния всех активных сессий
+        return [state for state, _ in self._sessions.values() if state is not None]
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+        await self._io(_close)
+        self._executor.shutdown(wait=True)
+        self._executor = None
@@ -0,0 +1,61 @@
+import logging
+from datetime import datetime, timedelta
+
+from aiogram.exceptions import TelegramAPIError
+
+from scheduler import Scheduler, daily, every
+from sender import bulk_priority
+
+logger = logging.getLogger(__name__)
+
+# напоминание получают чаты, где отмечали посещаемость за последние REMINDER_ACTIVE_DAYS дней
+REMINDER_ACTIVE_DAYS = 14
+
+
+async def snapshot_stats(db):
+    # итоги закрытых месяцев (attendance_monthly) для итогов за период в /history;
+    # по транзакции на чат, чтобы отметки других чатов не ждали пересчёта всего журнала
+    before = f"{datetime.now():%Y-%m}-01"
+    months = 0
+    for chat_id in await db.get_chat_ids():
+        months += await db.snapshot_months(chat_id, before)
+    logger.info("Monthly attendance totals: %d computed", months)
+
+
+async def remind_headmen(bot, db):
+    # напоминание в чат группы, если сегодня посещаемость ещё не отмечали
+    today = datetime.now()
+    chats = await db.get_unmarked_chats(f"{today:%Y-%m-%d}",
+                                        f"{today - timedelta(days=REMINDER_ACTIVE_DAYS):%Y-%m-%d}")
+    # рассылка не должна задерживать ответы на сообщения
+    with bulk_priority():
+        for chat_id, headman in chats:
+            text = ((f"{headman} (📋), посещаемость" if headman else "Посещаемость")
+                    + " за сегодня ещё не отмечена. Отметить: /mark или /mark_bulk.")
+            try:
+                await bot.send_message(chat_id, text)
+            except TelegramAPIError as e:
+                # бота удалили из чата и т. п.
+                logger.warning("Reminder to chat %s failed: %s", chat_id, e)
+
+
+async def checkpoint(db):
+    # перенос WAL в файл базы вне записей журнала (Database.checkpoint)
+    wal_pages, moved = await db.checkpoint()
+    if moved < wal_pages:
+        logger.debug("WAL checkpoint: %d of %d pages, the rest is still being read", moved, wal_pages)
+
+
+def create_scheduler(settings, bot, db, backups):
+    scheduler = Scheduler()
+    if settings.snapshot_time:
+        scheduler.add("snapshot_stats", lambda: snapshot_stats(db), daily(settings.snapshot_time), jitter=600)
+    if settings.reminder_time:
+        # в воскресенье пар нет
+        scheduler.add("remind_headmen", lambda: remind_headmen(bot, db),
+                      daily(settings.reminder_time, weekdays=range(6)), jitter=60)
+    if settings.backup_time:
+        scheduler.add("backup", backups.snapshot, daily(settings.backup_time), jitter=600)
+    if settings.checkpoint_interval:
+        scheduler.add("checkpoint", lambda: checkpoint(db), every(settings.checkpoint_interval))
+    return scheduler
@@ -0,0 +1,339 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Tally
+from collections import defaultdict
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import CallbackQuery, Message
+
+logger = logging.getLogger(__name__)
+
+# границы корзин гистограмм задержек, секунды
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _series(name, labels, values, value, extra=""):
+    pairs = [f'{label}="{_escape(v)}"' for label, v in zip(labels, values)]
+    if extra:
+        pairs.append(extra)
+    return f"{name}{{{','.join(pairs)}}} {value:g}" if pairs else f"{name} {value:g}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = defaultdict(float)
+
+    def inc(self, *values, amount=1):
+        self.values[values] += amount
+
+    def lines(self):
+        for values, value in sorted(self.values.items()):
+            yield _series(self.name, self.labels, values, value)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # значения меток -> [число наблюдений по корзинам (последняя -- +Inf), сумма]
+        self.values = {}
+
+    def observe(self, value, *values):
+        series = self.values.get(values)
+        if series is None:
+            series = self.values[values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def lines(self):
+        for values, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                yield _series(f"{self.name}_bucket", self.labels, values, cumulative,
+                              f'le="{bound if bound == "+Inf" else f"{bound:g}"}"')
+            yield _series(f"{self.name}_sum", self.labels, values, total)
+            yield _series(f"{self.name}_count", self.labels, values, cumulative)
+
+
+class Collected:
+    # значения читаются в момент запроса метрик: collect() -> {(значения меток): число}
+    def __init__(self, kind, name, help, labels, collect):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+
+    def lines(self):
+        for values, value in sorted(self.collect().items()):
+            yield _series(self.name, self.labels, values, value)
+
+
+# реестр метрик бота; отдаётся в текстовом формате Prometheus
+class Metrics:
+    def __init__(self):
+        self.handler_seconds = Histogram("journal_handler_seconds", "Handler latency by command and FSM state",
+                                         ("command", "state"))
+        self.handler_errors = Counter("journal_handler_errors_total", "Handler exceptions by command and FSM state",
+                                      ("command", "state", "error"))
+        self.sql_seconds = Histogram("journal_sql_seconds", "SQL statement time, including fetching rows",
+                                     ("statement",))
+        self.sql_rows = Counter("journal_sql_rows_total", "Rows returned or changed by SQL statements",
+                                ("statement",))
+        self.telegram_requests = Counter("journal_telegram_requests_total", "Bot API requests by method",
+                                         ("method",))
+        self.telegram_errors = Counter("journal_telegram_errors_total", "Bot API errors by method and error",
+                                       ("method", "error"))
+        self._metrics = [self.handler_seconds, self.handler_errors, self.sql_seconds, self.sql_rows,
+                         self.telegram_requests, self.telegram_errors]
+        # время запросов пишут и поток писателя, и потоки читателей базы
+        self.sql_lock = threading.Lock()
+
+    def collect(self, kind, name, help, labels, collect):
+        self._metrics.append(Collected(kind, name, help, labels, collect))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                if metric is self.sql_seconds or metric is self.sql_rows:
+                    # потоки базы добавляют в них новые запросы прямо во время сбора
+                    with self.sql_lock:
+                        lines.extend(metric.lines())
+                else:
+                    lines.extend(metric.lines())
+            except Exception:
+                # сломанный сборщик не должен ронять остальные метрики
+                logger.exception("Failed to collect %s", metric.name)
+        return "\n".join(lines) + "\n"
+
+    def cursor(self, cursor):
+        return TimedCursor(cursor, self)
+
+
+# курсор sqlite3, который замеряет каждый запрос: от execute до последней прочитанной строки
+class TimedCursor:
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+        self._statement = None
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _timed(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._elapsed += time.perf_counter() - start
+
+    def execute(self, sql, params=()):
+        self.finish()
+        self._statement = sql
+        self._timed(self._cursor.execute, sql, params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self.finish()
+        self._statement = sql
+        self._timed(self._cursor.executemany, sql, seq_of_params)
+        return self
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        self._rows += row is not None
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(self._cursor.fetchmany, size or self._cursor.arraysize)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self._timed(next, self._cursor)
+        self._rows += 1
+        return row
+
+    def finish(self):
+        # учитывает предыдущий запрос; для SELECT строки -- прочитанные, для изменений -- rowcount
+        if self._statement is None:
+            return
+        statement = " ".join(self._statement.split())
+        rows = self._rows if self._cursor.description is not None else max(self._cursor.rowcount, 0)
+        with self._metrics.sql_lock:
+            self._metrics.sql_seconds.observe(self._elapsed, statement)
+            self._metrics.sql_rows.inc(statement, amount=rows)
+        self._statement = None
+        self._elapsed = 0.0
+        self._rows = 0
+
+
+# метка для команд и callback-данных, которых бот не знает: текст пишет пользователь,
+# и число рядов метрик не должно от него зависеть
+OTHER = "other"
+
+
+def _known_labels(dp):
+    # команды ("/mark") и префиксы callback-данных ("page:"), на которые зарегистрированы обработчики
+    labels = set()
+    for router in dp.chain_tail:
+        for observer in (router.message, router.callback_query):
+            for handler in observer.handlers:
+                for handler_filter in handler.filters:
+                    labels.update(f"/{command}" for command in getattr(handler_filter.callback, "commands", ())
+                                  if isinstance(command, str))
+                    callback_data = getattr(handler_filter.callback, "callback_data", None)
+                    if callback_data is not None:
+                        labels.add(f"{callback_data.__prefix__}:")
+    return labels
+
+
+def _command(event, known):
+    # команда сообщения ("/mark"), префикс callback-данных ("page:"), OTHER для незнакомых
+    # или пусто для обычного текста
+    if isinstance(event, Message) and event.text and event.text.startswith("/"):
+        label = event.text.split()[0].split("@")[0]
+    elif isinstance(event, CallbackQuery) and event.data:
+        label = event.data.split(":")[0] + ":"
+    else:
+        return ""
+    return label if label in known else OTHER
+
+
+# время обработчиков сообщений и callback-запросов (inner middleware диспетчера)
+class HandlerMetricsMiddleware(BaseMiddleware):
+    def __init__(self, metrics, known):
+        self.metrics = metrics
+        self.known = known
+
+    async def __call__(self, handler, event, data):
+        labels = (_command(event, self.known), data.get("raw_state") or "")
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            self.metrics.handler_errors.inc(*labels, type(e).__name__)
+            raise
+        finally:
+            self.metrics.handler_seconds.observe(time.perf_counter() - start, *labels)
+
+
+# запросы к Bot API и их ошибки (middleware сессии бота); регистрируется после SendScheduler,
+# поэтому видит каждую попытку, в том числе 429, которые очередь потом повторит
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        self.metrics.telegram_requests.inc(name)
+        try:
+            return await make_request(bot, method)
+        except TelegramAPIError as e:
+            self.metrics.telegram_errors.inc(name, type(e).__name__)
+            raise
+
+
+def instrument(metrics, dp, bot, db, sender, scheduler, state_groups):
+    # подключает сбор метрик к диспетчеру, сессии бота, базе, очереди отправки и фоновым задачам
+    middleware = HandlerMetricsMiddleware(metrics, _known_labels(dp))
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+    bot.session.middleware(TelegramMetricsMiddleware(metrics))
+    db.metrics = metrics
+
+    def fsm_sessions():
+        # активные диалоги по группам состояний, в том числе пустым
+        sessions = {(group.__full_group_name__,): 0 for group in state_groups}
+        sessions.update(((group,), count) for group, count in
+                        _Tally(state.split(":")[0] for state in dp.storage.active_states()).items())
+        return sessions
+
+    metrics.collect("gauge", "journal_fsm_sessions", "Active dialogs by FSM state group", ("group",), fsm_sessions)
+    metrics.collect("gauge", "journal_updates_in_progress", "Updates being handled", (),
+                    lambda: {(): dp.updates_in_progress})
+    metrics.collect("gauge", "journal_updates_waiting", "Updates waiting for their chat's turn or a free slot", (),
+                    lambda: {(): dp.updates_waiting})
+    metrics.collect("gauge", "journal_send_queue_depth", "Bot API requests waiting for a rate limit slot",
+                    ("priority",), lambda: {(priority,): depth for priority, depth in sender.queue_depth().items()})
+    metrics.collect("gauge", "journal_send_queue_max_depth", "Largest send queue depth since start", (),
+                    lambda: {(): sender.max_depth})
+    metrics.collect("counter", "journal_send_sent_total", "Bot API requests sent through the queue", (),
+                    lambda: {(): sender.sent})
+    metrics.collect("counter", "journal_send_retried_total", "Bot API requests retried after 429", (),
+                    lambda: {(): sender.retried})
+    metrics.collect("counter", "journal_db_writes_total", "Writes committed through the database writer", (),
+                    lambda: {(): db.writes})
+    metrics.collect("counter", "journal_db_commits_total", "Write transactions (group commits)", (),
+                    lambda: {(): db.commits})
+    metrics.collect("gauge", "journal_db_wal_pages", "WAL size in pages at the last checkpoint", (),
+                    lambda: {(): db.wal_pages})
+    metrics.collect("counter", "journal_cache_hits_total", "Read-through cache hits", ("cache",),
+                    lambda: {(cache,): hits for cache, (hits, _) in db.cache_stats().items()})
+    metrics.collect("counter", "journal_cache_misses_total", "Read-through cache misses", ("cache",),
+                    lambda: {(cache,): misses for cache, (_, misses) in db.cache_stats().items()})
+    jobs = lambda attribute: lambda: {(job.name,): getattr(job, attribute) for job in scheduler.jobs.values()}
+    metrics.collect("counter", "journal_job_runs_total", "Background job runs", ("job",), jobs("runs"))
+    metrics.collect("counter", "journal_job_failures_total", "Background job runs that raised", ("job",),
+                    jobs("failures"))
+    metrics.collect("counter", "journal_job_skipped_total", "Background job runs skipped while the previous one ran",
+                    ("job",), jobs("skipped"))
+    metrics.collect("gauge", "journal_job_last_duration_seconds", "Duration of the last background job run",
+                    ("job",), jobs("last_duration"))
+
+
+# HTTP-сервер с одной страницей /metrics; слушает локальный адрес, наружу метрики не публикуются
+class MetricsServer:
+    def __init__(self, metrics, host="127.0.0.1", port=9100):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def _handle(self, request):
+        return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("Metrics are served on http://%s:%d/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
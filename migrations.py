@@ -0,0 +1,257 @@
+from datetime import datetime
+
+
+# миграции схемы: (версия, описание, функция(cursor)).
+# применённые версии хранятся в schema_migrations, каждая миграция -- в своей транзакции.
+# новые миграции только добавляются в конец списка, старые не меняются.
+
+def _initial_schema(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS students (
+                 id INTEGER PRIMARY KEY,
+                 name TEXT UNIQUE COLLATE NOCASE,
+                 is_headman INTEGER DEFAULT 0)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS attendance (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 student_id INTEGER,
+                 date TEXT,
+                 lesson INTEGER,
+                 status TEXT,
+                 FOREIGN KEY(student_id) REFERENCES students(id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS group_info (
+                 id INTEGER PRIMARY KEY CHECK (id = 1),
+                 group_name TEXT)''')
+    c.execute("INSERT OR IGNORE INTO group_info (id, group_name) VALUES (1, 'Не указана')")
+
+
+def _unique_attendance(c):
+    # одна отметка на студента и пару: удаление дублей (остаётся последняя) и уникальный индекс
+    c.execute("""DELETE FROM attendance WHERE id NOT IN (
+                     SELECT MAX(id) FROM attendance GROUP BY student_id, date, lesson)""")
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_student_date_lesson
+                 ON attendance (student_id, date, lesson)''')
+
+
+def _iso_dates(c):
+    # 'дд.мм.гггг' --> 'гггг-мм-дд': даты сравниваются как строки и попадают в индекс
+    c.execute("""UPDATE attendance
+                 SET date = substr(date, 7, 4) || '-' || substr(date, 4, 2) || '-' || substr(date, 1, 2)
+                 WHERE date LIKE '__.__.____'""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date_lesson ON attendance (date, lesson)")
+
+
+def _attendance_counters(c):
+    # счётчики отметок на студента, поддерживаются триггерами в той же транзакции,
+    # что и сама отметка; всё, что не "присутствовал", считается пропуском
+    c.execute('''CREATE TABLE IF NOT EXISTS attendance_counters (
+                 student_id INTEGER PRIMARY KEY,
+                 total INTEGER NOT NULL DEFAULT 0,
+                 present INTEGER NOT NULL DEFAULT 0,
+                 absent INTEGER NOT NULL DEFAULT 0)''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS attendance_counters_insert AFTER INSERT ON attendance
+                 BEGIN
+                     INSERT INTO attendance_counters (student_id, total, present, absent)
+                     VALUES (NEW.student_id, 1, NEW.status = 'присутствовал', NEW.status != 'присутствовал')
+                     ON CONFLICT (student_id) DO UPDATE SET
+                         total = total + 1,
+                         present = present + excluded.present,
+                         absent = absent + excluded.absent;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS attendance_counters_update AFTER UPDATE OF student_id, status ON attendance
+                 BEGIN
+                     UPDATE attendance_counters SET
+                         total = total - 1,
+                         present = present - (OLD.status = 'присутствовал'),
+                         absent = absent - (OLD.status != 'присутствовал')
+                     WHERE student_id = OLD.student_id;
+                     INSERT INTO attendance_counters (student_id, total, present, absent)
+                     VALUES (NEW.student_id, 1, NEW.status = 'присутствовал', NEW.status != 'присутствовал')
+                     ON CONFLICT (student_id) DO UPDATE SET
+                         total = total + 1,
+                         present = present + excluded.present,
+                         absent = absent + excluded.absent;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS attendance_counters_delete AFTER DELETE ON attendance
+                 BEGIN
+                     UPDATE attendance_counters SET
+                         total = total - 1,
+                         present = present - (OLD.status = 'присутствовал'),
+                         absent = absent - (OLD.status != 'присутствовал')
+                     WHERE student_id = OLD.student_id;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS attendance_counters_student_delete AFTER DELETE ON students
+                 BEGIN
+                     DELETE FROM attendance_counters WHERE student_id = OLD.id;
+                 END''')
+    c.execute("DELETE FROM attendance_counters")
+    c.execute('''INSERT INTO attendance_counters (student_id, total, present, absent)
+                 SELECT student_id, COUNT(*), SUM(status = 'присутствовал'), SUM(status != 'присутствовал')
+                 FROM attendance GROUP BY student_id''')
+
+
+def _chat_tenancy(c):
+    # данные каждой группы привязаны к чату Telegram (chat_id);
+    # данные, созданные до миграции, получают chat_id = 0 (см. Database.adopt_legacy_group)
+    c.execute('''CREATE TABLE group_info_new (
+                 chat_id INTEGER PRIMARY KEY,
+                 group_name TEXT NOT NULL DEFAULT 'Не указана')''')
+    c.execute("INSERT INTO group_info_new (chat_id, group_name) SELECT 0, group_name FROM group_info WHERE id = 1")
+    c.execute("DROP TABLE group_info")
+    c.execute("ALTER TABLE group_info_new RENAME TO group_info")
+
+    # UNIQUE (chat_id, name) заодно служит индексом для выборки студентов группы по имени
+    c.execute('''CREATE TABLE students_new (
+                 id INTEGER PRIMARY KEY,
+                 chat_id INTEGER NOT NULL DEFAULT 0,
+                 name TEXT COLLATE NOCASE,
+                 is_headman INTEGER DEFAULT 0,
+                 UNIQUE (chat_id, name))''')
+    c.execute("INSERT INTO students_new (id, chat_id, name, is_headman) SELECT id, 0, name, is_headman FROM students")
+    c.execute("DROP TABLE students")
+    c.execute("ALTER TABLE students_new RENAME TO students")
+    # триггер удаляется вместе со старой таблицей
+    c.execute('''CREATE TRIGGER IF NOT EXISTS attendance_counters_student_delete AFTER DELETE ON students
+                 BEGIN
+                     DELETE FROM attendance_counters WHERE student_id = OLD.id;
+                 END''')
+
+
+def _integer_status(c):
+    # статус отметки -- целый код вместо слова (см. statuses.Status): 1 присутствовал, 2 отсутствовал,
+    # 3 опоздал, 4 уважительная причина; на занятии -- 1 и 3.
+    # у столбца TEXT текстовое сродство, поэтому таблица пересоздаётся; заодно она хранится
+    # по ключу (student_id, date, lesson) без rowid: отдельный уникальный индекс больше не нужен,
+    # а отметки одного студента лежат рядом
+    c.execute('''CREATE TABLE attendance_new (
+                 student_id INTEGER NOT NULL,
+                 date TEXT NOT NULL,
+                 lesson INTEGER NOT NULL,
+                 status INTEGER NOT NULL,
+                 PRIMARY KEY (student_id, date, lesson),
+                 FOREIGN KEY(student_id) REFERENCES students(id)) WITHOUT ROWID''')
+    # как и в счётчиках, всё, что не "присутствовал", считается пропуском
+    c.execute("""INSERT INTO attendance_new (student_id, date, lesson, status)
+                 SELECT student_id, date, lesson, CASE status WHEN 'присутствовал' THEN 1 ELSE 2 END
+                 FROM attendance
+                 WHERE student_id IS NOT NULL AND date IS NOT NULL AND lesson IS NOT NULL
+                 ORDER BY student_id, date, lesson""")
+    # вместе со старой таблицей удаляются её индексы и триггеры
+    c.execute("DROP TABLE attendance")
+    c.execute("ALTER TABLE attendance_new RENAME TO attendance")
+    c.execute("CREATE INDEX idx_attendance_date_lesson ON attendance (date, lesson)")
+    c.execute('''CREATE TRIGGER attendance_counters_insert AFTER INSERT ON attendance
+                 BEGIN
+                     INSERT INTO attendance_counters (student_id, total, present, absent)
+                     VALUES (NEW.student_id, 1, NEW.status IN (1, 3), NEW.status NOT IN (1, 3))
+                     ON CONFLICT (student_id) DO UPDATE SET
+                         total = total + 1,
+                         present = present + excluded.present,
+                         absent = absent + excluded.absent;
+                 END''')
+    c.execute('''CREATE TRIGGER attendance_counters_update AFTER UPDATE OF student_id, status ON attendance
+                 BEGIN
+                     UPDATE attendance_counters SET
+                         total = total - 1,
+                         present = present - (OLD.status IN (1, 3)),
+                         absent = absent - (OLD.status NOT IN (1, 3))
+                     WHERE student_id = OLD.student_id;
+                     INSERT INTO attendance_counters (student_id, total, present, absent)
+                     VALUES (NEW.student_id, 1, NEW.status IN (1, 3), NEW.status NOT IN (1, 3))
+                     ON CONFLICT (student_id) DO UPDATE SET
+                         total = total + 1,
+                         present = present + excluded.present,
+                         absent = absent + excluded.absent;
+                 END''')
+    c.execute('''CREATE TRIGGER attendance_counters_delete AFTER DELETE ON attendance
+                 BEGIN
+                     UPDATE attendance_counters SET
+                         total = total - 1,
+                         present = present - (OLD.status IN (1, 3)),
+                         absent = absent - (OLD.status NOT IN (1, 3))
+                     WHERE student_id = OLD.student_id;
+                 END''')
+    c.execute("DELETE FROM attendance_counters")
+    c.execute('''INSERT INTO attendance_counters (student_id, total, present, absent)
+                 SELECT student_id, COUNT(*), SUM(status IN (1, 3)), SUM(status NOT IN (1, 3))
+                 FROM attendance GROUP BY student_id''')
+
+
+def _monthly_totals(c):
+    # итоги посещаемости студентов за закрытые месяцы -- их пересчитывает ночная задача
+    # (Database.snapshot_months), а итоги за период складываются из них и отметок непокрытых дней.
+    # любое изменение отметок месяца удаляет его итог до следующего пересчёта
+    c.execute('''CREATE TABLE attendance_monthly (
+                 student_id INTEGER NOT NULL,
+                 month TEXT NOT NULL,
+                 total INTEGER NOT NULL,
+                 present INTEGER NOT NULL,
+                 PRIMARY KEY (student_id, month)) WITHOUT ROWID''')
+    c.execute('''CREATE TRIGGER attendance_monthly_insert AFTER INSERT ON attendance
+                 BEGIN
+                     DELETE FROM attendance_monthly WHERE student_id = NEW.student_id AND month = substr(NEW.date, 1, 7);
+                 END''')
+    c.execute('''CREATE TRIGGER attendance_monthly_update AFTER UPDATE ON attendance
+                 BEGIN
+                     DELETE FROM attendance_monthly WHERE student_id = OLD.student_id AND month = substr(OLD.date, 1, 7);
+                     DELETE FROM attendance_monthly WHERE student_id = NEW.student_id AND month = substr(NEW.date, 1, 7);
+                 END''')
+    c.execute('''CREATE TRIGGER attendance_monthly_delete AFTER DELETE ON attendance
+                 BEGIN
+                     DELETE FROM attendance_monthly WHERE student_id = OLD.student_id AND month = substr(OLD.date, 1, 7);
+                 END''')
+
+
+def _timetable(c):
+    # расписание пар группы: день недели (0 -- понедельник), номер пары, начало и конец в минутах от полуночи
+    c.execute('''CREATE TABLE timetable (
+                 chat_id INTEGER NOT NULL,
+                 weekday INTEGER NOT NULL,
+                 lesson INTEGER NOT NULL,
+                 start INTEGER NOT NULL,
+                 end INTEGER NOT NULL,
+                 PRIMARY KEY (chat_id, weekday, lesson)) WITHOUT ROWID''')
+
+
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "unique attendance mark per student and lesson", _unique_attendance),
+    (3, "ISO dates and (date, lesson) index", _iso_dates),
+    (4, "per-student attendance counters", _attendance_counters),
+    (5, "scope groups and students by chat_id", _chat_tenancy),
+    (6, "integer attendance status codes, attendance keyed by (student_id, date, lesson)", _integer_status),
+    (7, "monthly attendance totals", _monthly_totals),
+    (8, "group timetable", _timetable),
+]
+
+# после этих миграций файл базы сжимается (VACUUM), чтобы освободившееся место вернулось системе
+VACUUM_AFTER = {6}
+
+
+def applied_versions(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT,
+                    applied_at TEXT)''')
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+
+def migrate(conn, target=None):
+    # применяет недостающие миграции по порядку (до версии target включительно, если она указана),
+    # возвращает список применённых версий
+    done = applied_versions(conn)
+    applied = []
+    for version, name, fn in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        conn.execute("BEGIN")
+        try:
+            fn(conn.cursor())
+            conn.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                         (version, name, datetime.now().isoformat(timespec="seconds")))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    if VACUUM_AFTER.intersection(applied):
+        conn.execute("VACUUM")
+    return applied
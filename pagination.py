@@ -0,0 +1,233 @@
+from collections import OrderedDict, namedtuple
+
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from statuses import EMOJI
+
+# длинные ответы (список группы, посещаемость пары, статистика) разбиваются на страницы
+# с кнопками "Назад"/"Вперёд"; страница берётся из БД keyset-запросом (name > последнего имени
+# предыдущей страницы) и рендерится только при запросе
+PAGE_SIZE = 30
+# лимит Telegram -- 4096 символов, запас на эмодзи, которые занимают два символа
+TEXT_LIMIT = 4000
+# сколько имён показывать в сводке статистики
+SUMMARY_LIMIT = 10
+
+
+class PageCallback(CallbackData, prefix="page"):
+    # kind: "students", "lesson", "stats" или "history"; date и lesson -- для посещаемости пары,
+    # date, date_to и student -- период истории и студент (0 -- вся группа)
+    kind: str
+    page: int
+    date: str = ""
+    lesson: int = 0
+    date_to: str = ""
+    student: int = 0
+
+
+# отрендеренная страница; after и start -- курсор следующей страницы:
+# последнее имя на этой странице и номер первой строки следующей
+Page = namedtuple("Page", "text has_next after start")
+
+
+# последние отрендеренные страницы: max_pages на чат, не больше max_chats чатов.
+# страница выдаётся, только если с момента рендера данные чата не менялись
+class PageCache:
+    def __init__(self, max_pages=8, max_chats=1024):
+        self.max_pages = max_pages
+        self.max_chats = max_chats
+        self._chats = OrderedDict()
+
+    def get(self, chat_id, key, version):
+        entry = self.peek(chat_id, key)
+        if entry is None or entry[0] != version:
+            return None
+        self._chats.move_to_end(chat_id)
+        self._chats[chat_id].move_to_end(key)
+        return entry[1]
+
+    def peek(self, chat_id, key):
+        # (версия, страница) без учёта версии и без обновления порядка вытеснения
+        pages = self._chats.get(chat_id)
+        return pages.get(key) if pages else None
+
+    def put(self, chat_id, key, version, page):
+        pages = self._chats.setdefault(chat_id, OrderedDict())
+        self._chats.move_to_end(chat_id)
+        pages[key] = (version, page)
+        pages.move_to_end(key)
+        if len(pages) > self.max_pages:
+            pages.popitem(last=False)
+        if len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+
+
+class Pager:
+    def __init__(self, db, page_size=PAGE_SIZE, cache=None):
+        self.db = db
+        self.page_size = page_size
+        self.cache = cache or PageCache()
+        self._renderers = {"students": self._students, "lesson": self._lesson, "stats": self._stats,
+                           "history": self._history}
+
+    async def render(self, chat_id, query):
+        # текст страницы и инлайн-клавиатура (None, если страница одна)
+        number, page = await self._get_page(chat_id, query)
+        buttons = []
+        if number > 0:
+            buttons.append(InlineKeyboardButton(
+                text="◀️ Назад", callback_data=query.model_copy(update={"page": number - 1}).pack()))
+        if page.has_next:
+            buttons.append(InlineKeyboardButton(
+                text="Вперёд ▶️", callback_data=query.model_copy(update={"page": number + 1}).pack()))
+        return page.text, InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+    async def _get_page(self, chat_id, query):
+        version = self.db.data_version(chat_id)
+        base = (query.kind, query.date, query.lesson, query.date_to, query.student)
+        page = self.cache.get(chat_id, base + (query.page,), version)
+        if page is not None:
+            return query.page, page
+
+        # курсор берётся из предыдущей страницы (устаревшая тоже подходит: имена упорядочены);
+        # если её нет в кэше, например после перезапуска, страницы проходятся от ближайшей известной
+        number = query.page
+        while number > 0 and self.cache.peek(chat_id, base + (number - 1,)) is None:
+            number -= 1
+        after, start = "", 0
+        if number > 0:
+            previous = self.cache.peek(chat_id, base + (number - 1,))[1]
+            after, start = previous.after, previous.start
+        while True:
+            page = await self._renderers[query.kind](chat_id, query, number, after, start)
+            self.cache.put(chat_id, base + (number,), version, page)
+            # страницы могло стать меньше --> показывается последняя
+            if number == query.page or not page.has_next:
+                return number, page
+            number += 1
+            after, start = page.after, page.start
+
+    def _fit(self, header, lines, names, number, after, start):
+        # набирает строки, пока их не больше page_size и текст помещается в одно сообщение
+        footer = f"\n\nСтраница {number + 1}"
+        text = header
+        count = 0
+        for line in lines[:self.page_size]:
+            if count and len(text) + 1 + len(line) + len(footer) > TEXT_LIMIT:
+                break
+            text += "\n" + line[:TEXT_LIMIT - len(text) - len(footer) - 1]
+            count += 1
+        has_next = count < len(lines)
+        if number > 0 or has_next:
+            text += footer
+        return Page(text, has_next, names[count - 1] if count else after, start + count)
+
+    async def _students(self, chat_id, query, number, after, start):
+        group_name = await self.db.get_group_name(chat_id)
+        students = await self.db.get_students_page(chat_id, after, self.page_size + 1)
+        if not students and number == 0:
+            return Page(f"Группа: {group_name}\nСписок студентов пуст.", False, "", 0)
+        lines = [f"{start + i + 1}. {name}{' (📋)' if is_headman else ''}"
+                 for i, (_, name, is_headman) in enumerate(students)]
+        return self._fit(f"Группа: {group_name}\nСписок студентов:", lines,
+                         [name for _, name, _ in students], number, after, start)
+
+    async def _lesson(self, chat_id, query, number, after, start):
+        rows = await self.db.get_lesson_attendance_page(chat_id, query.date, query.lesson, after,
+                                                       self.page_size + 1)
+        date = ".".join(reversed(query.date.split("-")))
+        if not rows and number == 0:
+            return Page(f"Нет данных о посещаемости за {date}, пара {query.lesson}.", False, "", 0)
+        lines = [f"{start + i + 1}. {name}{' (📋)' if is_headman else ''}: {EMOJI.get(status, '❓')}"
+                 for i, (name, status, is_headman) in enumerate(rows)]
+        return self._fit(f"Посещаемость за {date}, пара {query.lesson}:", lines,
+                         [name for name, _, _ in rows], number, after, start)
+
+    async def _stats(self, chat_id, query, number, after, start):
+        group_name = await self.db.get_group_name(chat_id)
+        students = await self.db.get_group_stats_page(chat_id, after, self.page_size + 1)
+        if not students and number == 0:
+            return Page(f"Группа: {group_name}\nСписок студентов пуст. Добавь студентов через /add_student.",
+                        False, "", 0)
+
+        header = f"Статистика посещаемости группы: {group_name}\n\n"
+        if number == 0:
+            # сводка по всей группе -- только на первой странице
+            max_absent, most_absent, most_absent_count, no_absences, no_absences_count = \
+                await self.db.get_group_stats_summary(chat_id, SUMMARY_LIMIT)
+
+            # 1. кто чаще всего пропускал
+            if max_absent > 0:
+                header += "Чаще всего пропускали занятия:\n"
+                for name, is_headman in most_absent:
+                    header += f"- {name}{' (📋)' if is_headman else ''}: {max_absent} пропусков\n"
+                if most_absent_count > len(most_absent):
+                    header += f"- … и ещё {most_absent_count - len(most_absent)}\n"
+            else:
+                header += "Никто ещё не пропускал занятия.\n"
+
+            # 2. кто не пропустил ни одного
+            if no_absences:
+                header += "\nНи одного пропуска:\n"
+                for name, is_headman in no_absences:
+                    header += f"- {name}{' (📋)' if is_headman else ''}\n"
+                if no_absences_count > len(no_absences):
+                    header += f"- … и ещё {no_absences_count - len(no_absences)}\n"
+            else:
+                header += "\nНет студентов без пропусков (или нет данных).\n"
+            header += "\n"
+
+        # 3. процент посещаемости для всех
+        lines = []
+        for name, is_headman, total, present, absent in students:
+            percent = (present / total * 100) if total > 0 else 100
+            lines.append(f"- {name}{' (📋)' if is_headman else ''}: {percent:.1f}% ({total} занятий)")
+        return self._fit(header + "Процент посещаемости:", lines,
+                         [student[0] for student in students], number, after, start)
+
+    async def _history(self, chat_id, query, number, after, start):
+        # строка на день: по группе -- присутствующие на каждой паре, по студенту -- отметки по парам;
+        # курсор страницы -- последняя показанная дата
+        period = format_period(query.date, query.date_to)
+        if query.student:
+            student = next((s for s in (await self.db.get_directory(chat_id)).students
+                            if s[0] == query.student), None)
+            if student is None:
+                return Page("Студент не найден.", False, "", 0)
+            title = f"{student[1]}{' (📋)' if student[2] else ''}"
+            days = await self.db.get_student_history_page(query.student, query.date, query.date_to, after,
+                                                          self.page_size + 1)
+            lines = [f"{format_day(date)}: " + " ".join(f"{lesson}){EMOJI.get(status, '❓')}"
+                                                         for lesson, status in lessons)
+                     for date, lessons in days]
+        else:
+            title = f"группа {await self.db.get_group_name(chat_id)}"
+            days = await self.db.get_group_history_page(chat_id, query.date, query.date_to, after,
+                                                        self.page_size + 1)
+            lines = []
+            for date, lessons in days:
+                present = sum(p for _, p, _ in lessons)
+                total = sum(t for _, _, t in lessons)
+                lines.append(f"{format_day(date)}: " + " ".join(f"{lesson}) {p}/{t}" for lesson, p, t in lessons)
+                             + f" — {present / total * 100:.0f}%")
+        if not days and number == 0:
+            return Page(f"История посещаемости: {title}, {period}\nНет отметок за этот период.", False, "", 0)
+
+        header = f"История посещаемости: {title}, {period}"
+        if number == 0:
+            # итог за весь период -- только на первой странице
+            total, present = await self.db.get_history_totals(chat_id, query.student, query.date, query.date_to)
+            header += (f"\nПосещаемость за период: {present / total * 100:.1f}% "
+                       f"({present} из {total}, отсутствий: {total - present})\n")
+        return self._fit(header, lines, [date for date, _ in days], number, after, start)
+
+
+def format_day(iso_date):
+    return ".".join(reversed(iso_date.split("-")))
+
+
+def format_period(date_from, date_to):
+    if date_from == "0000-01-01" and date_to == "9999-12-31":
+        return "за всё время"
+    return f"{format_day(date_from)}–{format_day(date_to)}"
@@ -0,0 +1,108 @@
+import asyncio
+import secrets
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from statuses import EMOJI, Status
+
+# перекличка одним сообщением: весь список группы -- инлайн-кнопки, нажатие меняет статус студента,
+# "Сохранить" записывает пару одной транзакцией. состояние переклички (токен, студенты, статусы)
+# хранится в данных FSM того, кто её начал
+
+# по порядку нажатий: присутствовал -> отсутствовал -> опоздал -> уважительная причина -> присутствовал
+NEXT_STATUS = {Status.PRESENT: Status.ABSENT, Status.ABSENT: Status.LATE,
+               Status.LATE: Status.EXCUSED, Status.EXCUSED: Status.PRESENT}
+# в инлайн-клавиатуре не больше 100 кнопок; две -- "Сохранить" и "Отмена"
+MAX_STUDENTS = 98
+COLUMNS = 2
+
+
+class RollCallback(CallbackData, prefix="rc"):
+    # token -- перекличка (кнопки завершённой или другой переклички не действуют);
+    # action: "t" -- сменить статус студента с номером index, "s" -- сохранить, "c" -- отменить.
+    # вместе выходит меньше 20 байт при лимите Telegram в 64
+    token: str
+    action: str
+    index: int = 0
+
+
+def new_token():
+    return secrets.token_urlsafe(4)
+
+
+def roll_call_keyboard(token, students, statuses):
+    # students: [(id, name)], statuses -- коды в том же порядке
+    buttons = [InlineKeyboardButton(text=f"{EMOJI[Status(status)]} {name}",
+                                    callback_data=RollCallback(token=token, action="t", index=i).pack())
+               for i, ((_, name), status) in enumerate(zip(students, statuses))]
+    rows = [buttons[i:i + COLUMNS] for i in range(0, len(buttons), COLUMNS)]
+    rows.append([InlineKeyboardButton(text="💾 Сохранить", callback_data=RollCallback(token=token, action="s").pack()),
+                 InlineKeyboardButton(text="Отмена", callback_data=RollCallback(token=token, action="c").pack())])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+# отложенная правка клавиатуры сообщения: нажатия, пришедшие, пока правка ждёт delay секунд
+# или своей очереди на отправку (лимит Telegram в группе -- 20 сообщений в минуту), сливаются
+# в одну правку с последним состоянием; клавиатура, совпадающая с показанной, не отправляется.
+# обработчик нажатия не ждёт правку, поэтому следующие нажатия чата не задерживаются
+class KeyboardEditor:
+    def __init__(self, delay=0.3, max_messages=1024):
+        self.delay = delay
+        self.max_messages = max_messages
+        # (chat_id, message_id) -> клавиатура, ожидающая отправки / последняя показанная
+        self._pending = {}
+        self._shown = {}
+        self._tasks = {}
+        # для метрик и бенчмарков: отправленные правки и не понадобившиеся
+        self.edits = 0
+        self.skipped = 0
+
+    def shown(self, chat_id, message_id, markup):
+        # клавиатура, с которой сообщение отправлено
+        self._shown[chat_id, message_id] = markup
+        while len(self._shown) > self.max_messages:
+            self._shown.pop(next(iter(self._shown)))
+
+    def update(self, bot, chat_id, message_id, markup):
+        key = chat_id, message_id
+        if key not in self._tasks and markup == self._shown.get(key):
+            self.skipped += 1
+            return
+        if key in self._pending:
+            self.skipped += 1
+        self._pending[key] = markup
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._flush(bot, key))
+
+    async def _flush(self, bot, key):
+        try:
+            while key in self._pending:
+                await asyncio.sleep(self.delay)
+                markup = self._pending.pop(key)
+                if markup == self._shown.get(key):
+                    self.skipped += 1
+                    continue
+                try:
+                    await bot.edit_message_reply_markup(chat_id=key[0], message_id=key[1], reply_markup=markup)
+                except TelegramBadRequest:
+                    # сообщение удалено или слишком старое
+                    self._pending.pop(key, None)
+                    break
+                self.edits += 1
+                self.shown(*key, markup)
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+
+    async def finish(self, chat_id, message_id):
+        # перекличка завершена: отложенная правка больше не нужна
+        key = chat_id, message_id
+        self._pending.pop(key, None)
+        self._shown.pop(key, None)
+        # задача, отменённая до первого шага, не доходит до своего finally
+        task = self._tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+# расписания: функция, которая по текущему времени возвращает время следующего запуска
+def daily(at, weekdays=None):
+    # каждый день в at ("ЧЧ:ММ", местное время); weekdays -- дни недели (0 -- понедельник), по умолчанию все
+    hour, minute = map(int, at.split(":"))
+    days = set(range(7) if weekdays is None else weekdays)
+    def next_run(now):
+        run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if run <= now:
+            run += timedelta(days=1)
+        while run.weekday() not in days:
+            run += timedelta(days=1)
+        return run
+    return next_run
+
+
+def every(seconds):
+    # раз в seconds секунд после предыдущего запуска
+    return lambda now: now + timedelta(seconds=seconds)
+
+
+class Job:
+    def __init__(self, name, fn, schedule, jitter):
+        self.name = name
+        self.fn = fn
+        self.schedule = schedule
+        # случайная задержка запуска до jitter секунд: экземпляры бота не запускают задачу в одну секунду
+        self.jitter = jitter
+        self.task = None
+        # для метрик: запуски, ошибки, пропуски из-за незавершённого предыдущего запуска
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_duration = 0.0
+
+
+# фоновые задачи по расписанию в том же цикле событий, что и бот. запуск задачи не накладывается
+# на её предыдущий запуск (он пропускается), при остановке выполняющиеся задачи отменяются
+class Scheduler:
+    def __init__(self, clock=datetime.now):
+        self.clock = clock
+        self.jobs = {}
+        self._loops = []
+
+    def add(self, name, fn, schedule, jitter=0.0):
+        # fn -- корутинная функция без аргументов
+        self.jobs[name] = Job(name, fn, schedule, jitter)
+
+    def start(self):
+        self._loops = [asyncio.create_task(self._loop(job), name=f"job-{job.name}") for job in self.jobs.values()]
+
+    async def stop(self):
+        tasks = self._loops + [job.task for job in self.jobs.values() if job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loops = []
+
+    async def _loop(self, job):
+        while True:
+            now = self.clock()
+            delay = (job.schedule(now) - now).total_seconds() + random.uniform(0, job.jitter)
+            await asyncio.sleep(max(delay, 0))
+            if job.task is not None and not job.task.done():
+                job.skipped += 1
+                logger.warning("Job %s is still running, skipping this run", job.name)
+                continue
+            job.task = asyncio.create_task(self._run(job), name=f"run-{job.name}")
+
+    async def run(self, name):
+        # запуск задачи вне расписания (и ожидание результата); если она уже выполняется -- ожидание её
+        job = self.jobs[name]
+        if job.task is None or job.task.done():
+            job.task = asyncio.create_task(self._run(job), name=f"run-{job.name}")
+        await asyncio.shield(job.task)
+
+    async def _run(self, job):
+        start = time.perf_counter()
+        try:
+            await job.fn()
+        except Exception:
+            job.failures += 1
+            logger.exception("Job %s failed", job.name)
+        finally:
+            job.runs += 1
+            job.last_duration = time.perf_counter() - start
@@ -0,0 +1,181 @@
+import asyncio
+import itertools
+import logging
+import time
+from bisect import insort
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# приоритет исходящих запросов: ответы на действия пользователя отправляются раньше отчётов и рассылок
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+send_priority = ContextVar("send_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def bulk_priority():
+    # запросы к Bot API внутри блока идут с низким приоритетом
+    token = send_priority.set(BULK)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # после 429 чат заблокирован до этого момента
+        self.blocked_until = 0.0
+
+    def delay(self, now):
+        # через сколько секунд можно отправить следующий запрос
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+# очередь исходящих запросов к Bot API (middleware сессии бота).
+# запросы в чат проходят через общий token bucket и bucket чата с лимитами Telegram:
+# до 30 сообщений в секунду всего, одно в секунду в личный чат и 20 в минуту в группу
+# (в группе допускается короткая серия, лишнее Telegram отклонит с 429).
+# на 429 (Retry-After) чат блокируется на указанное время, а запрос встаёт в очередь повторно
+class SendScheduler(BaseRequestMiddleware):
+    def __init__(self, global_rate=30.0, global_burst=30, private_rate=1.0, private_burst=1,
+                 group_rate=20 / 60, group_burst=5, max_retries=5):
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self._chat_buckets = {}
+        # ожидающие отправки (priority, seq, chat_id, future), упорядоченные по приоритету и времени постановки
+        self._waiters = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._pump_task = None
+        # счётчики для метрик
+        self.sent = 0
+        self.retried = 0
+        self.max_depth = 0
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        priority = send_priority.get()
+        seq = next(self._seq)
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None:
+                await self._acquire(chat_id, priority, seq)
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retried += 1
+                logger.warning("Flood control on %s in chat %s, retry in %s s",
+                               type(method).__name__, chat_id, e.retry_after)
+                if chat_id is None:
+                    await asyncio.sleep(e.retry_after)
+                else:
+                    self._bucket(chat_id).block(e.retry_after)
+                continue
+            self.sent += 1
+            return result
+
+    async def close(self):
+        # останавливает выдачу разрешений; ожидающие отправки запросы отменяются
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            await asyncio.gather(self._pump_task, return_exceptions=True)
+            self._pump_task = None
+        for _, _, _, future in self._waiters:
+            future.cancel()
+        self._waiters = []
+
+    def queue_depth(self):
+        # число ожидающих запросов по приоритетам
+        depth = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+        for priority, *_ in self._waiters:
+            depth[PRIORITY_NAMES[priority]] += 1
+        return depth
+
+    def _bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                self._prune()
+            # у групп и каналов chat_id отрицательный
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.private_rate, self.private_burst)
+            else:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune(self):
+        # полные и незаблокированные buckets ничем не отличаются от новых
+        now = time.monotonic()
+        waiting = {chat_id for _, _, chat_id, _ in self._waiters}
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            if chat_id not in waiting and bucket.delay(now) <= 0 and bucket.tokens >= bucket.capacity:
+                del self._chat_buckets[chat_id]
+
+    async def _acquire(self, chat_id, priority, seq):
+        future = asyncio.get_running_loop().create_future()
+        insort(self._waiters, (priority, seq, chat_id, future))
+        self.max_depth = max(self.max_depth, len(self._waiters))
+        self._wakeup.set()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _pump(self):
+        # выдаёт разрешения на отправку: первому по приоритету запросу, чей чат не исчерпал лимит
+        while self._waiters:
+            self._wakeup.clear()
+            now = time.monotonic()
+            wait = self.global_bucket.delay(now)
+            if wait <= 0:
+                wait = None
+                for i, (_, _, chat_id, future) in enumerate(self._waiters):
+                    if future.done():  # отправитель отменён
+                        continue
+                    delay = self._bucket(chat_id).delay(now)
+                    if delay <= 0:
+                        del self._waiters[i]
+                        self.global_bucket.take()
+                        self._bucket(chat_id).take()
+                        future.set_result(None)
+                        break
+                    wait = delay if wait is None else min(wait, delay)
+                else:
+                    self._waiters = [waiter for waiter in self._waiters if not waiter[3].done()]
+                    if wait is None:
+                        continue
+                    # новый запрос может оказаться в чате, где лимит не исчерпан
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                # отдать управление получившему разрешение
+                await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(wait)
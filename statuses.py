@@ -0,0 +1,39 @@
+from enum import IntEnum
+
+
+# статус отметки хранится в attendance.status целым числом;
+# новые статусы только добавляются, коды существующих не меняются
+class Status(IntEnum):
+    PRESENT = 1
+    ABSENT = 2
+    LATE = 3
+    EXCUSED = 4
+
+
+# статусы, при которых студент был на занятии (остальные -- пропуск);
+# тот же список зашит в триггеры attendance_counters (см. migrations.py)
+ATTENDED = (Status.PRESENT, Status.LATE)
+
+# отображение в сообщениях и на кнопках
+EMOJI = {
+    Status.PRESENT: "✅",
+    Status.ABSENT: "❌",
+    Status.LATE: "⏰",
+    Status.EXCUSED: "📄",
+}
+BY_EMOJI = {emoji: status for status, emoji in EMOJI.items()}
+
+# отображение в выгрузке
+EXPORT_MARKS = {
+    Status.PRESENT: "+",
+    Status.ABSENT: "н",
+    Status.LATE: "о",
+    Status.EXCUSED: "у",
+}
+
+TITLES = {
+    Status.PRESENT: "присутствовал",
+    Status.ABSENT: "отсутствовал",
+    Status.LATE: "опоздал",
+    Status.EXCUSED: "уважительная причина",
+}
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# тесты используют заглушки Bot API из бенчмарков (benchmarks/stubs.py), а они -- модули бота из корня
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
@@ -0,0 +1,74 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.methods import SendMessage
+
+from sender import SendScheduler, bulk_priority
+from stubs import FloodSession
+
+
+def create_bot(scheduler, **session):
+    session = FloodSession(**session)
+    session.middleware(scheduler)
+    return Bot(token="123456:TEST", session=session), session
+
+
+def delivered(session):
+    return [request.text for request in session.requests if isinstance(request, SendMessage)]
+
+
+def test_retry_after_is_retried_without_lost_sends():
+    async def run():
+        # лимиты очереди в speed раз выше, как у фейкового API, и не строже его: 429 приходят и от
+        # превышения лимита чата, и случайно (inject)
+        speed = 20
+        scheduler = SendScheduler(global_rate=30 * speed, private_rate=10 * speed, private_burst=10,
+                                  group_rate=20 / 60 * speed)
+        bot, session = create_bot(scheduler, speed=speed, inject=0.2)
+        texts = [f"{chat_id}-{i}" for chat_id in (1, 2, -1) for i in range(8)]
+        await asyncio.gather(*(bot.send_message(int(text.rsplit("-", 1)[0]), text) for text in texts))
+        await scheduler.close()
+        return texts, session, scheduler
+
+    texts, session, scheduler = asyncio.run(run())
+    assert session.flood > 0
+    assert scheduler.retried == session.flood
+    assert scheduler.sent == len(texts)
+    assert sorted(delivered(session)) == sorted(texts)
+
+
+def test_interactive_before_bulk():
+    async def run():
+        # один запрос за раз: остальные ждут в очереди
+        scheduler = SendScheduler(global_rate=200, global_burst=1)
+        bot, session = create_bot(scheduler, speed=100)
+
+        async def bulk(i):
+            with bulk_priority():
+                await bot.send_message(1000 + i, f"bulk {i}")
+
+        # рассылка встаёт в очередь раньше ответов
+        await asyncio.gather(*(bulk(i) for i in range(10)),
+                             *(bot.send_message(i + 1, f"reply {i}") for i in range(10)))
+        await scheduler.close()
+        return delivered(session)
+
+    texts = asyncio.run(run())
+    assert texts == [f"reply {i}" for i in range(10)] + [f"bulk {i}" for i in range(10)]
+
+
+def test_close_cancels_waiting_sends():
+    async def run():
+        scheduler = SendScheduler(global_rate=1, global_burst=1)
+        bot, session = create_bot(scheduler)
+        sends = [asyncio.create_task(bot.send_message(i + 1, str(i))) for i in range(5)]
+        await asyncio.sleep(0.1)
+        await scheduler.close()
+        results = await asyncio.gather(*sends, return_exceptions=True)
+        return results, session, scheduler
+
+    results, session, scheduler = asyncio.run(run())
+    assert delivered(session) == ["0"]
+    assert all(isinstance(result, asyncio.CancelledError) for result in results[1:])
+    assert scheduler._pump_task is None
+    assert scheduler.queue_depth() == {"interactive": 0, "bulk": 0}
@@ -0,0 +1,36 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram.methods import SendMessage
+
+from stubs import create_test_app, message_update
+from webhook import create_webhook_app
+
+SECRET = "test-secret"
+
+
+async def post_update(tmp_path, secret):
+    app = create_test_app(str(tmp_path))
+    web_app = create_webhook_app(app.dp, app.bot, "/webhook", secret_token=SECRET)
+    async with TestClient(TestServer(web_app)) as client:
+        response = await client.post("/webhook", data=message_update("/start").model_dump_json(exclude_none=True),
+                                     headers={"X-Telegram-Bot-Api-Secret-Token": secret,
+                                              "Content-Type": "application/json"})
+        # принятый апдейт обрабатывается в фоне после ответа 200
+        for _ in range(500 if response.status == 200 else 0):
+            if app.bot.session.count(SendMessage):
+                break
+            await asyncio.sleep(0.01)
+        return response.status, app.bot.session.count(SendMessage)
+
+
+def test_valid_update_is_accepted(tmp_path):
+    status, replies = asyncio.run(post_update(tmp_path, SECRET))
+    assert status == 200
+    assert replies == 1
+
+
+def test_wrong_secret_is_rejected(tmp_path):
+    status, replies = asyncio.run(post_update(tmp_path, "wrong"))
+    assert status == 401
+    assert replies == 0
@@ -0,0 +1,116 @@
+import re
+from bisect import bisect_right
+
+WEEKDAYS = ("пн", "вт", "ср", "чт", "пт", "сб", "вс")
+# за сколько минут до начала пары /mark уже относится к ней (перекличка перед звонком)
+LEAD_MINUTES = 15
+MAX_LESSONS = 12
+
+# строка расписания: "дни пара начало-конец", например "пн-пт 1 08:30-10:00" или "пн,ср 5 15:40-17:10"
+_LINE = re.compile(r"^(\S+)\s+(\d+)\s+(\d{1,2}):(\d{2})\s*[-–—]\s*(\d{1,2}):(\d{2})$")
+
+
+def lesson_button(lesson):
+    # 1⃣ .. 9⃣, дальше -- просто число
+    return f"{lesson}⃣" if lesson < 10 else str(lesson)
+
+
+def parse_lesson(text):
+    # номер пары с кнопки (lesson_button) или числом; ValueError, если это не номер пары
+    lesson = int(text.strip().replace("⃣", "").replace("\ufe0f", ""))
+    if not 1 <= lesson <= MAX_LESSONS:
+        raise ValueError(text)
+    return lesson
+
+
+def _weekdays(text):
+    # "пн", "пн-пт", "пн,ср,пт" --> номера дней недели (0 -- понедельник)
+    days = []
+    for part in text.lower().split(","):
+        first, _, last = part.partition("-")
+        first, last = WEEKDAYS.index(first), WEEKDAYS.index(last or first)
+        if last < first:
+            raise ValueError(part)
+        days.extend(range(first, last + 1))
+    return days
+
+
+def _minutes(hour, minute):
+    hour, minute = int(hour), int(minute)
+    if hour > 23 or minute > 59:
+        raise ValueError(f"{hour}:{minute}")
+    return hour * 60 + minute
+
+
+def parse_timetable(text):
+    # текст расписания --> [(день недели, пара, начало, конец)], время -- минуты от полуночи.
+    # ValueError с описанием для пользователя, если строка не разбирается или пары одного дня пересекаются
+    rows = {}
+    for number, line in enumerate(text.strip().splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        match = _LINE.match(line)
+        try:
+            if not match:
+                raise ValueError(line)
+            days, lesson, *clock = match.groups()
+            start, end = _minutes(*clock[:2]), _minutes(*clock[2:])
+            if start >= end or not 1 <= int(lesson) <= MAX_LESSONS:
+                raise ValueError(line)
+            for weekday in _weekdays(days):
+                if (weekday, int(lesson)) in rows:
+                    raise ValueError(line)
+                rows[weekday, int(lesson)] = (weekday, int(lesson), start, end)
+        except ValueError:
+            raise ValueError(f"строка {number}: {line}") from None
+    Timetable(rows.values())
+    return sorted(rows.values())
+
+
+def format_minutes(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+# расписание группы с готовым поиском пары по времени: для каждого дня недели отсортированные
+# начала "окон" пар (LEAD_MINUTES до звонка, но не раньше конца предыдущей пары) -- двоичный поиск
+class Timetable:
+    def __init__(self, rows):
+        # rows: [(день недели, пара, начало, конец)], время -- минуты от полуночи
+        self.rows = sorted(rows)
+        self._starts = [[] for _ in WEEKDAYS]
+        self._slots = [[] for _ in WEEKDAYS]
+        for weekday in range(len(WEEKDAYS)):
+            previous_end = 0
+            for _, lesson, start, end in sorted((row for row in self.rows if row[0] == weekday),
+                                                key=lambda row: row[2]):
+                if start < previous_end:
+                    raise ValueError(f"{WEEKDAYS[weekday]}: пара {lesson} начинается до конца предыдущей")
+                self._starts[weekday].append(max(start - LEAD_MINUTES, previous_end))
+                self._slots[weekday].append((lesson, end))
+                previous_end = end
+
+    def __bool__(self):
+        return bool(self.rows)
+
+    def lessons(self):
+        # наибольший номер пары (для клавиатуры выбора пары)
+        return max((lesson for _, lesson, _, _ in self.rows), default=0)
+
+    def lesson_at(self, now):
+        # пара, которая идёт в момент now (datetime) или начнётся в ближайшие LEAD_MINUTES, иначе None
+        weekday = now.weekday()
+        minute = now.hour * 60 + now.minute
+        i = bisect_right(self._starts[weekday], minute) - 1
+        if i >= 0 and minute < self._slots[weekday][i][1]:
+            return self._slots[weekday][i][0]
+        return None
+
+    def format(self):
+        lines = []
+        for weekday, day in enumerate(WEEKDAYS):
+            lessons = [f"{lesson_button(lesson)} {format_minutes(start)}–{format_minutes(end)}"
+                       for row_day, lesson, start, end in self.rows if row_day == weekday]
+            if lessons:
+                lines.append(f"{day.capitalize()}: " + ", ".join(lessons))
+        return "\n".join(lines)
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import secrets
+import signal
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+logger = logging.getLogger(__name__)
+
+
+# обработчик вебхука, который при остановке дожидается обработки уже принятых апдейтов.
+# новые к этому моменту не приходят: aiohttp закрывает сокет до on_shutdown
+class DrainingRequestHandler(SimpleRequestHandler):
+    def __init__(self, *args, drain_timeout=30.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.drain_timeout = drain_timeout
+
+    async def drain(self, app=None):
+        pending = set(self._background_feed_update_tasks)
+        if not pending:
+            return
+        logger.info("Waiting for %d updates in progress", len(pending))
+        _, not_done = await asyncio.wait(pending, timeout=self.drain_timeout)
+        if not_done:
+            logger.warning("%d updates were not finished in %.0f s", len(not_done), self.drain_timeout)
+
+
+def create_webhook_app(dp, bot, path, secret_token=None, drain_timeout=30.0):
+    app = web.Application()
+    handler = DrainingRequestHandler(dispatcher=dp, bot=bot, secret_token=secret_token,
+                                     drain_timeout=drain_timeout)
+    # порядок остановки: дождаться апдейтов --> закрыть сессию бота --> shutdown диспетчера
+    app.on_shutdown.append(handler.drain)
+    handler.register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp, bot, *, base_url, path="/webhook", host="0.0.0.0", port=8080, secret_token=None):
+    # секрет нужен только Telegram и нам, поэтому без настройки генерируется при запуске
+    secret_token = secret_token or secrets.token_urlsafe(32)
+    app = create_webhook_app(dp, bot, path, secret_token)
+
+    async def set_webhook(app):
+        await bot.set_webhook(
+            url=base_url.rstrip("/") + path,
+            secret_token=secret_token,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+
+    app.on_startup.append(set_webhook)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info("Webhook server is listening on %s:%d%s", host, port, path)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()